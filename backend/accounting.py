@@ -0,0 +1,351 @@
+from fastapi import APIRouter, HTTPException, Query
+from pathlib import Path
+from typing import Optional
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from database import get_db
+from schemas import JobResources, ResourceProfile, ResourceSummary
+
+router = APIRouter()
+
+# How often the processes of running jobs are sampled. A process that exits between
+# samples loses its last interval, so the figures are slight underestimates
+SAMPLE_SECONDS = 0.5
+
+# Process accounting reads /proc (Linux); elsewhere only wall time is recorded
+PROC_DIR = Path("/proc")
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+MB = 1024 * 1024
+
+
+def read_process(pid: int) -> Optional[dict]:
+    """Parent, process group, start time, CPU seconds and RSS bytes of a process, from /proc."""
+    try:
+        stat = (PROC_DIR / str(pid) / "stat").read_text()
+    except OSError:
+        return None
+    # The command name may contain spaces; the fields after it don't
+    fields = stat[stat.rfind(")") + 2:].split()
+    return {
+        "ppid": int(fields[1]),
+        "pgid": int(fields[2]),
+        "started": int(fields[19]),
+        "cpu": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "rss": int(fields[21]) * PAGE_SIZE,
+    }
+
+
+def written_bytes(pid: int) -> int:
+    """Bytes the process has caused to be written to storage."""
+    try:
+        with open(PROC_DIR / str(pid) / "io") as f:
+            for line in f:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def command_line(pid: int) -> str:
+    try:
+        return (PROC_DIR / str(pid) / "cmdline").read_bytes().replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        return ""
+
+
+_gpu_indexes: Optional[dict[str, int]] = None
+
+
+def gpu_memory() -> dict[int, dict[int, int]]:
+    """VRAM bytes used by each GPU process, by PID and GPU index, via nvidia-smi."""
+    global _gpu_indexes
+    if shutil.which("nvidia-smi") is None:
+        return {}
+    try:
+        if _gpu_indexes is None:
+            result = subprocess.run(
+                ["nvidia-smi", "--query-gpu=index,uuid", "--format=csv,noheader"],
+                capture_output=True, text=True, timeout=10
+            )
+            _gpu_indexes = {
+                uuid.strip(): int(index)
+                for index, uuid in (line.split(",") for line in result.stdout.strip().splitlines())
+            }
+        result = subprocess.run(
+            ["nvidia-smi", "--query-compute-apps=pid,gpu_uuid,used_memory", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=10
+        )
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return {}
+
+    usage: dict[int, dict[int, int]] = {}
+    for line in result.stdout.strip().splitlines():
+        try:
+            pid, uuid, used = (part.strip() for part in line.split(","))
+            device = _gpu_indexes[uuid]
+            usage.setdefault(int(pid), {})[device] = int(used) * MB
+        except (KeyError, ValueError):
+            continue
+    return usage
+
+
+class ResourceMeter:
+    """
+    Resource use of one job's processes.
+
+    A job owns its generate.sh process groups (added as they start) and
+    any child of this server process whose command line names one of the
+    job's directories: the ffmpeg runs of the encoding stage. CPU seconds
+    and bytes written are totalled over every process seen; RSS and VRAM
+    are peaks of the sum over the job's processes at one sample.
+    """
+
+    def __init__(self, job_id: str, profile: dict, remote: bool, directories: list[Path]):
+        self.job_id = job_id
+        self.profile = profile
+        self.remote = remote
+        self.markers = [str(directory) for directory in directories]
+        self.groups: set[int] = set()
+        self.started = time.monotonic()
+        self.samples = 0
+        self.peak_rss = 0
+        self.peak_vram: dict[int, int] = {}
+        # Latest totals per process, keyed by (pid, start time) so a reused PID isn't merged
+        self._cpu: dict[tuple[int, int], float] = {}
+        self._written: dict[tuple[int, int], int] = {}
+
+    def add_group(self, pgid: int) -> None:
+        """Account a generate.sh run (started with start_new_session=True) to this job."""
+        self.groups.add(pgid)
+
+    def owns(self, pid: int, process: dict, command: Optional[str]) -> bool:
+        if process["pgid"] in self.groups:
+            return True
+        return command is not None and any(marker in command for marker in self.markers)
+
+    def update(self, processes: dict[int, dict], vram: dict[int, dict[int, int]]) -> None:
+        rss = 0
+        devices: dict[int, int] = {}
+        for pid, process in processes.items():
+            key = (pid, process["started"])
+            self._cpu[key] = process["cpu"]
+            self._written[key] = max(self._written.get(key, 0), process["written"])
+            rss += process["rss"]
+            for device, used in vram.get(pid, {}).items():
+                devices[device] = devices.get(device, 0) + used
+        self.samples += 1
+        self.peak_rss = max(self.peak_rss, rss)
+        for device, used in devices.items():
+            self.peak_vram[device] = max(self.peak_vram.get(device, 0), used)
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(self._cpu.values())
+
+    @property
+    def written_bytes(self) -> int:
+        return sum(self._written.values())
+
+
+class ResourceSampler:
+    """
+    Samples the processes of every running job from one background thread.
+
+    A thread rather than a task, so sampling carries on while the event
+    loop is blocked in a synchronous ffmpeg call. It runs only while some
+    job is being metered.
+    """
+
+    def __init__(self):
+        self._meters: set[ResourceMeter] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, meter: ResourceMeter) -> None:
+        with self._lock:
+            self._meters.add(meter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+                self._thread.start()
+
+    def unwatch(self, meter: ResourceMeter) -> None:
+        with self._lock:
+            self._meters.discard(meter)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                meters = list(self._meters)
+                if not meters:
+                    self._thread = None
+                    return
+                try:
+                    self.sample(meters)
+                except Exception:
+                    pass  # A missed sample only makes the figures coarser
+            time.sleep(SAMPLE_SECONDS)
+
+    def sample(self, meters: list[ResourceMeter]) -> None:
+        if not PROC_DIR.exists():
+            return
+        server_pid = os.getpid()
+        processes = {}
+        for entry in os.listdir(PROC_DIR):
+            if entry.isdigit():
+                process = read_process(int(entry))
+                if process is not None:
+                    processes[int(entry)] = process
+
+        # Only this server's own children can be encoding-stage processes
+        commands = {
+            pid: command_line(pid) for pid, process in processes.items() if process["ppid"] == server_pid
+        }
+        owned = {}
+        for meter in meters:
+            owned[meter] = {
+                pid: process for pid, process in processes.items()
+                if meter.owns(pid, process, commands.get(pid))
+            }
+        for pid in {pid for members in owned.values() for pid in members}:
+            processes[pid]["written"] = written_bytes(pid)
+
+        # nvidia-smi is only worth a call while generate.sh is running
+        vram = gpu_memory() if any(meter.groups and owned[meter] for meter in meters) else {}
+        for meter in meters:
+            meter.update(owned[meter], vram)
+
+
+sampler = ResourceSampler()
+
+
+async def start_metering(job_id: str, profile: dict, remote: bool, directories: list[Path]) -> ResourceMeter:
+    """Begin sampling a job's processes."""
+    meter = ResourceMeter(job_id, profile, remote, directories)
+    # Waits out a sample in progress, so off the event loop
+    await asyncio.to_thread(sampler.watch, meter)
+    return meter
+
+
+async def record_usage(meter: ResourceMeter, status: str) -> None:
+    """Stop sampling a job and store what it used."""
+    await asyncio.to_thread(sampler.unwatch, meter)
+    sampled = meter.samples > 0
+    async with get_db() as db:
+        await db.execute("""
+            INSERT OR REPLACE INTO job_resources (
+                job_id, model, stem_type, flags, takes, remote, status, wall_seconds,
+                cpu_seconds, peak_rss_bytes, peak_vram_bytes, vram_by_device, written_bytes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            meter.job_id,
+            meter.profile["model"],
+            meter.profile["stem_type"],
+            json.dumps(meter.profile["flags"]),
+            meter.profile["takes"],
+            int(meter.remote),
+            status,
+            time.monotonic() - meter.started,
+            meter.cpu_seconds if sampled else None,
+            meter.peak_rss if sampled else None,
+            max(meter.peak_vram.values(), default=None),
+            json.dumps({str(device): used for device, used in sorted(meter.peak_vram.items())}),
+            meter.written_bytes if sampled else None
+        ))
+        await db.commit()
+
+
+def to_mb(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value / MB, 1)
+
+
+def rounded(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 1)
+
+
+@router.get("/generate/resources", response_model=ResourceSummary)
+async def get_resource_summary(
+    model: Optional[str] = Query(None, description="Only this model"),
+    days: Optional[int] = Query(None, ge=1, description="Only jobs recorded in the last N days")
+):
+    """Resource use of finished jobs, aggregated per model and flag combination (and take count)."""
+    conditions, params = [], []
+    if model is not None:
+        conditions.append("model = ?")
+        params.append(model)
+    if days is not None:
+        conditions.append("recorded_at >= datetime('now', ?)")
+        params.append(f"-{days} days")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    async with get_db() as db:
+        cursor = await db.execute(f"""
+            SELECT model, flags, takes, remote,
+                COUNT(*) AS jobs,
+                SUM(status != 'done') AS unfinished,
+                AVG(wall_seconds) AS avg_wall_seconds,
+                AVG(cpu_seconds) AS avg_cpu_seconds,
+                MAX(cpu_seconds) AS max_cpu_seconds,
+                AVG(peak_rss_bytes) AS avg_peak_rss,
+                MAX(peak_rss_bytes) AS max_peak_rss,
+                AVG(peak_vram_bytes) AS avg_peak_vram,
+                MAX(peak_vram_bytes) AS max_peak_vram,
+                AVG(written_bytes) AS avg_written
+            FROM job_resources {where}
+            GROUP BY model, flags, takes, remote
+            ORDER BY jobs DESC
+        """, params)
+        rows = await cursor.fetchall()
+
+    return ResourceSummary(profiles=[
+        ResourceProfile(
+            model=row["model"],
+            flags=json.loads(row["flags"]),
+            takes=row["takes"],
+            remote=bool(row["remote"]),
+            jobs=row["jobs"],
+            unfinished=row["unfinished"],
+            avg_wall_seconds=rounded(row["avg_wall_seconds"]),
+            avg_cpu_seconds=rounded(row["avg_cpu_seconds"]),
+            max_cpu_seconds=rounded(row["max_cpu_seconds"]),
+            avg_peak_rss_mb=to_mb(row["avg_peak_rss"]),
+            max_peak_rss_mb=to_mb(row["max_peak_rss"]),
+            avg_peak_vram_mb=to_mb(row["avg_peak_vram"]),
+            max_peak_vram_mb=to_mb(row["max_peak_vram"]),
+            avg_written_mb=to_mb(row["avg_written"])
+        )
+        for row in rows
+    ])
+
+
+@router.get("/generate/{job_id}/resources", response_model=JobResources)
+async def get_job_resources(job_id: str):
+    """What a finished job used."""
+    async with get_db() as db:
+        cursor = await db.execute("SELECT * FROM job_resources WHERE job_id = ?", (job_id,))
+        row = await cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="No resource record for this job (not finished, or unknown)")
+
+    return JobResources(
+        job_id=row["job_id"],
+        model=row["model"],
+        stem_type=row["stem_type"],
+        flags=json.loads(row["flags"]),
+        takes=row["takes"],
+        remote=bool(row["remote"]),
+        status=row["status"],
+        wall_seconds=round(row["wall_seconds"], 1),
+        cpu_seconds=rounded(row["cpu_seconds"]),
+        peak_rss_mb=to_mb(row["peak_rss_bytes"]),
+        peak_vram_mb={device: to_mb(used) for device, used in json.loads(row["vram_by_device"]).items()},
+        written_mb=to_mb(row["written_bytes"])
+    )
@@ -0,0 +1,134 @@
+from pathlib import Path
+import subprocess
+
+import numpy as np
+
+# SongGeneration renders stereo audio at 48 kHz
+SAMPLE_RATE = 48000
+CHANNELS = 2
+
+# Mixdown ceiling and the level above which the limiter starts to bend peaks
+CEILING_DB = -1.0
+LIMITER_THRESHOLD_DB = -3.0
+
+# Most a mix is turned down to bring its peaks under the limiter threshold before limiting
+MAX_HEADROOM_DB = 6.0
+
+
+def db_to_gain(db: float) -> float:
+    """Convert decibels to a linear gain factor."""
+    return 10.0 ** (db / 20.0)
+
+
+def decode_audio(path: Path, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Decode any ffmpeg-readable file to float32 samples shaped (frames, channels)."""
+    result = subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-i", str(path),
+            "-f", "f32le", "-ac", str(CHANNELS), "-ar", str(sample_rate),
+            "pipe:1"
+        ],
+        capture_output=True,
+        timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not decode {path.name}: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, CHANNELS)
+
+
+def encode_mp3(samples: np.ndarray, output_path: Path, sample_rate: int = SAMPLE_RATE) -> bool:
+    """Encode float32 (frames, channels) samples to MP3."""
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg", "-y", "-v", "error",
+                "-f", "f32le", "-ac", str(samples.shape[1]), "-ar", str(sample_rate),
+                "-i", "pipe:0",
+                "-codec:a", "libmp3lame", "-qscale:a", "2",
+                str(output_path)
+            ],
+            input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+            capture_output=True,
+            timeout=120
+        )
+        return result.returncode == 0
+    except Exception:
+        return False
+
+
+def encode_wav(samples: np.ndarray, output_path: Path, sample_rate: int = SAMPLE_RATE) -> bool:
+    """Write float32 (frames, channels) samples as a 24-bit WAV."""
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg", "-y", "-v", "error",
+                "-f", "f32le", "-ac", str(samples.shape[1]), "-ar", str(sample_rate),
+                "-i", "pipe:0",
+                "-codec:a", "pcm_s24le",
+                str(output_path)
+            ],
+            input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+            capture_output=True,
+            timeout=120
+        )
+        return result.returncode == 0
+    except Exception:
+        return False
+
+
+def limit(samples: np.ndarray, ceiling_db: float = CEILING_DB, threshold_db: float = LIMITER_THRESHOLD_DB) -> np.ndarray:
+    """
+    Soft-knee peak limiter.
+
+    Samples below the threshold pass untouched; above it, the excess is
+    squashed with tanh so the output approaches but never exceeds the
+    ceiling.
+    """
+    ceiling = db_to_gain(ceiling_db)
+    threshold = db_to_gain(threshold_db)
+    knee = ceiling - threshold
+
+    magnitude = np.abs(samples)
+    over = magnitude > threshold
+    squashed = threshold + knee * np.tanh((magnitude - threshold) / knee)
+    return np.where(over, np.sign(samples) * squashed, samples).astype(np.float32)
+
+
+def headroom_gain(mix: np.ndarray) -> float:
+    """
+    Gain that brings the peaks of a mix down to the limiter threshold.
+
+    Never boosts, and never cuts by more than MAX_HEADROOM_DB: whatever is
+    still over the threshold after that is left to limit().
+    """
+    peak = float(np.abs(mix).max()) if mix.size else 0.0
+    threshold = db_to_gain(LIMITER_THRESHOLD_DB)
+    if peak <= threshold:
+        return 1.0
+    return max(threshold / peak, db_to_gain(-MAX_HEADROOM_DB))
+
+
+def sum_stems(stems: list[np.ndarray]) -> np.ndarray:
+    """Sum stems of possibly different lengths, without any gain or limiting."""
+    frames = max(len(stem) for stem in stems)
+    mix = np.zeros((frames, CHANNELS), dtype=np.float32)
+    for stem in stems:
+        mix[:len(stem)] += stem
+    return mix
+
+
+def mixdown(stems: list[np.ndarray]) -> np.ndarray:
+    """Sum stems with enough headroom for the result, then limit it below the ceiling."""
+    mix = sum_stems(stems)
+    # The sum is linear, so this is the same gain applied to every stem before summing
+    mix *= headroom_gain(mix)
+    return limit(mix)
+
+
+def derive_full_mix(vocal_path: Path, bgm_path: Path, output_path: Path) -> bool:
+    """Render the full mix of a song from its vocal and accompaniment stems."""
+    try:
+        mix = mixdown([decode_audio(vocal_path), decode_audio(bgm_path)])
+    except Exception:
+        return False
+    return encode_mp3(mix, output_path)
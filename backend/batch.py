@@ -0,0 +1,236 @@
+from pathlib import Path
+from typing import Optional
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+# Prompt fields forwarded to /api/generate as form fields
+FORM_FIELDS = ("lyrics", "description", "stem_type", "title", "auto_style", "priority", "owner", "model", "segmented", "takes")
+
+TERMINAL_EVENTS = ("done", "error", "cancelled")
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    return f"{minutes}m{seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def load_prompts(path: Path) -> list[tuple[str, dict]]:
+    """Read (key, prompt) pairs; the key is the prompt's "id" or its line number."""
+    prompts = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                prompt = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise SystemExit(f"{path}:{line_number}: invalid JSON: {e}")
+            if not prompt.get("lyrics") or not prompt.get("description"):
+                raise SystemExit(f"{path}:{line_number}: lyrics and description are required")
+            prompts.append((str(prompt.get("id", line_number)), prompt))
+    return prompts
+
+
+def load_checkpoint(path: Path) -> dict[str, dict]:
+    """
+    Latest recorded outcome per prompt key.
+
+    A last line cut short by a crash is treated as still in flight: it is
+    dropped from the file so later records start on a line of their own.
+    """
+    outcomes = {}
+    if not path.exists():
+        return outcomes
+    with open(path, "rb") as f:
+        lines = f.readlines()
+
+    offset = 0
+    for line_number, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if line_number < len(lines):
+                    raise SystemExit(f"{path}:{line_number}: corrupt checkpoint record")
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                return outcomes
+            outcomes[record["key"]] = record
+        offset += len(line)
+
+    if lines and not lines[-1].endswith(b"\n"):
+        # Complete but for its newline
+        with open(path, "ab") as f:
+            f.write(b"\n")
+    return outcomes
+
+
+class BatchRun:
+    """Runs prompts through a SongGeneration Studio server, a few at a time."""
+
+    def __init__(
+        self,
+        server: str,
+        prompts: list[tuple[str, dict]],
+        checkpoint: Path,
+        parallel: int,
+        api_key: Optional[str],
+        base_dir: Path
+    ):
+        self.prompts = prompts
+        self.checkpoint = checkpoint
+        self.parallel = parallel
+        self.base_dir = base_dir
+        self.client = httpx.AsyncClient(
+            base_url=server.rstrip("/") + "/api",
+            headers={"X-API-Key": api_key} if api_key else {},
+            timeout=httpx.Timeout(60.0, read=None)
+        )
+        self.total = len(prompts)
+        self.completed = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.song_seconds: list[float] = []
+
+    def record(self, outcome: dict) -> None:
+        # Append and sync per prompt so a crash or power loss loses at most the songs in flight
+        with open(self.checkpoint, "a") as f:
+            f.write(json.dumps(outcome) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def eta(self, remaining: int) -> Optional[float]:
+        if not self.completed:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / self.completed * remaining
+
+    async def generate(self, key: str, prompt: dict) -> dict:
+        """Submit one prompt and follow its progress stream to the end."""
+        data = {field: str(prompt[field]) for field in FORM_FIELDS if prompt.get(field) is not None}
+        data.setdefault("priority", "batch")
+
+        files = None
+        reference = prompt.get("reference_audio")
+        if reference:
+            reference_path = (self.base_dir / reference).expanduser()
+            files = {"reference_audio": (reference_path.name, reference_path.read_bytes())}
+
+        outcome = {"key": key, "status": "error", "job_id": None, "song_id": None, "message": ""}
+        started = time.monotonic()
+        async with self.client.stream("POST", "/generate", data=data, files=files) as response:
+            if response.status_code != 200:
+                body = json.loads(await response.aread() or b"{}")
+                detail = body.get("detail", body)
+                if isinstance(detail, dict):
+                    detail = "; ".join(error["message"] for error in detail.get("errors", [])) or detail.get("message")
+                outcome["message"] = f"HTTP {response.status_code}: {detail}"
+                return outcome
+
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    payload = json.loads(line[5:])
+                    outcome["job_id"] = payload.get("job_id", outcome["job_id"])
+                    if event in TERMINAL_EVENTS:
+                        outcome["status"] = event
+                        outcome["song_id"] = payload.get("song_id")
+                        outcome["message"] = payload.get("message", "")
+                        break
+
+        if outcome["status"] == "error" and not outcome["message"]:
+            outcome["message"] = "Stream ended without a result"
+        outcome["seconds"] = round(time.monotonic() - started, 1)
+        return outcome
+
+    async def worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            try:
+                key, prompt = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                outcome = await self.generate(key, prompt)
+            except (httpx.HTTPError, OSError, json.JSONDecodeError) as e:
+                outcome = {"key": key, "status": "error", "job_id": None, "song_id": None, "message": str(e)}
+            self.record(outcome)
+
+            if outcome["status"] == "done":
+                self.completed += 1
+                self.song_seconds.append(outcome["seconds"])
+            else:
+                self.failed += 1
+
+            finished = self.completed + self.failed
+            eta = self.eta(self.total - finished)
+            detail = outcome["song_id"] if outcome["status"] == "done" else outcome["message"]
+            print(
+                f"[{finished}/{self.total}] {key}: {outcome['status']} {detail}"
+                + (f" | ETA {format_duration(eta)}" if eta is not None else "")
+            )
+
+    async def run(self) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in self.prompts:
+            queue.put_nowait(item)
+        try:
+            await asyncio.gather(*(self.worker(queue) for _ in range(self.parallel)))
+        finally:
+            await self.client.aclose()
+
+    def summary(self, skipped: int) -> str:
+        elapsed = time.monotonic() - self.started
+        lines = [
+            f"Generated {self.completed}, failed {self.failed}, skipped {skipped} (already done)",
+            f"Elapsed {format_duration(elapsed)}",
+        ]
+        if self.completed:
+            per_hour = self.completed / elapsed * 3600
+            average = sum(self.song_seconds) / len(self.song_seconds)
+            lines.append(f"Throughput {per_hour:.1f} songs/hour, {format_duration(average)} per song end to end")
+        if self.failed:
+            lines.append(f"Failures are recorded in {self.checkpoint}; re-run to retry them")
+        return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate songs in bulk from a JSONL file of prompts")
+    parser.add_argument("prompts", type=Path, help="JSONL with lyrics, description and optional generation fields")
+    parser.add_argument("--server", default="http://localhost:8000", help="SongGeneration Studio API base URL")
+    parser.add_argument("--parallel", type=int, default=1, help="Prompts in flight at once")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="Progress file (default: <prompts>.checkpoint.jsonl)")
+    parser.add_argument("--api-key", default=None, help="Sent as X-API-Key for fair-share accounting")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or args.prompts.with_suffix(".checkpoint.jsonl")
+    prompts = load_prompts(args.prompts)
+    done = {key for key, outcome in load_checkpoint(checkpoint).items() if outcome["status"] == "done"}
+    pending = [(key, prompt) for key, prompt in prompts if key not in done]
+
+    skipped = len(prompts) - len(pending)
+    if skipped:
+        print(f"Resuming: {skipped} of {len(prompts)} prompts already done")
+
+    run = BatchRun(
+        args.server, pending, checkpoint, max(1, args.parallel), args.api_key,
+        args.prompts.resolve().parent
+    )
+    try:
+        asyncio.run(run.run())
+    except KeyboardInterrupt:
+        print("Interrupted; re-run the same command to resume")
+    print(run.summary(skipped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from typing import Optional
+import asyncio
+
+from database import get_db
+
+# Only this many of the most recent changes are kept; clients further behind reload the library
+CHANGE_RETENTION = 10000
+
+# Most changes returned per request, and per read on a stream
+CHANGES_PAGE_LIMIT = 500
+
+# An idle change stream sends a keepalive (and re-checks the log) this often
+KEEPALIVE_SECONDS = 15.0
+
+# With several server processes, how often each checks for changes committed by the others
+CHANGE_POLL_SECONDS = 1.0
+
+
+async def record_change(db, song_id: str, op: str) -> int:
+    """
+    Log an insert, update or delete of a song in the caller's transaction.
+
+    Returns the change's sequence number. Call change_feed.publish() after
+    committing so open streams pick it up.
+    """
+    cursor = await db.execute(
+        "INSERT INTO song_changes (song_id, op) VALUES (?, ?)",
+        (song_id, op)
+    )
+    seq = cursor.lastrowid
+    await db.execute("DELETE FROM song_changes WHERE seq <= ?", (seq - CHANGE_RETENTION,))
+    return seq
+
+
+class ChangeFeed:
+    """
+    Wakes library change streams when a song changes.
+
+    Streams read the change log themselves (each with its own field
+    projection); the feed only tells them when there is something new.
+    """
+
+    def __init__(self):
+        self._changed = asyncio.Event()
+
+    def waiter(self) -> asyncio.Event:
+        """Set by the next publish(). Take it before reading the log so no change slips in between."""
+        return self._changed
+
+    def publish(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    @staticmethod
+    async def wait(changed: asyncio.Event, timeout: float) -> bool:
+        """False if nothing changed within `timeout`."""
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+change_feed = ChangeFeed()
+
+
+async def retained_range(db) -> tuple[Optional[int], int]:
+    """Oldest retained and latest sequence numbers of the change log."""
+    cursor = await db.execute("SELECT MIN(seq) AS first, COALESCE(MAX(seq), 0) AS last FROM song_changes")
+    row = await cursor.fetchone()
+    return row["first"], row["last"]
+
+
+def is_stale(since: int, first: Optional[int], last: int) -> bool:
+    """Whether a client at `since` missed pruned changes or comes from a different database."""
+    if since > last:
+        return True
+    return first is not None and since + 1 < first
+
+
+async def follow_changes() -> None:
+    """Background task: wake this process's change streams for changes made by other processes."""
+    last_seq = None
+    while True:
+        async with get_db() as db:
+            _, seq = await retained_range(db)
+        if last_seq is not None and seq != last_seq:
+            change_feed.publish()
+        last_seq = seq
+        await asyncio.sleep(CHANGE_POLL_SECONDS)
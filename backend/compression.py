@@ -0,0 +1,65 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import gzip
+
+# Bodies smaller than this are sent as-is; gzip overhead outweighs the savings
+MINIMUM_SIZE = 1024
+COMPRESS_LEVEL = 5
+
+
+class JSONCompressionMiddleware:
+    """
+    Gzip JSON responses for clients that accept it.
+
+    Unlike Starlette's GZipMiddleware this leaves every other content type
+    alone: SSE streams must reach the client unbuffered, and audio is
+    already compressed.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MINIMUM_SIZE, compresslevel: int = COMPRESS_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or "gzip" not in Headers(scope=scope).get("accept-encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        start: Message = {}
+        chunks: list[bytes] = []
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    not headers.get("content-type", "").startswith("application/json")
+                    or "content-encoding" in headers
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(scope=start)
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                body = gzip.compress(body, compresslevel=self.compresslevel)
+                headers["Content-Encoding"] = "gzip"
+                headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
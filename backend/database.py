@@ -4,12 +4,28 @@ from contextlib import asynccontextmanager
 
 DATABASE_PATH = Path(__file__).parent.parent / "data" / "library.db"
 
+# Several server processes share the database; writers wait this long for each other
+BUSY_TIMEOUT_SECONDS = 10.0
+
+
+async def add_column(db, table: str, column: str, definition: str) -> None:
+    """Add a column to a table created by an older version, if it is missing."""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in await cursor.fetchall()}:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
 
 async def init_db():
     """Initialize the database with required tables."""
     DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
-    async with aiosqlite.connect(DATABASE_PATH) as db:
+    async with aiosqlite.connect(DATABASE_PATH, timeout=BUSY_TIMEOUT_SECONDS) as db:
+        # Readers never block the writer, so any worker process can serve requests during a write
+        await db.execute("PRAGMA journal_mode=WAL")
+
+        # Server processes start together; take the write lock so only one migrates at a time
+        await db.execute("BEGIN IMMEDIATE")
+
         # Songs table
         await db.execute("""
             CREATE TABLE IF NOT EXISTS songs (
@@ -27,6 +43,106 @@ async def init_db():
                 model_version TEXT
             )
         """)
+        # Regenerated versions point at the song's first version and are numbered from it
+        await add_column(db, "songs", "parent_id", "TEXT")
+        await add_column(db, "songs", "version", "INTEGER NOT NULL DEFAULT 1")
+        # Takes generated together from one prompt share a group: the first take's id
+        await add_column(db, "songs", "take_group", "TEXT")
+        await add_column(db, "songs", "take", "INTEGER")
+
+        # Jobs table (latest status of each generation job)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                song_id TEXT,
+                status TEXT NOT NULL,
+                message TEXT,
+                owner TEXT,
+                priority TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # What to run (set when a request submits the job for the executor to pick up),
+        # cancel requests from other processes, and when a client last followed the job
+        await add_column(db, "jobs", "spec", "TEXT")
+        await add_column(db, "jobs", "cancel_requested", "INTEGER NOT NULL DEFAULT 0")
+        await add_column(db, "jobs", "watched_at", "DATETIME")
+
+        # SSE events of each job, so any server process can stream or re-attach to it
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                chunk TEXT NOT NULL,
+                terminal INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (job_id, seq)
+            )
+        """)
+
+        # Snapshots of in-memory executor state (queue, GPU placements) for the other processes
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS runtime_state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Feature vectors: which row of the vector file belongs to which song
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS song_features (
+                song_id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL UNIQUE,
+                version INTEGER NOT NULL,
+                extracted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Generation run times, for predicting how long new jobs will take
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS job_timings (
+                job_id TEXT PRIMARY KEY,
+                model TEXT,
+                stem_type TEXT,
+                flags TEXT,
+                lyrics_length INTEGER,
+                has_reference INTEGER,
+                seconds REAL NOT NULL,
+                recorded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await add_column(db, "job_timings", "takes", "INTEGER NOT NULL DEFAULT 1")
+
+        # What each finished job's processes used (see accounting.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS job_resources (
+                job_id TEXT PRIMARY KEY,
+                model TEXT,
+                stem_type TEXT,
+                flags TEXT,
+                remote INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                wall_seconds REAL NOT NULL,
+                cpu_seconds REAL,
+                peak_rss_bytes INTEGER,
+                peak_vram_bytes INTEGER,
+                vram_by_device TEXT,
+                written_bytes INTEGER,
+                recorded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await add_column(db, "job_resources", "takes", "INTEGER NOT NULL DEFAULT 1")
+
+        # Library change log; seq only ever increases, so clients can ask for "changes since N"
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS song_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                song_id TEXT NOT NULL,
+                op TEXT NOT NULL,
+                changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
 
         # Settings table
         await db.execute("""
@@ -49,6 +165,18 @@ async def init_db():
         await db.execute("""
             INSERT OR IGNORE INTO settings (key, value) VALUES ('current_model', '')
         """)
+        await db.execute("""
+            INSERT OR IGNORE INTO settings (key, value) VALUES ('owner_weights', '{}')
+        """)
+        await db.execute("""
+            INSERT OR IGNORE INTO settings (key, value) VALUES ('always_separate', 'false')
+        """)
+        await db.execute("""
+            INSERT OR IGNORE INTO settings (key, value) VALUES ('execution_mode', 'local')
+        """)
+        await db.execute("""
+            INSERT OR IGNORE INTO settings (key, value) VALUES ('scheduling_policy', 'fair')
+        """)
 
         await db.commit()
 
@@ -56,7 +184,11 @@ async def init_db():
 @asynccontextmanager
 async def get_db():
     """Get a database connection."""
-    db = await aiosqlite.connect(DATABASE_PATH)
+    connection = aiosqlite.connect(DATABASE_PATH, timeout=BUSY_TIMEOUT_SECONDS)
+    # A stream cancelled at shutdown can leave its connection unclosed; its
+    # thread must not keep the process alive (and generate.sh orphaned) forever
+    connection.daemon = True
+    db = await connection
     db.row_factory = aiosqlite.Row
     try:
         yield db
@@ -0,0 +1,145 @@
+from typing import Optional
+import json
+
+import numpy as np
+
+from database import get_db
+
+# Used until enough runs have been recorded to fit a model ("3-6 minutes")
+DEFAULT_SECONDS = 270.0
+MIN_SAMPLES = 5
+
+# Only the most recent runs are fitted, so the estimate follows hardware and setting changes
+HISTORY_LIMIT = 500
+
+# Ridge penalty; keeps the fit stable when a model or flag has only been seen a few times
+RIDGE = 1.0
+
+# No prediction goes below this
+MIN_SECONDS = 10.0
+
+
+def job_profile(
+    model: Optional[str],
+    stem_type: str,
+    flags: list[str],
+    lyrics: str,
+    has_reference: bool,
+    takes: int = 1
+) -> dict:
+    """The properties of a job that its run time is predicted from."""
+    return {
+        "model": model or "",
+        "stem_type": stem_type,
+        "flags": sorted(flags),
+        "lyrics_length": len(lyrics),
+        "has_reference": has_reference,
+        "takes": takes,
+    }
+
+
+class RuntimeEstimator:
+    """
+    Predicts how long generate.sh will run for a job.
+
+    A ridge regression over one-hot model, stem type and flags, lyric length
+    (per 1000 characters), whether a reference clip is used and the number
+    of extra takes in the run, fitted on recent recorded runs.
+    """
+
+    def __init__(self):
+        self._history: list[tuple[dict, float]] = []
+        self._columns: list[str] = []
+        self._coefficients: Optional[np.ndarray] = None
+
+    def _features(self, profile: dict) -> np.ndarray:
+        active = {
+            f"model={profile['model']}",
+            f"stem_type={profile['stem_type']}",
+            *(f"flag={flag}" for flag in profile["flags"]),
+        }
+        row = [
+            1.0,
+            profile["lyrics_length"] / 1000.0,
+            float(profile["has_reference"]),
+            float(profile["takes"] - 1),
+        ]
+        row += [1.0 if column in active else 0.0 for column in self._columns]
+        return np.array(row)
+
+    def fit(self) -> None:
+        history = self._history[-HISTORY_LIMIT:]
+        if len(history) < MIN_SAMPLES:
+            self._coefficients = None
+            return
+
+        columns = set()
+        for profile, _ in history:
+            columns.add(f"model={profile['model']}")
+            columns.add(f"stem_type={profile['stem_type']}")
+            columns.update(f"flag={flag}" for flag in profile["flags"])
+        self._columns = sorted(columns)
+
+        X = np.stack([self._features(profile) for profile, _ in history])
+        y = np.array([seconds for _, seconds in history])
+        penalty = RIDGE * np.eye(X.shape[1])
+        penalty[0, 0] = 0.0  # Don't shrink the intercept
+        self._coefficients = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+
+    def predict(self, profile: dict) -> float:
+        """Expected generation time in seconds."""
+        if self._coefficients is None:
+            if self._history:
+                return float(np.median([seconds for _, seconds in self._history]))
+            return DEFAULT_SECONDS
+        return max(MIN_SECONDS, float(self._features(profile) @ self._coefficients))
+
+    def add(self, profile: dict, seconds: float) -> None:
+        self._history.append((profile, seconds))
+        del self._history[:-HISTORY_LIMIT]
+        self.fit()
+
+    async def load(self) -> None:
+        """Fit on the runs recorded in the database."""
+        async with get_db() as db:
+            cursor = await db.execute("""
+                SELECT model, stem_type, flags, lyrics_length, has_reference, takes, seconds
+                FROM job_timings ORDER BY recorded_at DESC LIMIT ?
+            """, (HISTORY_LIMIT,))
+            rows = await cursor.fetchall()
+
+        self._history = [
+            ({
+                "model": row["model"],
+                "stem_type": row["stem_type"],
+                "flags": json.loads(row["flags"]),
+                "lyrics_length": row["lyrics_length"],
+                "has_reference": bool(row["has_reference"]),
+                "takes": row["takes"],
+            }, row["seconds"])
+            for row in reversed(rows)
+        ]
+        self.fit()
+
+    async def record(self, job_id: str, profile: dict, seconds: float) -> None:
+        """Store a finished run and refit."""
+        async with get_db() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO job_timings (
+                    job_id, model, stem_type, flags, lyrics_length, has_reference, takes, seconds
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                job_id,
+                profile["model"],
+                profile["stem_type"],
+                json.dumps(profile["flags"]),
+                profile["lyrics_length"],
+                int(profile["has_reference"]),
+                profile["takes"],
+                seconds
+            ))
+            await db.commit()
+        self.add(profile, seconds)
+
+
+estimator = RuntimeEstimator()
@@ -0,0 +1,188 @@
+from typing import AsyncGenerator, Awaitable, Callable, Optional
+import asyncio
+import os
+import socket
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: only single-process serving is supported
+    fcntl = None
+
+from database import get_db, DATABASE_PATH
+from job_events import EventLog, last_event_seq, prune_events
+import jobs
+
+# Server processes sharing this database (set by serve.py for every worker it starts)
+WEB_WORKERS = int(os.environ.get("SONGGEN_WEB_WORKERS", "1"))
+
+# Held by the process that runs generation jobs
+LOCK_PATH = DATABASE_PATH.parent / "executor.lock"
+
+# Other processes send a datagram here after submitting or cancelling a job, waking the executor
+WAKE_PATH = DATABASE_PATH.parent / "executor.sock"
+
+# How often the executor checks its running jobs for cancel requests and detached clients
+POLL_SECONDS = 0.5
+
+# How often an idle executor looks for submitted jobs anyway, in case a wake-up was lost
+IDLE_POLL_SECONDS = 5.0
+
+# How often a process without the lock tries to take over
+TAKEOVER_SECONDS = 2.0
+
+# A job no client has followed for this long is cancelled, as when its stream is dropped
+DETACH_GRACE_SECONDS = 30.0
+
+# How often queue and GPU snapshots are published for the other processes
+SNAPSHOT_SECONDS = 2.0
+
+PRUNE_SECONDS = 600.0
+
+Runner = Callable[[dict], AsyncGenerator[str, None]]
+
+
+async def save_snapshot(key: str, value: str) -> None:
+    async with get_db() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO runtime_state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            (key, value)
+        )
+        await db.commit()
+
+
+async def load_snapshot(key: str) -> Optional[str]:
+    async with get_db() as db:
+        cursor = await db.execute("SELECT value FROM runtime_state WHERE key = ?", (key,))
+        row = await cursor.fetchone()
+    return row["value"] if row else None
+
+
+class Executor:
+    """
+    Runs generation jobs for every server process.
+
+    Any process can accept a generation request: it records the job in the
+    jobs table and follows its events from job_events. Exactly one process
+    (whichever holds an exclusive lock on LOCK_PATH) claims submitted jobs
+    and runs them, so the GPU scheduler, VRAM placements and generate.sh
+    processes all live in one place. If that process exits, another one
+    takes the lock over and resumes the jobs it left unfinished.
+    """
+
+    def __init__(self):
+        self.is_leader = False
+        self._lock_file = None
+        self._wake = asyncio.Event()
+        self._wake_socket: Optional[socket.socket] = None
+        self._running: dict[str, asyncio.Task] = {}
+
+    def wake(self) -> None:
+        """Look for new work now rather than at the next poll, in whichever process runs jobs."""
+        if self.is_leader:
+            self._wake.set()
+        elif fcntl is not None:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                    sock.setblocking(False)
+                    sock.sendto(b"1", str(WAKE_PATH))
+            except OSError:
+                pass  # No executor listening yet (or its queue is full); it polls anyway
+
+    def _listen_for_wakes(self) -> None:
+        if fcntl is None:
+            return
+        WAKE_PATH.unlink(missing_ok=True)  # Left behind by the previous executor
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(str(WAKE_PATH))
+        except OSError:
+            sock.close()
+            return  # e.g. path too long for a socket: fall back to IDLE_POLL_SECONDS
+        sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_wake_datagram)
+        self._wake_socket = sock
+
+    def _on_wake_datagram(self) -> None:
+        try:
+            while self._wake_socket.recv(64):
+                pass
+        except OSError:
+            pass
+        self._wake.set()
+
+    def try_lead(self) -> bool:
+        if fcntl is None:
+            return True
+        LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+        lock_file = open(LOCK_PATH, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def run(
+        self,
+        runner: Runner,
+        on_lead: Callable[[], Awaitable[None]],
+        on_tick: Callable[[], Awaitable[None]]
+    ) -> None:
+        """Background task: wait for the lock, then claim and run jobs until shut down."""
+        while not self.try_lead():
+            await asyncio.sleep(TAKEOVER_SECONDS)
+        self.is_leader = True
+        self._listen_for_wakes()
+        await on_lead()
+
+        # Jobs the previous executor was running when it stopped (restart, reload, crash)
+        await jobs.resubmit_interrupted_jobs()
+
+        last_tick = last_prune = 0.0
+        try:
+            while True:
+                for row in await jobs.claim_submitted_jobs():
+                    task = asyncio.create_task(self._execute(runner, dict(row)))
+                    self._running[row["id"]] = task
+                    task.add_done_callback(lambda _, job_id=row["id"]: self._running.pop(job_id, None))
+
+                for job_id, reason in (await jobs.jobs_to_stop(list(self._running), DETACH_GRACE_SECONDS)).items():
+                    asyncio.ensure_future(jobs.cancel_job(job_id, reason))
+
+                now = time.monotonic()
+                if now - last_tick >= SNAPSHOT_SECONDS:
+                    last_tick = now
+                    await on_tick()
+                if now - last_prune >= PRUNE_SECONDS:
+                    last_prune = now
+                    await prune_events()
+
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(), POLL_SECONDS if self._running else IDLE_POLL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        finally:
+            for task in self._running.values():
+                task.cancel()
+            if self._wake_socket is not None:
+                asyncio.get_running_loop().remove_reader(self._wake_socket.fileno())
+                self._wake_socket.close()
+                self._wake_socket = None
+                WAKE_PATH.unlink(missing_ok=True)
+
+    async def _execute(self, runner: Runner, row: dict) -> None:
+        # A resumed job continues its event sequence, so followers can re-attach across the restart
+        log = EventLog(row["id"], await last_event_seq(row["id"]))
+        try:
+            async for chunk in runner(row):
+                log.append(chunk)
+        finally:
+            await log.close()
+
+
+executor = Executor()
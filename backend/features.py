@@ -0,0 +1,317 @@
+from fastapi import APIRouter, HTTPException, Query
+from pathlib import Path
+from typing import Optional
+import asyncio
+import logging
+import subprocess
+
+import numpy as np
+
+from database import get_db
+from audio import decode_audio
+from schemas import SimilarSong, SimilarSongs, DuplicatePair, DuplicateList
+from storage import storage
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Paths
+BASE_DIR = Path(__file__).parent.parent
+FEATURES_DIR = BASE_DIR / "data" / "features"
+VECTORS_PATH = FEATURES_DIR / "vectors.f32"
+
+# Bump when the extraction changes; older vectors are re-extracted by the backfill
+FEATURE_VERSION = 1
+
+# Analysis parameters
+ANALYSIS_SAMPLE_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 40
+N_MFCC = 20
+MIN_PITCH_HZ = 55.0
+MAX_PITCH_HZ = 5000.0
+
+# Chroma mean/std + MFCC mean/std
+FEATURE_DIM = 2 * 12 + 2 * N_MFCC
+
+# Rows the vector file grows by at a time
+GROW_ROWS = 256
+
+# Rows compared at once when scanning for duplicates
+DUPLICATE_BLOCK_ROWS = 1024
+
+BACKFILL_BATCH = 10
+
+
+def mel_filterbank(sample_rate: int = ANALYSIS_SAMPLE_RATE, n_fft: int = N_FFT, n_mels: int = N_MELS) -> np.ndarray:
+    """Triangular mel filters shaped (n_mels, n_fft // 2 + 1)."""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10.0 ** (mel / 2595.0) - 1.0)
+
+    bin_hz = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    edges = mel_to_hz(np.linspace(0.0, hz_to_mel(sample_rate / 2.0), n_mels + 2))
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bin_hz - lower) / (center - lower)
+    falling = (upper - bin_hz) / (upper - center)
+    return np.maximum(0.0, np.minimum(rising, falling)).astype(np.float32)
+
+
+def chroma_filterbank(sample_rate: int = ANALYSIS_SAMPLE_RATE, n_fft: int = N_FFT) -> np.ndarray:
+    """Map FFT bins to the 12 pitch classes, shaped (12, n_fft // 2 + 1)."""
+    bin_hz = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+    in_range = (bin_hz >= MIN_PITCH_HZ) & (bin_hz <= MAX_PITCH_HZ)
+    midi = 69.0 + 12.0 * np.log2(np.where(in_range, bin_hz, 440.0) / 440.0)
+    pitch_class = np.round(midi).astype(int) % 12
+    bank = np.zeros((12, len(bin_hz)), dtype=np.float32)
+    bank[pitch_class[in_range], np.nonzero(in_range)[0]] = 1.0
+    return bank
+
+
+def dct_matrix(n_in: int = N_MELS, n_out: int = N_MFCC) -> np.ndarray:
+    """Orthonormal DCT-II rows 1..n_out; row 0 (overall loudness) is skipped."""
+    k = np.arange(1, n_out + 1)[:, None]
+    n = np.arange(n_in)[None, :]
+    return (np.cos(np.pi * k * (2 * n + 1) / (2 * n_in)) * np.sqrt(2.0 / n_in)).astype(np.float32)
+
+
+MEL_BANK = mel_filterbank()
+CHROMA_BANK = chroma_filterbank()
+DCT = dct_matrix()
+WINDOW = np.hanning(N_FFT).astype(np.float32)
+
+
+def unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def extract_features(samples: np.ndarray) -> np.ndarray:
+    """
+    Summarize mono samples at ANALYSIS_SAMPLE_RATE as a unit-length vector.
+
+    Each block (chroma mean, chroma std, MFCC mean, MFCC std) is normalized
+    on its own so no single block dominates the cosine similarity.
+    """
+    if len(samples) < N_FFT:
+        samples = np.pad(samples, (0, N_FFT - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, N_FFT)[::HOP_LENGTH]
+    power = np.abs(np.fft.rfft(frames * WINDOW, axis=1)).astype(np.float32) ** 2
+
+    chroma = power @ CHROMA_BANK.T
+    chroma /= np.maximum(chroma.max(axis=1, keepdims=True), 1e-10)
+    mfcc = np.log(power @ MEL_BANK.T + 1e-10) @ DCT.T
+
+    blocks = [chroma.mean(axis=0), chroma.std(axis=0), mfcc.mean(axis=0), mfcc.std(axis=0)]
+    return (np.concatenate([unit(block) for block in blocks]) / 2.0).astype(np.float32)
+
+
+def analyze_file(path: Path) -> np.ndarray:
+    """Decode an audio file and extract its feature vector."""
+    samples = decode_audio(path, ANALYSIS_SAMPLE_RATE).mean(axis=1)
+    return extract_features(samples)
+
+
+class VectorStore:
+    """
+    Feature vectors in one contiguous float32 matrix on disk.
+
+    The file is memory-mapped, so searches read only the pages they touch
+    and the OS page cache keeps hot rows in memory. Which song owns which
+    row lives in the song_features table.
+    """
+
+    def __init__(self, path: Path = VECTORS_PATH, dim: int = FEATURE_DIM):
+        self.path = path
+        self.dim = dim
+        self._vectors: Optional[np.memmap] = None
+
+    @property
+    def capacity(self) -> int:
+        if not self.path.exists():
+            return 0
+        return self.path.stat().st_size // (4 * self.dim)
+
+    def _map(self) -> Optional[np.memmap]:
+        if self._vectors is None and self.capacity:
+            self._vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        return self._vectors
+
+    def write(self, row: int, vector: np.ndarray) -> None:
+        if row >= self.capacity:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._vectors = None
+            with open(self.path, "ab") as f:
+                f.truncate((row + GROW_ROWS) * 4 * self.dim)
+        vectors = self._map()
+        vectors[row] = vector
+        vectors.flush()
+
+    def read(self, rows: np.ndarray) -> np.ndarray:
+        vectors = self._map()
+        if vectors is not None and len(rows) and rows.max() >= len(vectors):
+            # Grown by another process since it was mapped
+            self._vectors = None
+            vectors = self._map()
+        if vectors is None:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.asarray(vectors[rows])
+
+
+vectors = VectorStore()
+_write_lock = asyncio.Lock()
+_indexing_tasks: set[asyncio.Task] = set()
+
+
+async def load_index(db) -> tuple[list[str], np.ndarray]:
+    """Song ids and their vector rows for every indexed song."""
+    cursor = await db.execute(
+        "SELECT song_id, row FROM song_features WHERE version = ? ORDER BY row",
+        (FEATURE_VERSION,)
+    )
+    entries = await cursor.fetchall()
+    return [entry["song_id"] for entry in entries], np.array([entry["row"] for entry in entries], dtype=np.int64)
+
+
+async def index_song(song_id: str, location: str) -> bool:
+    """Extract and store the feature vector of a finished song."""
+    try:
+        vector = await asyncio.to_thread(lambda: analyze_file(storage.fetch(location)))
+    except (RuntimeError, OSError, subprocess.TimeoutExpired):
+        # Missing or undecodable audio; the song just stays out of similarity search
+        logger.exception("Feature extraction failed for %s", song_id)
+        return False
+
+    async with _write_lock:
+        async with get_db() as db:
+            cursor = await db.execute("SELECT 1 FROM songs WHERE id = ?", (song_id,))
+            if await cursor.fetchone() is None:
+                # Deleted while we were analyzing
+                return False
+
+            cursor = await db.execute("SELECT row FROM song_features WHERE song_id = ?", (song_id,))
+            existing = await cursor.fetchone()
+            if existing:
+                row = existing["row"]
+            else:
+                # Reuse the lowest row freed by a deleted song, else append
+                cursor = await db.execute("SELECT row FROM song_features")
+                used = {entry["row"] for entry in await cursor.fetchall()}
+                row = min(set(range(len(used) + 1)) - used)
+
+            vectors.write(row, vector)
+            await db.execute(
+                "INSERT OR REPLACE INTO song_features (song_id, row, version) VALUES (?, ?, ?)",
+                (song_id, row, FEATURE_VERSION)
+            )
+            await db.commit()
+    return True
+
+
+def schedule_indexing(song_id: str, location: str) -> None:
+    """Index a newly finished song in the background."""
+    task = asyncio.create_task(index_song(song_id, location))
+    # Keep a reference so the task isn't garbage-collected mid-run
+    _indexing_tasks.add(task)
+    task.add_done_callback(_indexing_tasks.discard)
+
+
+def song_audio_location(row) -> Optional[str]:
+    """The audio a song is analyzed from: the full mix, else whichever stem exists."""
+    return row["output_path"] or row["output_vocal_path"] or row["output_bgm_path"]
+
+
+async def backfill_features() -> None:
+    """Background task: index songs that have no (current) feature vector, a few at a time."""
+    failed: set[str] = set()
+    while True:
+        async with get_db() as db:
+            cursor = await db.execute("""
+                SELECT s.id, s.output_path, s.output_vocal_path, s.output_bgm_path
+                FROM songs s LEFT JOIN song_features f ON f.song_id = s.id
+                WHERE f.song_id IS NULL OR f.version != ?
+                ORDER BY s.created_at DESC
+            """, (FEATURE_VERSION,))
+            pending = [row for row in await cursor.fetchall() if row["id"] not in failed][:BACKFILL_BATCH]
+
+        if not pending:
+            return
+
+        for row in pending:
+            location = song_audio_location(row)
+            if not location or not await index_song(row["id"], location):
+                failed.add(row["id"])
+
+
+def top_k(query: np.ndarray, matrix: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k rows most similar to query, best first."""
+    scores = matrix @ query
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+@router.get("/library/duplicates", response_model=DuplicateList)
+async def find_duplicates(
+    threshold: float = Query(0.98, ge=0.5, le=1.0, description="Minimum cosine similarity")
+):
+    """List pairs of songs whose audio features are near-identical."""
+    async with get_db() as db:
+        song_ids, rows = await load_index(db)
+
+    def scan() -> list[tuple[int, int, float]]:
+        matrix = vectors.read(rows)
+        pairs = []
+        # Compare block by block so memory stays bounded for large libraries
+        for start in range(0, len(matrix), DUPLICATE_BLOCK_ROWS):
+            block = matrix[start:start + DUPLICATE_BLOCK_ROWS]
+            scores = block @ matrix.T
+            i, j = np.nonzero(scores >= threshold)
+            i += start
+            keep = j > i
+            pairs.extend(zip(i[keep].tolist(), j[keep].tolist(), scores[i[keep] - start, j[keep]].tolist()))
+        return pairs
+
+    pairs = await asyncio.to_thread(scan)
+    pairs.sort(key=lambda pair: -pair[2])
+    return DuplicateList(
+        threshold=threshold,
+        pairs=[
+            DuplicatePair(song_id=song_ids[i], other_id=song_ids[j], similarity=round(score, 4))
+            for i, j, score in pairs
+        ]
+    )
+
+
+@router.get("/library/{song_id}/similar", response_model=SimilarSongs)
+async def similar_songs(song_id: str, k: int = Query(10, ge=1, le=100)):
+    """Find the songs that sound most like a given song."""
+    async with get_db() as db:
+        cursor = await db.execute("SELECT 1 FROM songs WHERE id = ?", (song_id,))
+        if await cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Song not found")
+
+        song_ids, rows = await load_index(db)
+        if song_id not in song_ids:
+            raise HTTPException(status_code=404, detail="Song has not been analyzed yet")
+
+        matrix = vectors.read(rows)
+        position = song_ids.index(song_id)
+        # Ask for one extra so the song itself can be dropped
+        best = [i for i in top_k(matrix[position], matrix, k + 1) if i != position][:k]
+        matched = [song_ids[i] for i in best]
+
+        placeholders = ", ".join("?" for _ in matched)
+        cursor = await db.execute(f"SELECT id, title FROM songs WHERE id IN ({placeholders})", matched)
+        titles = {row["id"]: row["title"] for row in await cursor.fetchall()}
+
+    return SimilarSongs(
+        song_id=song_id,
+        results=[
+            SimilarSong(id=song_ids[i], title=titles.get(song_ids[i]), similarity=round(float(matrix[i] @ matrix[position]), 4))
+            for i in best
+        ]
+    )
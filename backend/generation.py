@@ -1,16 +1,38 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from pathlib import Path
 from datetime import datetime
+from typing import AsyncGenerator, Optional
 import asyncio
+import hashlib
 import json
+import os
 import uuid
 import subprocess
 import shutil
+import time
 
 from database import get_db
-from schemas import GenerationRequest, StemType
-from sse import format_sse_event
+from schemas import (
+    GenerationRequest, GenerationStatus, StemType, PriorityClass, QueueEntry, QueueStatus,
+    PreflightResult
+)
+from scheduler import scheduler
+from preflight import run_preflight
+from audio import derive_full_mix
+from storage import storage
+from features import schedule_indexing
+from changes import change_feed, record_change
+from segments import MAX_SEGMENTS, plan_segments, split_sections, stitch_outputs
+from splice import plan_splice, replace_section, song_outputs, splice_section
+from model_manager import model_manager
+from estimator import estimator, job_profile
+from accounting import record_usage, sampler, start_metering
+from sse import format_sse_event, with_ticks
+from executor import executor, load_snapshot
+from job_events import tail
+import jobs
+import workers
 
 router = APIRouter()
 
@@ -22,6 +44,25 @@ DATA_DIR = BASE_DIR / "data"
 OUTPUTS_DIR = DATA_DIR / "outputs"
 TEMP_DIR = DATA_DIR / "temp"
 
+# How often a queued job re-reports its queue position and wait estimate
+QUEUE_POLL_SECONDS = 5.0
+
+# How often a running job reports its remaining time
+ETA_TICK_SECONDS = 5.0
+
+# Tries per segment of a segmented generation
+SEGMENT_ATTEMPTS = 2
+
+# generate.sh writes its output here (in the job's temp dir) rather than to a pipe,
+# so it keeps running if the server restarts and the next server can follow it
+GENERATE_LOG = "generate.log"
+
+# How often the generate.sh log is checked for new lines
+LOG_POLL_SECONDS = 0.5
+
+# Most takes one job may generate
+MAX_TAKES = 8
+
 
 async def get_current_settings() -> dict:
     """Get current settings from database."""
@@ -50,6 +91,40 @@ def get_audio_duration(file_path: Path) -> float:
         return 0.0
 
 
+def resolve_owner(api_key: Optional[str], owner: Optional[str]) -> str:
+    """Identify who a job is charged to for fair-share scheduling."""
+    if api_key:
+        # Never store or echo the raw key
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return owner or "anonymous"
+
+
+async def save_upload(upload: UploadFile, directory: Path, stem: str) -> Path:
+    """Write an uploaded file into a directory, keeping its extension."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{stem}{Path(upload.filename or '').suffix or '.wav'}"
+    with open(path, "wb") as f:
+        f.write(await upload.read())
+    return path
+
+
+def format_duration(seconds: float) -> str:
+    """Human-friendly duration for status messages."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def preflight_error(issues) -> HTTPException:
+    """Build the 422 response for a request that failed preflight."""
+    return HTTPException(
+        status_code=422,
+        detail={
+            "message": "Preflight validation failed",
+            "errors": [issue.model_dump() for issue in issues]
+        }
+    )
+
+
 def convert_to_mp3(input_path: Path, output_path: Path) -> bool:
     """Convert audio file to MP3."""
     try:
@@ -67,229 +142,798 @@ def convert_to_mp3(input_path: Path, output_path: Path) -> bool:
         return False
 
 
-@router.post("/generate")
-async def generate_song(
-    lyrics: str = Form(...),
-    description: str = Form(...),
-    stem_type: StemType = Form("full"),
-    title: str = Form(None),
-    auto_style: str = Form(None),
-    reference_audio: UploadFile = File(None)
-):
-    """Generate a song with SSE progress updates."""
+async def follow_log(path: Path, process, offset: int = 0) -> AsyncGenerator[str, None]:
+    """Yield the lines written to a generate.sh log (from byte `offset`) until the process exits."""
+    exited = asyncio.ensure_future(process.wait())
+    try:
+        with open(path, "rb") as log:
+            log.seek(offset)
+            pending = b""
+            while True:
+                finished = exited.done()
+                for line in log.readlines():
+                    pending += line
+                    if pending.endswith(b"\n"):
+                        text = pending.decode(errors="replace").strip()
+                        pending = b""
+                        if text:
+                            yield text
+                if finished:
+                    if pending.strip():
+                        yield pending.decode(errors="replace").strip()
+                    return
+                await asyncio.wait({exited}, timeout=LOG_POLL_SECONDS)
+    finally:
+        exited.cancel()
+
 
-    async def generate():
-        job_id = str(uuid.uuid4())[:8]
-        song_id = f"song_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job_id}"
+def has_outputs(job: jobs.Job) -> bool:
+    """Whether generation left any WAVs in the job's output dir."""
+    output_temp = job.temp_dir / "output"
+    return output_temp.exists() and any(output_temp.rglob("*.wav"))
 
+
+def fetch_outputs(locations: dict[str, str]) -> dict[str, Path]:
+    """Local copies of a song's stored outputs, by kind."""
+    return {kind: storage.fetch(location) for kind, location in locations.items()}
+
+
+def segment_parallelism(remote: bool) -> int:
+    """How many segments of a long song can usefully run at once."""
+    slots = workers.total_slots() if remote else scheduler.slots
+    return min(slots, MAX_SEGMENTS)
+
+
+async def run_generation(
+    job: jobs.Job,
+    inputs: list[dict],
+    flags: list[str],
+    reference_path: Optional[Path],
+    remote: bool,
+    profile: dict,
+    extra: Optional[dict] = None
+) -> AsyncGenerator[str, None]:
+    """
+    Queue a job, run generate.sh for it (here or on a worker) and stream its progress.
+
+    Every record in `inputs` is generated in the same run, so the model
+    is loaded once for all of them. The WAVs land in job.temp_dir / "output" and job.returncode is set;
+    returns early, leaving it unset, if the job is cancelled. Segment runs
+    pass `extra` to tag their events and don't record a job status.
+    """
+    tracked = extra is None
+    tag = {"job_id": job.job_id, **(extra or {})}
+
+    if remote:
+        # A worker fetches the reference itself and fills in its local path
+        # "input" is kept for workers that predate multi-record runs; they generate only the first
+        workers.submit(job, {
+            "model": job.model,
+            "input": inputs[0],
+            "inputs": inputs,
+            "flags": flags
+        }, reference_path)
+    else:
+        if reference_path:
+            inputs = [{**input_data, "prompt_audio_path": str(reference_path)} for input_data in inputs]
+
+        jsonl_path = job.temp_dir / "input.jsonl"
+        with open(jsonl_path, "w") as f:
+            for input_data in inputs:
+                f.write(json.dumps(input_data) + "\n")
+
+        jobs.enqueue(job)
+
+    # Wait for the scheduler to hand us a GPU slot
+    queued = False
+    while not job.holds_gpu_slot:
+        if job.cancelled.is_set():
+            return
+
+        if not queued and tracked:
+            await jobs.set_job_status(job.job_id, "queued", "Waiting for GPU")
+        queued = True
+        position = jobs.queue_position(job)
+        wait = jobs.queue_wait(job)
         yield format_sse_event("status", {
-            "job_id": job_id,
-            "status": "preparing",
-            "message": "Preparing generation..."
+            **tag,
+            "status": "queued",
+            "queue_position": position,
+            "estimated_wait_seconds": round(wait),
+            "eta_seconds": round(wait + job.estimated_seconds),
+            "message": f"Queued ({position} job(s) ahead, about {format_duration(wait)} wait)"
         })
 
-        try:
-            # Get settings
-            settings = await get_current_settings()
-            current_model = settings.get("current_model")
+        await jobs.wait_for_gpu_slot(job, QUEUE_POLL_SECONDS)
 
-            if not current_model:
-                yield format_sse_event("error", {
-                    "message": "No model selected. Please download and select a model first."
-                })
-                return
+    if tracked:
+        await jobs.set_job_status(job.job_id, "generating", "Generating")
+    yield format_sse_event("status", {
+        **tag,
+        "status": "generating",
+        "estimated_seconds": round(job.estimated_seconds),
+        "eta_seconds": round(job.estimated_seconds),
+        "message": f"Starting generation (about {format_duration(job.estimated_seconds)})..."
+    })
+    started = time.monotonic()
+
+    def countdown() -> str:
+        remaining = job.estimated_seconds - (time.monotonic() - started)
+        return format_sse_event("progress", {
+            **tag,
+            "eta_seconds": round(max(0.0, remaining))
+        })
+
+    async def run_local():
+        # Build command
+        cmd = [
+            "bash", str(SONGGEN_DIR / "generate.sh"),
+            str(MODELS_DIR / job.model),
+            str(jsonl_path),
+            str(job.temp_dir / "output"),
+            *flags
+        ]
+
+        # Pin the job to the GPU the model manager placed it on
+        env = None
+        device = model_manager.device_for(job.job_id)
+        if device is not None:
+            env = {**os.environ, "CUDA_VISIBLE_DEVICES": str(device)}
+        await model_manager.prepare(job.model)
+
+        # Run generation in its own session so the whole tree can be killed on cancel,
+        # and so it outlives a server restart (see adopt_generation)
+        log_path = job.temp_dir / GENERATE_LOG
+        with open(log_path, "wb") as log:
+            popen = subprocess.Popen(
+                cmd,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                cwd=str(SONGGEN_DIR),
+                env=env,
+                start_new_session=True
+            )
+        process = jobs.DetachedProcess(popen.pid, popen)
+        job.process = process
+        if job.meter is not None:
+            job.meter.add_group(process.pid)
+        jobs.save_checkpoint(job.temp_dir, "generating", pid=process.pid, device=device)
+
+        # Stream output
+        async for line_text in follow_log(log_path, process):
+            yield format_sse_event("progress", {
+                **tag,
+                "message": line_text
+            })
+
+        await process.wait()
+        job.returncode = process.returncode
+
+    # The worker runs generate.sh and uploads its WAVs into the job's output dir
+    source = workers.relay(job, extra) if remote else run_local()
+    async for event in with_ticks(source, ETA_TICK_SECONDS, countdown):
+        yield event
+
+    if job.returncode == 0 and not job.cancelled.is_set():
+        await estimator.record(job.job_id, profile, time.monotonic() - started)
+
+
+async def adopt_generation(job: jobs.Job, checkpoint: dict) -> AsyncGenerator[str, None]:
+    """
+    Follow a generate.sh run that an earlier server process started and left running.
+
+    The process already occupies its GPU, so the job takes a slot without
+    queueing. Its exit status can't be collected; job.returncode is set
+    from whether it left output files.
+    """
+    jobs.adopt(job, checkpoint.get("device"))
+    process = jobs.DetachedProcess(checkpoint["pid"])
+    job.process = process
+    if job.meter is not None:
+        job.meter.add_group(process.pid)
 
-            model_path = MODELS_DIR / current_model
-            if not model_path.exists():
-                yield format_sse_event("error", {
-                    "message": f"Model not found: {current_model}"
-                })
+    await jobs.set_job_status(job.job_id, "generating", "Generating (resumed after restart)")
+    yield format_sse_event("status", {
+        "job_id": job.job_id,
+        "status": "generating",
+        "message": "Server restarted; generation is still running..."
+    })
+
+    # Lines written before the restart were already streamed (or nobody was listening)
+    log_path = job.temp_dir / GENERATE_LOG
+    offset = log_path.stat().st_size if log_path.exists() else 0
+    if log_path.exists():
+        async for line_text in follow_log(log_path, process, offset):
+            yield format_sse_event("progress", {
+                "job_id": job.job_id,
+                "message": line_text
+            })
+    else:
+        await process.wait()
+
+    job.returncode = 0 if has_outputs(job) else 1
+
+
+async def discard_partial_run(job: jobs.Job) -> None:
+    """Stop and clear whatever an interrupted earlier run of the job left behind."""
+    for segment_dir in job.temp_dir.glob("segment_*"):
+        pid = jobs.load_checkpoint(segment_dir).get("pid")
+        if jobs.process_group_alive(pid):
+            await jobs.terminate_process_tree(jobs.DetachedProcess(pid))
+        shutil.rmtree(segment_dir, ignore_errors=True)
+    shutil.rmtree(job.temp_dir / "output", ignore_errors=True)
+    (job.temp_dir / jobs.CHECKPOINT_NAME).unlink(missing_ok=True)
+
+
+async def encode_outputs(
+    song_id: str,
+    job_output_dir: Path,
+    output_temp: Path,
+    reference_path: Optional[Path]
+) -> Optional[dict]:
+    """
+    Convert the WAVs in `output_temp` to MP3 and hand them, with the reference, to storage.
+
+    Returns the songs columns for the stored files, or None if there was
+    no usable output.
+    """
+    job_output_dir.mkdir(exist_ok=True)
+    output_path = None
+    output_vocal_path = None
+    output_bgm_path = None
+    duration = None
+    vocal_wav = None
+    bgm_wav = None
+
+    # Look for generated WAV files
+    wav_files = list(output_temp.rglob("*.wav")) if output_temp.exists() else []
+
+    for wav_file in wav_files:
+        mp3_name = wav_file.stem + ".mp3"
+        mp3_path = job_output_dir / mp3_name
+
+        if convert_to_mp3(wav_file, mp3_path):
+            # Determine type based on filename
+            if "vocal" in wav_file.stem.lower():
+                output_vocal_path = str(mp3_path)
+                vocal_wav = wav_file
+            elif "bgm" in wav_file.stem.lower() or "instrumental" in wav_file.stem.lower():
+                output_bgm_path = str(mp3_path)
+                bgm_wav = wav_file
+            else:
+                output_path = str(mp3_path)
+                duration = get_audio_duration(mp3_path)
+
+    # Derive the full mix from the stems rather than promoting one stem to "full"
+    if not output_path and vocal_wav and bgm_wav:
+        mp3_path = job_output_dir / f"{song_id}_mix.mp3"
+        if await asyncio.to_thread(derive_full_mix, vocal_wav, bgm_wav, mp3_path):
+            output_path = str(mp3_path)
+            duration = get_audio_duration(mp3_path)
+
+    # If only one file and stem_type is full, use it as main output
+    if not output_path and wav_files:
+        first_wav = wav_files[0]
+        mp3_path = job_output_dir / (first_wav.stem + ".mp3")
+        if convert_to_mp3(first_wav, mp3_path):
+            output_path = str(mp3_path)
+            duration = get_audio_duration(mp3_path)
+
+    if not output_path and not output_vocal_path and not output_bgm_path:
+        return None
+
+    # Save reference audio if provided
+    saved_reference_path = None
+    if reference_path and reference_path.exists():
+        saved_reference_path = str(job_output_dir / reference_path.name)
+        shutil.copy(reference_path, saved_reference_path)
+
+    # Hand the finished files to the storage backend
+    async def store(path: Optional[str]) -> Optional[str]:
+        if not path:
+            return None
+        return await asyncio.to_thread(storage.put, Path(path), f"{song_id}/{Path(path).name}")
+
+    files = {
+        "output_path": await store(output_path),
+        "output_vocal_path": await store(output_vocal_path),
+        "output_bgm_path": await store(output_bgm_path),
+        "reference_audio_path": await store(saved_reference_path),
+        "duration_seconds": duration,
+    }
+    if not storage.keeps_local_files:
+        shutil.rmtree(job_output_dir, ignore_errors=True)
+    return files
+
+
+def take_ids(song_id: str, takes: int) -> list[str]:
+    """Song id of each take; the first take keeps the job's song id."""
+    return [song_id] + [f"{song_id}_take{number}" for number in range(2, takes + 1)]
+
+
+def take_of(path: Path, ids: list[str]) -> Optional[str]:
+    """The take a generated WAV belongs to; generate.sh names its files after the input idx."""
+    # Longest first, so song_x_take2_vocal isn't taken for a file of song_x
+    for take_id in sorted(ids, key=len, reverse=True):
+        if path.stem == take_id or path.stem.startswith(take_id + "_"):
+            return take_id
+    return None
+
+
+def split_takes(output_temp: Path, ids: list[str]) -> list[tuple[int, str, Path]]:
+    """
+    Sort a run's WAVs into a directory per take: (take number, song id, directory).
+
+    Takes that produced nothing are left out. Safe to repeat on a resumed
+    job, since files already sorted stay where they are.
+    """
+    if len(ids) == 1:
+        return [(1, ids[0], output_temp)]
+    takes_dir = output_temp.parent / "takes"
+    for wav in list(output_temp.rglob("*.wav")) if output_temp.exists() else []:
+        take_id = take_of(wav, ids)
+        if take_id is not None:
+            (takes_dir / take_id).mkdir(parents=True, exist_ok=True)
+            wav.replace(takes_dir / take_id / wav.name)
+    return [
+        (number, take_id, takes_dir / take_id)
+        for number, take_id in enumerate(ids, 1)
+        if (takes_dir / take_id).exists()
+    ]
+
+
+async def announce_takes(
+    job: jobs.Job,
+    source: AsyncGenerator[str, None],
+    ids: list[str]
+) -> AsyncGenerator[str, None]:
+    """Pass a run's events through, adding one when each take's output appears."""
+    output_temp = job.temp_dir / "output"
+    finished: set[str] = set()
+
+    def take_events() -> list[str]:
+        wavs = list(output_temp.rglob("*.wav")) if output_temp.exists() else []
+        new = sorted({take_of(wav, ids) for wav in wavs} - finished - {None}, key=ids.index)
+        finished.update(new)
+        return [
+            format_sse_event("progress", {
+                "job_id": job.job_id,
+                "take": ids.index(take_id) + 1,
+                "takes": len(ids),
+                "message": f"Take {ids.index(take_id) + 1} of {len(ids)} generated"
+            })
+            for take_id in new
+        ]
+
+    async for event in source:
+        yield event
+        for take_event in take_events():
+            yield take_event
+    # The last take lands as the run exits, after its final line
+    for take_event in take_events():
+        yield take_event
+
+
+async def run_segments(
+    job: jobs.Job,
+    parts: list[str],
+    input_data: dict,
+    flags: list[str],
+    reference_path: Optional[Path],
+    remote: bool,
+    stem_type: str
+) -> AsyncGenerator[str, None]:
+    """
+    Generate each lyric segment as its own job, in parallel, then stitch the results.
+
+    Every segment uses the song's description and reference. A failed
+    segment is retried on its own. Sets job.returncode like run_generation.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    segment_jobs: dict[int, jobs.Job] = {}
+    outputs: dict[int, Path] = {}
+
+    def cancel_segments() -> None:
+        for segment_job in list(segment_jobs.values()):
+            asyncio.ensure_future(jobs.cancel_job(segment_job.job_id, "Song cancelled"))
+
+    job.cancel_hooks.append(cancel_segments)
+
+    async def run_part(index: int, part: str) -> None:
+        tag = {"job_id": job.job_id, "segment": index + 1, "segments": len(parts)}
+        profile = job_profile(job.model, stem_type, flags, part, reference_path is not None)
+        for attempt in range(1, SEGMENT_ATTEMPTS + 1):
+            segment_dir = job.temp_dir / f"segment_{index}_{attempt}"
+            segment_dir.mkdir(parents=True, exist_ok=True)
+            segment_job = jobs.Job(
+                f"{job.job_id}-{index}-{attempt}", job.song_id, segment_dir, segment_dir,
+                owner=job.owner, priority=job.priority, model=job.model
+            )
+            segment_job.estimated_seconds = estimator.predict(profile)
+            segment_job.meter = job.meter
+            jobs.register_job(segment_job)
+            segment_jobs[index] = segment_job
+
+            segment_input = {**input_data, "idx": f"{input_data['idx']}_{index}", "gt_lyric": part}
+            try:
+                async for event in run_generation(
+                    segment_job, [segment_input], flags, reference_path, remote, profile, tag
+                ):
+                    await events.put(event)
+            finally:
+                jobs.finish_job(segment_job)
+
+            if job.cancelled.is_set():
                 return
+            if segment_job.returncode == 0:
+                outputs[index] = segment_dir / "output"
+                return
+            if attempt < SEGMENT_ATTEMPTS:
+                await events.put(format_sse_event("status", {
+                    **tag,
+                    "status": "generating",
+                    "message": f"Segment {index + 1} failed; retrying"
+                }))
 
-            # Create directories
-            TEMP_DIR.mkdir(parents=True, exist_ok=True)
-            OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
-
-            job_temp_dir = TEMP_DIR / job_id
-            job_temp_dir.mkdir(exist_ok=True)
-
-            job_output_dir = OUTPUTS_DIR / song_id
-            job_output_dir.mkdir(exist_ok=True)
-
-            # Handle reference audio
-            reference_path = None
-            if reference_audio:
-                ref_ext = Path(reference_audio.filename).suffix or ".wav"
-                reference_path = job_temp_dir / f"reference{ref_ext}"
-                with open(reference_path, "wb") as f:
-                    content = await reference_audio.read()
-                    f.write(content)
-
-            # Create JSONL input file
-            input_data = {
-                "idx": song_id,
-                "gt_lyric": lyrics,
-                "descriptions": description,
-            }
-
-            if reference_path:
-                input_data["prompt_audio_path"] = str(reference_path)
-            if auto_style:
-                input_data["auto_prompt_audio_type"] = auto_style
-
-            jsonl_path = job_temp_dir / "input.jsonl"
-            with open(jsonl_path, "w") as f:
-                f.write(json.dumps(input_data) + "\n")
+    await jobs.set_job_status(job.job_id, "generating", f"Generating {len(parts)} segments")
+    yield format_sse_event("status", {
+        "job_id": job.job_id,
+        "status": "generating",
+        "segments": len(parts),
+        "message": f"Generating {len(parts)} segments in parallel..."
+    })
 
-            yield format_sse_event("status", {
+    tasks = [asyncio.create_task(run_part(index, part)) for index, part in enumerate(parts)]
+    all_done = asyncio.gather(*tasks)
+    try:
+        while not all_done.done() or not events.empty():
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait({next_event, all_done}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                yield next_event.result()
+            else:
+                next_event.cancel()
+        all_done.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if job.cancelled.is_set():
+        return
+    if len(outputs) < len(parts):
+        job.returncode = 1
+        return
+
+    yield format_sse_event("progress", {
+        "job_id": job.job_id,
+        "message": "Stitching segments..."
+    })
+    stitched = await asyncio.to_thread(
+        stitch_outputs,
+        [outputs[index] for index in range(len(parts))],
+        job.temp_dir / "output" / "audios",
+        job.song_id
+    )
+    job.returncode = 0 if stitched else 1
+
+
+async def execute_job(row: dict) -> AsyncGenerator[str, None]:
+    """Run a submitted job through generation, conversion and the library insert, as SSE events."""
+    job_id, song_id = row["id"], row["song_id"]
+    spec = json.loads(row["spec"])
+    lyrics, description, stem_type = spec["lyrics"], spec["description"], spec["stem_type"]
+    title, auto_style, job_model = spec["title"], spec["auto_style"], spec["model"]
+    segmented = spec["segmented"]
+    takes = spec.get("takes", 1)
+    song_ids = take_ids(song_id, takes)
+    reference_path = Path(spec["reference_path"]) if spec["reference_path"] else None
+    # Set when regenerating one section of an existing song (see regenerate_section)
+    section = spec.get("section")
+    generate_lyrics = section["lyrics"] if section else lyrics
+
+    settings = await get_current_settings()
+    remote = settings.get("execution_mode", "local") == "remote"
+
+    job = jobs.Job(
+        job_id, song_id, TEMP_DIR / job_id, OUTPUTS_DIR / song_id,
+        owner=row["owner"], priority=row["priority"], model=job_model
+    )
+    jobs.register_job(job)
+
+    def discard_takes() -> None:
+        # Takes after the first are stored outside job.output_dir, which cancel_job removes
+        for take_id in song_ids[1:]:
+            shutil.rmtree(OUTPUTS_DIR / take_id, ignore_errors=True)
+
+    job.cancel_hooks.append(discard_takes)
+
+    async def fail(message: str) -> str:
+        jobs.finish_job(job)
+        await jobs.set_job_status(job_id, "error", message)
+        return format_sse_event("error", {
+            "job_id": job_id,
+            "message": message
+        })
+
+    await jobs.set_job_status(job_id, "preparing", "Preparing generation...", song_id)
+    yield format_sse_event("status", {
+        "job_id": job_id,
+        "status": "preparing",
+        "message": "Preparing generation..."
+    })
+
+    completed = False
+    try:
+        # Create directories
+        TEMP_DIR.mkdir(parents=True, exist_ok=True)
+        OUTPUTS_DIR.mkdir(parents=True, exist_ok=True)
+
+        job_temp_dir = job.temp_dir
+        job_temp_dir.mkdir(exist_ok=True)
+
+        # Input record for generate.sh
+        input_data = {
+            "idx": song_id,
+            "gt_lyric": generate_lyrics,
+            "descriptions": description,
+        }
+
+        if auto_style:
+            input_data["auto_prompt_audio_type"] = auto_style
+
+        # Add flags
+        flags = []
+        if settings.get("low_mem", "false").lower() == "true":
+            flags.append("--low_mem")
+        if settings.get("flash_attn", "true").lower() != "true":
+            flags.append("--not_use_flash_attn")
+
+        # Stem type flags. With always_separate the model renders vocal and
+        # accompaniment stems and every other variant is derived from them.
+        always_separate = settings.get("always_separate", "false").lower() == "true"
+        if always_separate or stem_type == "separate":
+            flags.append("--separate")
+        elif stem_type == "vocal":
+            flags.append("--vocal")
+        elif stem_type == "bgm":
+            flags.append("--bgm")
+
+        profile = job_profile(job_model, stem_type, flags, generate_lyrics, reference_path is not None, takes)
+        job.estimated_seconds = estimator.predict(profile)
+
+        # Sample what the job's processes use, through generation and encoding
+        job.meter = await start_metering(job_id, profile, remote, [job_temp_dir, job.output_dir])
+
+        # A job resumed after a server restart carries on from its last checkpoint
+        checkpoint = jobs.load_checkpoint(job_temp_dir)
+        stage = checkpoint.get("stage")
+        if stage == "generating" and jobs.process_group_alive(checkpoint.get("pid")):
+            source = adopt_generation(job, checkpoint)
+        elif stage in ("generated", "stored") or (stage == "generating" and has_outputs(job)):
+            source = None
+            job.returncode = 0
+        else:
+            await discard_partial_run(job)
+            parts = plan_segments(lyrics, segment_parallelism(remote)) if segmented else [lyrics]
+            if len(parts) > 1:
+                source = run_segments(job, parts, input_data, flags, reference_path, remote, stem_type)
+            elif takes > 1:
+                # One run generates every take, so the model is loaded once
+                inputs = [{**input_data, "idx": take_id} for take_id in song_ids]
+                source = announce_takes(
+                    job, run_generation(job, inputs, flags, reference_path, remote, profile), song_ids
+                )
+            else:
+                source = run_generation(job, [input_data], flags, reference_path, remote, profile)
+        if source is not None:
+            async for event in source:
+                yield event
+
+        if job.cancelled.is_set():
+            yield format_sse_event("cancelled", {
                 "job_id": job_id,
-                "status": "generating",
-                "message": "Starting generation (this may take 3-6 minutes)..."
+                "status": "cancelled",
+                "message": "Generation cancelled"
             })
+            return
 
-            # Build command
-            cmd = [
-                "bash", str(SONGGEN_DIR / "generate.sh"),
-                str(model_path),
-                str(jsonl_path),
-                str(job_temp_dir / "output")
-            ]
-
-            # Add flags
-            if settings.get("low_mem", "false").lower() == "true":
-                cmd.append("--low_mem")
-            if settings.get("flash_attn", "true").lower() != "true":
-                cmd.append("--not_use_flash_attn")
-
-            # Stem type flags
-            if stem_type == "vocal":
-                cmd.append("--vocal")
-            elif stem_type == "bgm":
-                cmd.append("--bgm")
-            elif stem_type == "separate":
-                cmd.append("--separate")
-
-            # Run generation
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT,
-                cwd=str(SONGGEN_DIR)
-            )
+        jobs.release_gpu_slot(job)
 
-            # Stream output
-            while True:
-                line = await process.stdout.readline()
-                if not line:
-                    break
-                line_text = line.decode().strip()
-                if line_text:
+        if job.returncode != 0:
+            yield await fail("Generation failed. Check logs for details.")
+            return
+
+        if stage == "stored":
+            stored = checkpoint["files"]
+        else:
+            output_temp = job_temp_dir / "output"
+            if section:
+                # The new section replaces its span of the original song; the spliced song is the output
+                output_temp = job_temp_dir / "spliced"
+                if stage != "generated":
                     yield format_sse_event("progress", {
                         "job_id": job_id,
-                        "message": line_text
+                        "message": "Splicing the new section into the song..."
                     })
+                    originals = await asyncio.to_thread(fetch_outputs, section["originals"])
+                    spliced = await asyncio.to_thread(
+                        splice_section,
+                        originals,
+                        job_temp_dir / "output",
+                        output_temp,
+                        song_id,
+                        section["start_frame"],
+                        section["end_frame"],
+                        section["beat_frames"]
+                    )
+                    if not spliced:
+                        yield await fail("Could not splice the new section into the song")
+                        return
 
-            await process.wait()
-
-            if process.returncode != 0:
-                yield format_sse_event("error", {
-                    "job_id": job_id,
-                    "message": "Generation failed. Check logs for details."
-                })
-                return
+            jobs.save_checkpoint(job_temp_dir, "generated")
 
+            await jobs.set_job_status(job_id, "converting", "Converting to MP3")
             yield format_sse_event("status", {
                 "job_id": job_id,
                 "status": "converting",
                 "message": "Converting to MP3..."
             })
 
-            # Find and convert output files
-            output_temp = job_temp_dir / "output"
-            output_path = None
-            output_vocal_path = None
-            output_bgm_path = None
-            duration = None
-
-            # Look for generated WAV files
-            wav_files = list(output_temp.rglob("*.wav")) if output_temp.exists() else []
-
-            for wav_file in wav_files:
-                mp3_name = wav_file.stem + ".mp3"
-                mp3_path = job_output_dir / mp3_name
-
-                if convert_to_mp3(wav_file, mp3_path):
-                    # Determine type based on filename
-                    if "vocal" in wav_file.stem.lower():
-                        output_vocal_path = str(mp3_path)
-                    elif "bgm" in wav_file.stem.lower() or "instrumental" in wav_file.stem.lower():
-                        output_bgm_path = str(mp3_path)
-                    else:
-                        output_path = str(mp3_path)
-                        duration = get_audio_duration(mp3_path)
-
-            # If only one file and stem_type is full, use it as main output
-            if not output_path and wav_files:
-                first_wav = wav_files[0]
-                mp3_path = job_output_dir / (first_wav.stem + ".mp3")
-                if convert_to_mp3(first_wav, mp3_path):
-                    output_path = str(mp3_path)
-                    duration = get_audio_duration(mp3_path)
-
-            if not output_path and not output_vocal_path and not output_bgm_path:
-                yield format_sse_event("error", {
-                    "job_id": job_id,
-                    "message": "No output files generated"
-                })
+            # Each take is stored as a song of its own
+            stored = []
+            for number, take_id, take_temp in split_takes(output_temp, song_ids):
+                if takes > 1:
+                    yield format_sse_event("progress", {
+                        "job_id": job_id,
+                        "take": number,
+                        "takes": takes,
+                        "message": f"Converting take {number} of {takes}..."
+                    })
+                # A section's reference is a clip of the song itself, not worth keeping
+                files = await encode_outputs(
+                    take_id, OUTPUTS_DIR / take_id, take_temp, None if section else reference_path
+                )
+                if files is not None:
+                    stored.append({"song_id": take_id, "take": number, **files})
+            if not stored:
+                yield await fail("No output files generated")
+                return
+
+            if job.cancelled.is_set():
                 return
 
-            # Save reference audio if provided
-            saved_reference_path = None
-            if reference_path and reference_path.exists():
-                saved_reference_path = str(job_output_dir / reference_path.name)
-                shutil.copy(reference_path, saved_reference_path)
+            jobs.save_checkpoint(job_temp_dir, "stored", files=stored)
 
-            # Save to database
-            async with get_db() as db:
-                await db.execute("""
+        # Save to database; a resumed job may have got this far before the restart.
+        # A regenerated section becomes the next version of the song; takes share a group
+        parent_id = section["parent_id"] if section else None
+        take_group = song_id if takes > 1 else None
+        async with get_db() as db:
+            for files in stored:
+                song_title = title or f"Song {job_id}"
+                cursor = await db.execute("""
                     INSERT INTO songs (
                         id, title, lyrics, description, reference_audio_path,
                         stem_type, output_path, output_vocal_path, output_bgm_path,
-                        duration_seconds, model_version
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        duration_seconds, model_version, parent_id, version, take_group, take
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                        (SELECT COALESCE(MAX(version), 0) + 1 FROM songs WHERE id = ? OR parent_id = ?), ?, ?)
+                    ON CONFLICT(id) DO NOTHING
                 """, (
-                    song_id,
-                    title or f"Song {job_id}",
+                    files["song_id"],
+                    f"{song_title} (take {files['take']})" if take_group else song_title,
                     lyrics,
                     description,
-                    saved_reference_path,
+                    files["reference_audio_path"],
                     stem_type,
-                    output_path,
-                    output_vocal_path,
-                    output_bgm_path,
-                    duration,
-                    current_model
+                    files["output_path"],
+                    files["output_vocal_path"],
+                    files["output_bgm_path"],
+                    files["duration_seconds"],
+                    job_model,
+                    parent_id,
+                    parent_id,
+                    parent_id,
+                    take_group,
+                    files["take"] if take_group else None
                 ))
-                await db.commit()
+                if cursor.rowcount:
+                    await record_change(db, files["song_id"], "insert")
+            await db.commit()
+        change_feed.publish()
 
-            # Cleanup temp directory
-            shutil.rmtree(job_temp_dir, ignore_errors=True)
+        # Feature vectors for similarity search; runs after "done" so it never delays the song
+        for files in stored:
+            schedule_indexing(
+                files["song_id"], files["output_path"] or files["output_vocal_path"] or files["output_bgm_path"]
+            )
 
-            yield format_sse_event("done", {
-                "job_id": job_id,
-                "status": "done",
-                "message": "Generation complete!",
-                "song_id": song_id
-            })
+        # Cleanup temp directory
+        shutil.rmtree(job_temp_dir, ignore_errors=True)
 
-        except Exception as e:
-            yield format_sse_event("error", {
-                "job_id": job_id,
-                "message": f"Error: {str(e)}"
-            })
+        jobs.finish_job(job)
+        completed = True
+        message = "Generation complete!"
+        if len(stored) < takes:
+            message = f"Generation complete ({len(stored)} of {takes} takes)"
+        await jobs.set_job_status(job_id, "done", message, stored[0]["song_id"])
+        yield format_sse_event("done", {
+            "job_id": job_id,
+            "status": "done",
+            "message": message,
+            "song_id": stored[0]["song_id"],
+            **({"song_ids": [files["song_id"] for files in stored]} if takes > 1 else {})
+        })
+
+    except Exception as e:
+        yield await fail(f"Error: {str(e)}")
+
+    finally:
+        if not job.finished and not job.cancelled.is_set():
+            # The executor stopped mid-job (server shutdown). Leave generate.sh running and
+            # the job unfinished: the next executor resumes it from its checkpoint
+            jobs.finish_job(job)
+            if job.meter is not None:
+                sampler.unwatch(job.meter)
+        elif job.meter is not None:
+            status = "cancelled" if job.cancelled.is_set() else "done" if completed else "error"
+            await record_usage(job.meter, status)
+
+
+@router.post("/generate")
+async def generate_song(
+    lyrics: str = Form(...),
+    description: str = Form(...),
+    stem_type: StemType = Form("full"),
+    title: str = Form(None),
+    auto_style: str = Form(None),
+    priority: PriorityClass = Form("interactive"),
+    owner: str = Form(None),
+    model: str = Form(None),
+    segmented: bool = Form(False),
+    takes: int = Form(1, ge=1, le=MAX_TAKES, description="Variations to generate, each saved as a song"),
+    reference_audio: UploadFile = File(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """Generate a song with SSE progress updates."""
+    if takes > 1 and segmented:
+        raise HTTPException(status_code=422, detail="takes can't be combined with segmented generation")
+    job_owner = resolve_owner(x_api_key, owner)
+    job_id = str(uuid.uuid4())[:8]
+    song_id = f"song_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job_id}"
+
+    # Stage the reference upload so preflight can probe it
+    reference_path = None
+    if reference_audio:
+        reference_path = await save_upload(reference_audio, TEMP_DIR / job_id, "reference")
+
+    # Reject bad input before anything touches the GPU
+    settings = await get_current_settings()
+    job_model = model or settings.get("current_model")
+    remote = settings.get("execution_mode", "local") == "remote"
+    issues = await run_preflight(
+        lyrics, description, auto_style, reference_path, job_model, SONGGEN_DIR, remote
+    )
+    if issues:
+        shutil.rmtree(TEMP_DIR / job_id, ignore_errors=True)
+        raise preflight_error(issues)
+
+    # The executor (possibly in another server process) runs the job; this stream follows it
+    await jobs.submit_job(job_id, song_id, job_owner, priority, {
+        "lyrics": lyrics,
+        "description": description,
+        "stem_type": stem_type,
+        "title": title,
+        "auto_style": auto_style,
+        "model": job_model,
+        "segmented": segmented,
+        "takes": takes,
+        "reference_path": str(reference_path) if reference_path else None,
+    })
+    executor.wake()
 
     return StreamingResponse(
-        generate(),
+        tail(job_id),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -298,12 +942,222 @@ async def generate_song(
     )
 
 
-@router.get("/generate/status/{job_id}")
+@router.post("/generate/section")
+async def regenerate_section(
+    song_id: str = Form(...),
+    section: int = Form(..., ge=0, description="Index of the lyric section to regenerate"),
+    lyrics: str = Form(None, description="New words for the section; the old ones if omitted"),
+    priority: PriorityClass = Form("interactive"),
+    owner: str = Form(None),
+    model: str = Form(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    Regenerate one section of a song, with SSE progress updates.
+
+    Only the section is generated, from the song's description with a clip
+    of the song as reference audio. It is spliced into the original at the
+    nearest beats and saved as a new version of the song.
+    """
+    async with get_db() as db:
+        cursor = await db.execute("SELECT * FROM songs WHERE id = ?", (song_id,))
+        row = await cursor.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Song not found")
+    section_count = len(split_sections(row["lyrics"]))
+    if section >= section_count:
+        raise HTTPException(
+            status_code=422,
+            detail=f"The song has {section_count} lyric section(s); section must be below {section_count}"
+        )
+    originals = song_outputs(row)
+    if not originals:
+        raise HTTPException(status_code=422, detail="The song has no audio to splice into")
+
+    job_owner = resolve_owner(x_api_key, owner)
+    job_id = str(uuid.uuid4())[:8]
+    new_song_id = f"song_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{job_id}"
+    section_lyrics, full_lyrics = replace_section(row["lyrics"], section, lyrics)
+
+    # Find the section in the song and cut the reference clip from it
+    job_temp_dir = TEMP_DIR / job_id
+    job_temp_dir.mkdir(parents=True, exist_ok=True)
+    reference_path = job_temp_dir / "reference.wav"
+    try:
+        local_originals = await asyncio.to_thread(fetch_outputs, originals)
+        plan = await asyncio.to_thread(plan_splice, local_originals, row["lyrics"], section, reference_path)
+    except RuntimeError as e:
+        shutil.rmtree(job_temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=422, detail=f"Could not read the song's audio: {e}")
+
+    settings = await get_current_settings()
+    job_model = model or row["model_version"] or settings.get("current_model")
+    remote = settings.get("execution_mode", "local") == "remote"
+    issues = await run_preflight(
+        section_lyrics, row["description"], None, reference_path, job_model, SONGGEN_DIR, remote
+    )
+    if issues:
+        shutil.rmtree(job_temp_dir, ignore_errors=True)
+        raise preflight_error(issues)
+
+    await jobs.submit_job(job_id, new_song_id, job_owner, priority, {
+        "lyrics": full_lyrics,
+        "description": row["description"],
+        "stem_type": row["stem_type"],
+        "title": row["title"],
+        "auto_style": None,
+        "model": job_model,
+        "segmented": False,
+        "reference_path": str(reference_path),
+        "section": {
+            "song_id": song_id,
+            "parent_id": row["parent_id"] or song_id,
+            "index": section,
+            "lyrics": section_lyrics,
+            "originals": originals,
+            **plan,
+        },
+    })
+    executor.wake()
+
+    return StreamingResponse(
+        tail(job_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
+@router.get("/generate/{job_id}/events")
+async def follow_generation(
+    job_id: str,
+    after: int = Query(0, ge=0, description="Replay events after this sequence number"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """Re-attach to a job's SSE progress stream, from any server process."""
+    async with get_db() as db:
+        cursor = await db.execute("SELECT 1 FROM jobs WHERE id = ?", (job_id,))
+        if await cursor.fetchone() is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+
+    return StreamingResponse(
+        tail(job_id, after),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
+@router.post("/generate/preflight", response_model=PreflightResult)
+async def preflight_generation(
+    lyrics: str = Form(...),
+    description: str = Form(...),
+    auto_style: str = Form(None),
+    model: str = Form(None),
+    reference_audio: UploadFile = File(None)
+):
+    """Validate a generation request without starting it."""
+    check_dir = TEMP_DIR / f"preflight_{uuid.uuid4().hex[:8]}"
+    try:
+        reference_path = None
+        if reference_audio:
+            reference_path = await save_upload(reference_audio, check_dir, "reference")
+
+        settings = await get_current_settings()
+        issues = await run_preflight(
+            lyrics, description, auto_style, reference_path,
+            model or settings.get("current_model"), SONGGEN_DIR,
+            settings.get("execution_mode", "local") == "remote"
+        )
+    finally:
+        shutil.rmtree(check_dir, ignore_errors=True)
+
+    return PreflightResult(ok=not issues, errors=issues)
+
+
+@router.get("/generate/status/{job_id}", response_model=GenerationStatus)
 async def get_generation_status(job_id: str):
-    """Get status of a generation job (placeholder for future job queue)."""
-    # In a more complex implementation, this would check a job queue
-    # For now, status is streamed via SSE
-    return {
-        "job_id": job_id,
-        "message": "Use SSE stream from /api/generate for real-time status"
-    }
+    """Get the last recorded status of a generation job."""
+    async with get_db() as db:
+        cursor = await db.execute(
+            "SELECT * FROM jobs WHERE id = ?",
+            (job_id,)
+        )
+        row = await cursor.fetchone()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return GenerationStatus(
+        job_id=row["id"],
+        status=row["status"],
+        message=row["message"] or "",
+        song_id=row["song_id"] if row["status"] == "done" else None
+    )
+
+
+def queue_status() -> QueueStatus:
+    """Running and queued jobs of this process's scheduler."""
+    running, queued = scheduler.snapshot()
+    now = time.monotonic()
+
+    def entry(ticket, status, position):
+        if status == "generating":
+            eta = max(0.0, ticket.estimated_seconds - (now - ticket.started_at))
+        else:
+            eta = scheduler.estimated_wait(ticket) + ticket.estimated_seconds
+        return QueueEntry(
+            job_id=ticket.job_id,
+            owner=ticket.owner,
+            priority=ticket.priority,
+            model=ticket.model,
+            status=status,
+            position=position,
+            estimated_seconds=round(ticket.estimated_seconds),
+            eta_seconds=round(eta)
+        )
+
+    return QueueStatus(
+        slots=scheduler.slots,
+        policy=scheduler.policy,
+        running=[entry(t, "generating", 0) for t in running],
+        queued=[entry(t, "queued", i) for i, t in enumerate(queued)]
+    )
+
+
+@router.get("/generate/queue", response_model=QueueStatus)
+async def get_queue():
+    """List running and queued generation jobs in dispatch order."""
+    if executor.is_leader:
+        return queue_status()
+
+    # The scheduler lives in the executor process, which publishes a snapshot every few seconds
+    snapshot = await load_snapshot("queue")
+    if snapshot is None:
+        return QueueStatus(slots=scheduler.slots, policy=scheduler.policy, running=[], queued=[])
+    return QueueStatus.model_validate_json(snapshot)
+
+
+@router.delete("/generate/{job_id}")
+async def cancel_generation(job_id: str):
+    """Cancel a running generation job."""
+    if jobs.get_job(job_id) is not None:
+        cancelled = await jobs.cancel_job(job_id, "Cancelled by user")
+    else:
+        # Run by another server process, woken to pick the request up
+        requested = await jobs.request_cancel(job_id)
+        executor.wake()
+        cancelled = (
+            requested
+            and await jobs.wait_for_end(job_id, jobs.TERMINATE_GRACE_SECONDS + 5) == "cancelled"
+        )
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="No running job with that ID")
+
+    return {"status": "cancelled", "job_id": job_id}
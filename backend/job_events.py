@@ -0,0 +1,155 @@
+from typing import AsyncGenerator, Optional
+import asyncio
+import time
+
+from database import get_db
+from sse import format_sse_event
+import jobs
+
+# How often a follower checks for events written by another server process; the interval
+# doubles (up to TAIL_MAX_POLL_SECONDS) while nothing new arrives
+TAIL_POLL_SECONDS = 0.25
+TAIL_MAX_POLL_SECONDS = 2.0
+
+# Followers mark the job as watched this often; the executor cancels jobs nobody watches
+WATCH_TOUCH_SECONDS = 5.0
+
+# Events of finished jobs are kept this long so late re-attaches still see the outcome
+EVENT_RETENTION_SECONDS = 3600
+
+# Local followers are woken directly when events are written in this process
+_written: dict[str, asyncio.Event] = {}
+
+
+def event_type(chunk: str) -> str:
+    """The event name of a formatted SSE chunk."""
+    first_line = chunk.split("\n", 1)[0]
+    return first_line[len("event: "):] if first_line.startswith("event: ") else ""
+
+
+def is_terminal(chunk: str) -> bool:
+    return event_type(chunk) in jobs.TERMINAL_STATUSES
+
+
+def written(job_id: str) -> asyncio.Event:
+    """Set the next time events of the job are written by this process."""
+    return _written.setdefault(job_id, asyncio.Event())
+
+
+def notify(job_id: str) -> None:
+    event = _written.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+
+async def last_event_seq(job_id: str) -> int:
+    """Sequence number of the job's latest stored event (0 if none)."""
+    async with get_db() as db:
+        cursor = await db.execute("SELECT MAX(seq) FROM job_events WHERE job_id = ?", (job_id,))
+        row = await cursor.fetchone()
+    return row[0] or 0
+
+
+class EventLog:
+    """
+    Appends a job's SSE events to job_events.
+
+    Writes happen in the background; events that pile up during a write go
+    out together in the next one, so chatty generate.sh output costs a
+    transaction per batch rather than per line.
+    """
+
+    def __init__(self, job_id: str, seq: int = 0):
+        self.job_id = job_id
+        self.seq = seq
+        self._pending: list[tuple[int, str, bool]] = []
+        self._writer: Optional[asyncio.Task] = None
+
+    def append(self, chunk: str) -> None:
+        self.seq += 1
+        self._pending.append((self.seq, chunk, is_terminal(chunk)))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write())
+
+    async def _write(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            async with get_db() as db:
+                await db.executemany(
+                    "INSERT OR REPLACE INTO job_events (job_id, seq, chunk, terminal) VALUES (?, ?, ?, ?)",
+                    [(self.job_id, seq, chunk, int(terminal)) for seq, chunk, terminal in batch]
+                )
+                await db.commit()
+            notify(self.job_id)
+
+    async def close(self) -> None:
+        """Wait until every appended event is stored."""
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+
+async def tail(job_id: str, after: int = 0) -> AsyncGenerator[str, None]:
+    """
+    Stream a job's events from the shared log, starting after sequence number `after`.
+
+    Each event carries its sequence number as the SSE id, so a client can
+    re-attach (from any server process) without missing or repeating events.
+    Following a job also keeps it alive: the executor cancels jobs that no
+    client has followed for a while.
+    """
+    seq = after
+    last_touch = 0.0
+    checked_seq: Optional[int] = None
+    interval = TAIL_POLL_SECONDS
+    try:
+        while True:
+            changed = written(job_id)
+            async with get_db() as db:
+                cursor = await db.execute(
+                    "SELECT seq, chunk, terminal FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                    (job_id, seq)
+                )
+                rows = await cursor.fetchall()
+
+            for row in rows:
+                yield f"id: {row['seq']}\n{row['chunk']}"
+                seq = row["seq"]
+                if row["terminal"]:
+                    return
+
+            if time.monotonic() - last_touch >= WATCH_TOUCH_SECONDS:
+                last_touch = time.monotonic()
+                status = await jobs.touch_watch(job_id)
+                # The final event is written just after the final status, so only give up
+                # if nothing arrived by the next check (e.g. the executor process died)
+                if status is None or checked_seq == seq:
+                    yield format_sse_event("error", {
+                        "job_id": job_id,
+                        "message": "Job is no longer running"
+                    })
+                    return
+                checked_seq = seq if status in jobs.TERMINAL_STATUSES else None
+
+            if rows:
+                interval = TAIL_POLL_SECONDS
+            else:
+                try:
+                    await asyncio.wait_for(changed.wait(), interval)
+                except asyncio.TimeoutError:
+                    interval = min(interval * 2, TAIL_MAX_POLL_SECONDS)
+    finally:
+        # Jobs followed here but run by another process are never notified locally
+        if job_id in _written and not _written[job_id].is_set():
+            del _written[job_id]
+
+
+async def prune_events() -> None:
+    """Drop the events of jobs that finished more than EVENT_RETENTION_SECONDS ago."""
+    async with get_db() as db:
+        await db.execute(f"""
+            DELETE FROM job_events WHERE job_id IN (
+                SELECT id FROM jobs
+                WHERE status IN {jobs.TERMINAL_STATUSES} AND updated_at < datetime('now', ?)
+            )
+        """, (f"-{EVENT_RETENTION_SECONDS} seconds",))
+        await db.commit()
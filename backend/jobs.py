@@ -0,0 +1,350 @@
+from pathlib import Path
+from typing import Callable, Optional
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+
+from accounting import ResourceMeter
+from database import get_db
+from scheduler import scheduler, Ticket
+from shared import TERMINATE_GRACE_SECONDS, terminate_process_tree
+
+TERMINAL_STATUSES = ("done", "error", "cancelled")
+
+# Written to a job's temp dir at each stage boundary, so a restarted server can resume the job
+CHECKPOINT_NAME = "checkpoint.json"
+
+# How often a running generate.sh is checked for exit
+PROCESS_POLL_SECONDS = 0.5
+
+
+def save_checkpoint(temp_dir: Path, stage: str, **data) -> None:
+    """Record the last stage a job completed; replaced atomically, so never half-written."""
+    path = temp_dir / CHECKPOINT_NAME
+    partial = path.with_suffix(".tmp")
+    with open(partial, "w") as f:
+        json.dump({"stage": stage, **data}, f)
+    os.replace(partial, path)
+
+
+def load_checkpoint(temp_dir: Path) -> dict:
+    """The job's last checkpoint, or {} if it never reached one."""
+    try:
+        with open(temp_dir / CHECKPOINT_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def process_group_alive(pgid: Optional[int]) -> bool:
+    """Whether a process group started with start_new_session=True still has members."""
+    if pgid is None or not hasattr(os, "killpg"):
+        return False
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class DetachedProcess:
+    """
+    A generate.sh process group that outlives the server process that started it.
+
+    An asyncio subprocess is killed when its event loop closes, so
+    generate.sh is started with subprocess.Popen in a session of its own
+    and polled instead. A process left running by an earlier server process
+    is adopted by PID alone: it isn't our child, so its exit status can't
+    be collected, and returncode becomes -1 once its group is gone.
+    """
+
+    def __init__(self, pid: int, popen: Optional[subprocess.Popen] = None):
+        self.pid = pid
+        self._popen = popen
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if self._popen is not None:
+            return self._popen.poll()
+        return None if process_group_alive(self.pid) else -1
+
+    def send_signal(self, sig: int) -> None:
+        """Signal the process itself, for platforms without process groups."""
+        if self._popen is not None:
+            self._popen.send_signal(sig)
+        else:
+            os.kill(self.pid, sig)
+
+    async def wait(self) -> int:
+        while self.returncode is None:
+            await asyncio.sleep(PROCESS_POLL_SECONDS)
+        return self.returncode
+
+
+class Job:
+    """A generation job tracked while the executor runs it."""
+
+    def __init__(
+        self,
+        job_id: str,
+        song_id: str,
+        temp_dir: Path,
+        output_dir: Path,
+        owner: str = "anonymous",
+        priority: str = "interactive",
+        model: Optional[str] = None
+    ):
+        self.job_id = job_id
+        self.song_id = song_id
+        self.temp_dir = temp_dir
+        self.output_dir = output_dir
+        self.owner = owner
+        self.priority = priority
+        self.model = model
+        self.estimated_seconds = 0.0
+        self.process: Optional[DetachedProcess] = None
+        self.returncode: Optional[int] = None
+        self.ticket: Optional[Ticket] = None
+        self.meter: Optional[ResourceMeter] = None
+        self.cancel_hooks: list[Callable[[], None]] = []
+        self.cancelled = asyncio.Event()
+        self.finished = False
+
+    @property
+    def holds_gpu_slot(self) -> bool:
+        return self.ticket is not None and self.ticket.dispatched.is_set()
+
+
+_active_jobs: dict[str, Job] = {}
+
+
+def register_job(job: Job) -> None:
+    """Track a job so it can be cancelled."""
+    _active_jobs[job.job_id] = job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Get an active job by ID."""
+    return _active_jobs.get(job_id)
+
+
+def finish_job(job: Job) -> None:
+    """Stop tracking a job that reached a terminal state."""
+    release_gpu_slot(job)
+    job.finished = True
+    _active_jobs.pop(job.job_id, None)
+
+
+def enqueue(job: Job) -> None:
+    """Submit a job to the GPU scheduler."""
+    job.ticket = scheduler.submit(job.job_id, job.owner, job.priority, job.model, job.estimated_seconds)
+
+
+def adopt(job: Job, device: Optional[int]) -> None:
+    """Give the GPU slot straight to a job whose generate.sh is already running."""
+    job.ticket = scheduler.adopt(job.job_id, job.owner, job.priority, job.model, device)
+
+
+def queue_position(job: Job) -> int:
+    """Number of jobs scheduled ahead of this one."""
+    return scheduler.position(job.ticket) if job.ticket else 0
+
+
+def queue_wait(job: Job) -> float:
+    """Predicted seconds until the job gets a GPU slot."""
+    return scheduler.estimated_wait(job.ticket) if job.ticket else 0.0
+
+
+async def wait_for_gpu_slot(job: Job, timeout: float) -> None:
+    """Wait until the job is dispatched, cancelled, or the timeout passes."""
+    dispatched = asyncio.ensure_future(job.ticket.dispatched.wait())
+    cancelled = asyncio.ensure_future(job.cancelled.wait())
+    try:
+        await asyncio.wait(
+            {dispatched, cancelled},
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        dispatched.cancel()
+        cancelled.cancel()
+
+
+def release_gpu_slot(job: Job) -> None:
+    """Release the job's GPU slot, or drop it from the queue if it never got one."""
+    if job.ticket is None:
+        return
+    if job.ticket.dispatched.is_set():
+        scheduler.release(job.ticket)
+    else:
+        scheduler.withdraw(job.ticket)
+    job.ticket = None
+
+
+async def set_job_status(
+    job_id: str,
+    status: str,
+    message: str,
+    song_id: Optional[str] = None
+) -> None:
+    """Record the latest status of a job."""
+    job = _active_jobs.get(job_id)
+    owner = job.owner if job else None
+    priority = job.priority if job else None
+
+    async with get_db() as db:
+        await db.execute("""
+            INSERT INTO jobs (id, song_id, status, message, owner, priority)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                status = excluded.status,
+                message = excluded.message,
+                song_id = COALESCE(excluded.song_id, jobs.song_id),
+                updated_at = CURRENT_TIMESTAMP
+        """, (job_id, song_id, status, message, owner, priority))
+        await db.commit()
+
+
+async def submit_job(job_id: str, song_id: str, owner: str, priority: str, spec: dict) -> None:
+    """Record a job for the executor to pick up; whichever server process accepted it."""
+    async with get_db() as db:
+        await db.execute("""
+            INSERT INTO jobs (id, song_id, status, message, owner, priority, spec, watched_at)
+            VALUES (?, ?, 'submitted', 'Waiting to start', ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (job_id, song_id, owner, priority, json.dumps(spec)))
+        await db.commit()
+
+
+async def claim_submitted_jobs() -> list:
+    """Take every submitted job for this process to run."""
+    async with get_db() as db:
+        # Checked with a read first so an idle executor never takes the write lock
+        cursor = await db.execute("SELECT 1 FROM jobs WHERE status = 'submitted' LIMIT 1")
+        if await cursor.fetchone() is None:
+            return []
+        cursor = await db.execute("""
+            UPDATE jobs SET status = 'preparing', message = 'Preparing generation...',
+                updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'submitted'
+            RETURNING id, song_id, owner, priority, spec
+        """)
+        rows = await cursor.fetchall()
+        await db.commit()
+    return rows
+
+
+async def resubmit_interrupted_jobs() -> int:
+    """
+    Hand jobs that an earlier executor left unfinished back to be run again.
+
+    The job's checkpoint decides how much of it is redone (see
+    generation.execute_job). Their clients went away with the old process,
+    so watched_at is cleared and they are no longer cancelled for lack of
+    one. Jobs without a spec can't be resumed and are marked failed.
+    Returns the number of jobs resubmitted.
+    """
+    async with get_db() as db:
+        cursor = await db.execute(f"""
+            UPDATE jobs SET status = 'submitted', message = 'Resuming after restart',
+                watched_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status NOT IN {TERMINAL_STATUSES} AND status != 'submitted' AND spec IS NOT NULL
+        """)
+        resubmitted = cursor.rowcount
+        await db.execute(f"""
+            UPDATE jobs SET status = 'error', message = 'Interrupted by a server restart',
+                updated_at = CURRENT_TIMESTAMP
+            WHERE status NOT IN {TERMINAL_STATUSES} AND spec IS NULL
+        """)
+        await db.commit()
+    return resubmitted
+
+
+async def request_cancel(job_id: str) -> bool:
+    """Ask the executor, wherever it runs, to cancel a job. False if it already ended."""
+    async with get_db() as db:
+        cursor = await db.execute(
+            f"UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status NOT IN {TERMINAL_STATUSES}",
+            (job_id,)
+        )
+        await db.commit()
+    return cursor.rowcount > 0
+
+
+async def touch_watch(job_id: str) -> Optional[str]:
+    """Note that a client is following a job; returns the job's status."""
+    async with get_db() as db:
+        # Resumed jobs (watched_at cleared) keep running whether or not anyone follows them
+        await db.execute(
+            "UPDATE jobs SET watched_at = CURRENT_TIMESTAMP WHERE id = ? AND watched_at IS NOT NULL",
+            (job_id,)
+        )
+        await db.commit()
+        cursor = await db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+        row = await cursor.fetchone()
+    return row["status"] if row else None
+
+
+async def wait_for_end(job_id: str, timeout: float) -> Optional[str]:
+    """Poll until a job reaches a terminal status; returns it, or None on timeout."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    interval = 0.25
+    while True:
+        async with get_db() as db:
+            cursor = await db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,))
+            row = await cursor.fetchone()
+        if row and row["status"] in TERMINAL_STATUSES:
+            return row["status"]
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return None
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, 2.0)
+
+
+async def jobs_to_stop(job_ids: list[str], grace: float) -> dict[str, str]:
+    """Jobs with a pending cancel request, or that no client has followed for `grace` seconds."""
+    if not job_ids:
+        return {}
+    async with get_db() as db:
+        cursor = await db.execute(f"""
+            SELECT id, cancel_requested FROM jobs
+            WHERE id IN ({', '.join('?' * len(job_ids))})
+              AND (cancel_requested = 1 OR watched_at < datetime('now', ?))
+        """, (*job_ids, f"-{int(grace)} seconds"))
+        rows = await cursor.fetchall()
+    return {
+        row["id"]: "Cancelled by user" if row["cancel_requested"] else "Client disconnected"
+        for row in rows
+    }
+
+
+async def cancel_job(job_id: str, reason: str) -> bool:
+    """
+    Cancel a running job.
+
+    Kills the generation process tree, removes the job's temporary and
+    partial output files, and records the job as cancelled. Returns False
+    if no active job has the given ID.
+    """
+    job = _active_jobs.pop(job_id, None)
+    if job is None or job.finished:
+        return False
+
+    job.cancelled.set()
+    for hook in job.cancel_hooks:
+        hook()
+    if job.process is not None:
+        await terminate_process_tree(job.process)
+
+    # Only free the slot once the process tree is actually gone
+    finish_job(job)
+
+    shutil.rmtree(job.temp_dir, ignore_errors=True)
+    shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    await set_job_status(job_id, "cancelled", reason)
+    return True
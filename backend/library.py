@@ -1,14 +1,31 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
+import asyncio
+import tempfile
+
+from pydantic_core import to_json
 
 from database import get_db
-from schemas import Song, SongUpdate, SongList
+from schemas import Song, SongUpdate, SongList, ChangeList
+from audio import derive_full_mix
+from changes import (
+    CHANGES_PAGE_LIMIT, KEEPALIVE_SECONDS, change_feed, is_stale, record_change, retained_range
+)
+from sse import format_sse_event
+from remix import clear_remix_cache
+from storage import storage
 
 router = APIRouter()
 
+# Columns a listing can project; the Song fields map one-to-one onto the songs table
+SONG_COLUMNS = list(Song.model_fields)
+
+# Returned by default: enough to render a library row without lyrics or file paths
+SUMMARY_FIELDS = ["id", "title", "created_at", "duration_seconds", "stem_type", "model_version"]
+
 
 def row_to_song(row) -> Song:
     """Convert a database row to a Song model."""
@@ -24,16 +41,97 @@ def row_to_song(row) -> Song:
         output_vocal_path=row["output_vocal_path"],
         output_bgm_path=row["output_bgm_path"],
         duration_seconds=row["duration_seconds"],
-        model_version=row["model_version"]
+        model_version=row["model_version"],
+        parent_id=row["parent_id"],
+        version=row["version"],
+        take_group=row["take_group"],
+        take=row["take"]
     )
 
 
+def render_full_mix(song_id: str, vocal_location: str, bgm_location: str) -> Optional[str]:
+    """Mix a song's stems and store the result; returns its location."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        mix_path = Path(work_dir) / f"{song_id}_mix.mp3"
+        if not derive_full_mix(storage.fetch(vocal_location), storage.fetch(bgm_location), mix_path):
+            return None
+        return storage.put(mix_path, f"{song_id}/{mix_path.name}")
+
+
+async def resolve_audio_location(db, row, type: str) -> str:
+    """
+    Get the storage location of one audio variant of a song.
+
+    Songs that only have vocal and bgm stems get their full mix rendered
+    on first request and stored on the row.
+    """
+    if type == "vocal":
+        location = row["output_vocal_path"]
+    elif type == "bgm":
+        location = row["output_bgm_path"]
+    else:
+        location = row["output_path"]
+
+    if not location and type == "full" and row["output_vocal_path"] and row["output_bgm_path"]:
+        location = await asyncio.to_thread(
+            render_full_mix, row["id"], row["output_vocal_path"], row["output_bgm_path"]
+        )
+        if location:
+            await db.execute(
+                "UPDATE songs SET output_path = ? WHERE id = ?",
+                (location, row["id"])
+            )
+            await record_change(db, row["id"], "update")
+            await db.commit()
+            change_feed.publish()
+
+    if not location:
+        raise HTTPException(status_code=404, detail=f"No {type} audio available")
+
+    if not storage.exists(location):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    return location
+
+
+def parse_fields(fields: Optional[str]) -> list[str]:
+    """Resolve the fields= parameter to the columns to select; id is always included."""
+    if fields is None:
+        return SUMMARY_FIELDS
+    if fields.strip() == "all":
+        return SONG_COLUMNS
+
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in SONG_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Valid fields: {', '.join(SONG_COLUMNS)}"
+        )
+    return ["id"] + [name for name in dict.fromkeys(requested) if name != "id"]
+
+
+def row_to_summary(row) -> dict:
+    """Convert a projected row to a plain dict shaped like a Song."""
+    song = dict(row)
+    if "created_at" in song:
+        # Match Song's datetime serialization ("YYYY-MM-DDTHH:MM:SS")
+        created_at = song["created_at"]
+        song["created_at"] = created_at.replace(" ", "T", 1) if created_at else datetime.now().isoformat()
+    return song
+
+
 @router.get("/library", response_model=SongList)
 async def list_songs(
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     sort: str = Query("created_at"),
-    order: str = Query("desc")
+    order: str = Query("desc"),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated song fields to return, or 'all'. Defaults to a summary without lyrics or paths."
+    ),
+    take_group: Optional[str] = Query(None, description="Only the takes generated together in this group")
 ):
     """List all songs with pagination."""
     # Validate sort column
@@ -43,28 +141,128 @@ async def list_songs(
 
     order = "DESC" if order.lower() == "desc" else "ASC"
     offset = (page - 1) * limit
+    columns = parse_fields(fields)
+    where, params = ("WHERE take_group = ?", (take_group,)) if take_group else ("", ())
 
     async with get_db() as db:
         # Get total count
-        cursor = await db.execute("SELECT COUNT(*) as count FROM songs")
+        cursor = await db.execute(f"SELECT COUNT(*) as count FROM songs {where}", params)
         row = await cursor.fetchone()
         total = row["count"]
 
-        # Get paginated results
+        # Get paginated results, reading only the projected columns
         cursor = await db.execute(
-            f"SELECT * FROM songs ORDER BY {sort} {order} LIMIT ? OFFSET ?",
-            (limit, offset)
+            f"SELECT {', '.join(columns)} FROM songs {where} ORDER BY {sort} {order} LIMIT ? OFFSET ?",
+            (*params, limit, offset)
         )
         rows = await cursor.fetchall()
 
-        songs = [row_to_song(row) for row in rows]
-
-        return SongList(
-            songs=songs,
-            total=total,
-            page=page,
-            limit=limit
-        )
+    # Rows are already in wire shape, so skip building a model per song and serialize directly
+    body = to_json({
+        "songs": [row_to_summary(row) for row in rows],
+        "total": total,
+        "page": page,
+        "limit": limit
+    })
+    return Response(content=body, media_type="application/json")
+
+
+async def fetch_changes(db, since: int, columns: list[str], limit: int) -> list[dict]:
+    """Changes after `since`, oldest first, each with the song's current projected fields."""
+    cursor = await db.execute(
+        f"""
+        SELECT c.seq, c.op, c.song_id, c.changed_at, {', '.join(f's.{column}' for column in columns)}
+        FROM song_changes c LEFT JOIN songs s ON s.id = c.song_id
+        WHERE c.seq > ? ORDER BY c.seq LIMIT ?
+        """,
+        (since, limit)
+    )
+    changes = []
+    for row in await cursor.fetchall():
+        song = {column: row[column] for column in columns}
+        changes.append({
+            "seq": row["seq"],
+            "op": row["op"],
+            "song_id": row["song_id"],
+            "changed_at": row["changed_at"].replace(" ", "T", 1),
+            "song": row_to_summary(song) if song["id"] is not None else None
+        })
+    return changes
+
+
+@router.get("/library/changes", response_model=ChangeList)
+async def list_changes(
+    since: int = Query(0, ge=0, description="Return changes after this sequence number"),
+    limit: int = Query(CHANGES_PAGE_LIMIT, ge=1, le=CHANGES_PAGE_LIMIT),
+    fields: Optional[str] = Query(None, description="Song fields to include, as for /library")
+):
+    """Songs inserted, updated or deleted since a change sequence number."""
+    columns = parse_fields(fields)
+    async with get_db() as db:
+        first, last = await retained_range(db)
+        if is_stale(since, first, last):
+            changes, reset = [], True
+        else:
+            changes, reset = await fetch_changes(db, since, columns, limit + 1), False
+
+    body = to_json({
+        "changes": changes[:limit],
+        "last_seq": changes[:limit][-1]["seq"] if changes else (last if reset else since),
+        "has_more": len(changes) > limit,
+        "reset": reset
+    })
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/library/changes/stream")
+async def stream_changes(
+    since: Optional[int] = Query(None, ge=0, description="Replay changes after this sequence number first"),
+    fields: Optional[str] = Query(None, description="Song fields to include, as for /library"),
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Stream library changes as SSE.
+
+    Each change is a "change" event whose id is its sequence number, so
+    EventSource reconnects resume where they left off. The stream starts
+    with a "ready" event carrying the sequence number it starts from (load
+    the library after it), or "reset" if `since` is too old to replay.
+    """
+    columns = parse_fields(fields)
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def stream():
+        async with get_db() as db:
+            first, last = await retained_range(db)
+        if since is None:
+            seq, event = last, "ready"
+        elif is_stale(since, first, last):
+            seq, event = last, "reset"
+        else:
+            seq, event = since, "ready"
+        yield format_sse_event(event, {"last_seq": seq})
+
+        while True:
+            changed = change_feed.waiter()
+            # A connection per read rather than per stream, so idle dashboards hold no database handles
+            async with get_db() as db:
+                changes = await fetch_changes(db, seq, columns, CHANGES_PAGE_LIMIT)
+            for change in changes:
+                yield f"id: {change['seq']}\n" + format_sse_event("change", change)
+            if changes:
+                seq = changes[-1]["seq"]
+            elif not await change_feed.wait(changed, KEEPALIVE_SECONDS):
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
 
 
 @router.get("/library/{song_id}", response_model=Song)
@@ -103,7 +301,9 @@ async def update_song(song_id: str, update: SongUpdate):
                 "UPDATE songs SET title = ? WHERE id = ?",
                 (update.title, song_id)
             )
+            await record_change(db, song_id, "update")
             await db.commit()
+            change_feed.publish()
 
         # Return updated song
         cursor = await db.execute(
@@ -130,13 +330,15 @@ async def delete_song(song_id: str):
         # Delete audio files
         for path_col in ["output_path", "output_vocal_path", "output_bgm_path", "reference_audio_path"]:
             if row[path_col]:
-                path = Path(row[path_col])
-                if path.exists():
-                    path.unlink()
+                await asyncio.to_thread(storage.delete, row[path_col])
+        clear_remix_cache(song_id)
 
         # Delete from database
         await db.execute("DELETE FROM songs WHERE id = ?", (song_id,))
+        await db.execute("DELETE FROM song_features WHERE song_id = ?", (song_id,))
+        await record_change(db, song_id, "delete")
         await db.commit()
+        change_feed.publish()
 
         return {"status": "deleted", "id": song_id}
 
@@ -157,23 +359,10 @@ async def get_audio(
         if not row:
             raise HTTPException(status_code=404, detail="Song not found")
 
-        # Determine which path to use
-        if type == "vocal":
-            path = row["output_vocal_path"]
-        elif type == "bgm":
-            path = row["output_bgm_path"]
-        else:
-            path = row["output_path"]
-
-        if not path:
-            raise HTTPException(status_code=404, detail=f"No {type} audio available")
+        location = await resolve_audio_location(db, row, type)
 
-        file_path = Path(path)
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="Audio file not found")
-
-        return FileResponse(
-            file_path,
+        return storage.response(
+            location,
             media_type="audio/mpeg",
             filename=f"{row['title'] or song_id}_{type}.mp3"
         )
@@ -195,26 +384,13 @@ async def download_audio(
         if not row:
             raise HTTPException(status_code=404, detail="Song not found")
 
-        # Determine which path to use
-        if type == "vocal":
-            path = row["output_vocal_path"]
-        elif type == "bgm":
-            path = row["output_bgm_path"]
-        else:
-            path = row["output_path"]
-
-        if not path:
-            raise HTTPException(status_code=404, detail=f"No {type} audio available")
-
-        file_path = Path(path)
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="Audio file not found")
+        location = await resolve_audio_location(db, row, type)
 
         filename = f"{row['title'] or song_id}_{type}.mp3"
 
-        return FileResponse(
-            file_path,
+        return storage.response(
+            location,
             media_type="audio/mpeg",
             filename=filename,
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            attachment=True
         )
@@ -1,16 +1,71 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 
 from database import init_db
+from compression import JSONCompressionMiddleware
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize database on startup."""
     await init_db()
+
+    from settings import get_settings, apply_scheduler_settings
+    from executor import executor, save_snapshot, WEB_WORKERS
+    settings = await get_settings()
+    if settings.execution_mode == "remote" and WEB_WORKERS > 1:
+        raise RuntimeError("Remote execution needs a single server process (serve.py --workers 1)")
+
+    # Restore fair-share weights and execution mode for the generation scheduler
+    await apply_scheduler_settings()
+
+    background: list[asyncio.Task] = []
+
+    async def on_lead():
+        # This process runs generation jobs; set up everything that goes with them
+
+        # Fit run time predictions on past jobs
+        from estimator import estimator
+        await estimator.load()
+
+        # Local jobs are placed on GPUs by VRAM budget
+        from model_manager import model_manager
+        from scheduler import scheduler
+        await asyncio.to_thread(model_manager.configure)
+        scheduler.placer = model_manager
+
+        # Re-queue jobs held by workers that stop heartbeating
+        from workers import reap_expired_leases
+        background.append(asyncio.create_task(reap_expired_leases()))
+
+        # Extract feature vectors for songs created before similarity search existed
+        from features import backfill_features
+        background.append(asyncio.create_task(backfill_features()))
+
+    async def on_tick():
+        if WEB_WORKERS > 1:
+            # Pick up settings changed through other processes, and show them our in-memory state
+            from model_manager import model_manager
+            await apply_scheduler_settings()
+            await save_snapshot("queue", queue_status().model_dump_json())
+            await save_snapshot("models", model_manager.status().model_dump_json())
+
+    # Whichever process takes the executor lock runs every generation job
+    from generation import execute_job, queue_status
+    background.append(asyncio.create_task(executor.run(execute_job, on_lead, on_tick)))
+
+    if WEB_WORKERS > 1:
+        # Wake library change streams for songs changed by other processes
+        from changes import follow_changes
+        background.append(asyncio.create_task(follow_changes()))
+
     yield
 
+    for task in background:
+        task.cancel()
+
 
 app = FastAPI(
     title="SongGeneration Studio API",
@@ -28,6 +83,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gzip large JSON payloads (library listings); streams and audio pass through untouched
+app.add_middleware(JSONCompressionMiddleware)
+
 
 @app.get("/api/health")
 async def health_check():
@@ -38,13 +96,24 @@ async def health_check():
 # Import and include routers
 from settings import router as settings_router
 from library import router as library_router
+from features import router as features_router
 from models import router as models_router
 from generation import router as generation_router
+from remix import router as remix_router
+from workers import router as workers_router
+from model_manager import router as model_manager_router
+from accounting import router as accounting_router
 
 app.include_router(settings_router, prefix="/api", tags=["Settings"])
+# Before the library router so /library/duplicates isn't taken for a song id
+app.include_router(features_router, prefix="/api", tags=["Library"])
 app.include_router(library_router, prefix="/api", tags=["Library"])
 app.include_router(models_router, prefix="/api", tags=["Setup"])
 app.include_router(generation_router, prefix="/api", tags=["Generation"])
+app.include_router(model_manager_router, prefix="/api", tags=["Generation"])
+app.include_router(accounting_router, prefix="/api", tags=["Generation"])
+app.include_router(remix_router, prefix="/api", tags=["Library"])
+app.include_router(workers_router, prefix="/api", tags=["Workers"])
 
 
 if __name__ == "__main__":
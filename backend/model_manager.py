@@ -0,0 +1,211 @@
+from fastapi import APIRouter
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+import asyncio
+import os
+import subprocess
+
+from schemas import DeviceStatus, ResidentModel, ModelManagerStatus
+from executor import executor, load_snapshot
+import models
+
+router = APIRouter()
+
+# Peak VRAM of one generate.sh run per model variant (see README)
+MODEL_VRAM_GB = {
+    "SongGeneration-base": 10.0,
+    "SongGeneration-base-new": 10.0,
+    "SongGeneration-base-full": 12.0,
+    "SongGeneration-large": 22.0,
+}
+DEFAULT_VRAM_GB = 22.0
+
+# VRAM left free on each device for the driver and other processes
+VRAM_HEADROOM_GB = 1.0
+
+# Optional overrides: usable VRAM per device, and host RAM for keeping weights resident
+VRAM_BUDGET_GB = os.environ.get("SONGGEN_VRAM_BUDGET_GB")
+RAM_BUDGET_GB = os.environ.get("SONGGEN_RAM_BUDGET_GB")
+
+GB = 1024 ** 3
+
+
+def detect_devices() -> list[float]:
+    """Total VRAM (GB) of each visible GPU, via nvidia-smi."""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return []
+    if result.returncode != 0:
+        return []
+    return [float(line) / 1024 for line in result.stdout.split() if line.strip()]
+
+
+def physical_ram_gb() -> float:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / GB
+    except (ValueError, OSError, AttributeError):
+        return 0.0
+
+
+def model_files(model: str) -> list[Path]:
+    model_dir = models.MODELS_DIR / model
+    if not model_dir.exists():
+        return []
+    return [path for path in model_dir.rglob("*") if path.is_file()]
+
+
+def advise(paths: list[Path], advice: int) -> None:
+    """Apply a page-cache hint to whole files."""
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, advice)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class Device:
+    """A GPU and the jobs currently placed on it."""
+
+    def __init__(self, index: Optional[int], budget_gb: float):
+        self.index = index
+        self.budget_gb = budget_gb
+        self.jobs: dict[str, str] = {}  # job_id -> model
+        self.last_model: Optional[str] = None
+
+    @property
+    def used_gb(self) -> float:
+        return sum(model_vram_gb(model) for model in self.jobs.values())
+
+    def fits(self, model: str) -> bool:
+        # A device with nothing on it always takes a job, even one over budget,
+        # so an underestimated card degrades to one job at a time instead of stalling
+        return not self.jobs or self.used_gb + model_vram_gb(model) <= self.budget_gb
+
+
+def model_vram_gb(model: Optional[str]) -> float:
+    return MODEL_VRAM_GB.get(model or "", DEFAULT_VRAM_GB)
+
+
+class ModelManager:
+    """
+    Decides where generation jobs run and which model weights stay resident.
+
+    Every job runs in its own generate.sh process, so loading a model means
+    reading its checkpoint from disk into a fresh process. The manager keeps
+    the checkpoints of recently used models in the host page cache (up to a
+    RAM budget, least recently used evicted first) so those reads come from
+    memory, and places each job on a GPU with enough VRAM budget left for
+    its model, preferring the device that last ran the same model.
+    """
+
+    def __init__(self):
+        self.devices: list[Device] = [Device(None, float("inf"))]
+        self.ram_budget_gb = 0.0
+        self._resident: OrderedDict[str, float] = OrderedDict()  # model -> size in GB, LRU first
+        self._placements: dict[str, Device] = {}
+
+    def configure(self) -> None:
+        """Discover GPUs and budgets. Without nvidia-smi a single unbounded device is assumed."""
+        totals = detect_devices()
+        if totals:
+            self.devices = [
+                Device(i, float(VRAM_BUDGET_GB) if VRAM_BUDGET_GB else total - VRAM_HEADROOM_GB)
+                for i, total in enumerate(totals)
+            ]
+        self.ram_budget_gb = float(RAM_BUDGET_GB) if RAM_BUDGET_GB else physical_ram_gb() / 2
+
+    def place(self, job_id: str, model: Optional[str]) -> bool:
+        """Reserve VRAM for a job. Returns False if no device can take it right now."""
+        candidates = [device for device in self.devices if device.fits(model)]
+        if not candidates:
+            return False
+        # Same model as last time first, then the tightest fit, to leave room for large models
+        device = min(candidates, key=lambda d: (d.last_model != model, d.budget_gb - d.used_gb))
+        device.jobs[job_id] = model
+        device.last_model = model
+        self._placements[job_id] = device
+        return True
+
+    def reserve(self, job_id: str, model: Optional[str], device: Optional[int]) -> None:
+        """Record a job already running on a known device, whether or not it fits the budget."""
+        target = next((d for d in self.devices if d.index == device), self.devices[0])
+        target.jobs[job_id] = model
+        target.last_model = model
+        self._placements[job_id] = target
+
+    def release(self, job_id: str) -> None:
+        device = self._placements.pop(job_id, None)
+        if device is not None:
+            device.jobs.pop(job_id, None)
+
+    def device_for(self, job_id: str) -> Optional[int]:
+        """CUDA device index a placed job should run on (None if unknown)."""
+        device = self._placements.get(job_id)
+        return device.index if device else None
+
+    def make_resident(self, model: str) -> None:
+        """Pull a model's checkpoint into the page cache, evicting LRU models over budget."""
+        if not hasattr(os, "posix_fadvise"):
+            return
+        if model in self._resident:
+            self._resident.move_to_end(model)
+        else:
+            files = model_files(model)
+            self._resident[model] = sum(path.stat().st_size for path in files) / GB
+            advise(files, os.POSIX_FADV_WILLNEED)
+
+        while len(self._resident) > 1 and sum(self._resident.values()) > self.ram_budget_gb:
+            evicted, _ = self._resident.popitem(last=False)
+            if not any(evicted in device.jobs.values() for device in self.devices):
+                advise(model_files(evicted), os.POSIX_FADV_DONTNEED)
+
+    async def prepare(self, model: str) -> None:
+        """Warm a model's weights before its job starts."""
+        await asyncio.to_thread(self.make_resident, model)
+
+    def status(self) -> ModelManagerStatus:
+        return ModelManagerStatus(
+            ram_budget_gb=round(self.ram_budget_gb, 1),
+            resident=[
+                ResidentModel(model=model, size_gb=round(size, 2))
+                for model, size in reversed(self._resident.items())
+            ],
+            devices=[
+                DeviceStatus(
+                    index=device.index,
+                    budget_gb=None if device.budget_gb == float("inf") else round(device.budget_gb, 1),
+                    used_gb=device.used_gb,
+                    jobs=dict(device.jobs)
+                )
+                for device in self.devices
+            ]
+        )
+
+
+model_manager = ModelManager()
+
+
+@router.get("/generate/models", response_model=ModelManagerStatus)
+async def get_model_status():
+    """Show resident models and how jobs are placed on the GPUs."""
+    if executor.is_leader:
+        return model_manager.status()
+
+    # Placements live in the executor process, which publishes a snapshot every few seconds
+    snapshot = await load_snapshot("models")
+    if snapshot is None:
+        return ModelManagerStatus(ram_budget_gb=0.0, resident=[], devices=[])
+    return ModelManagerStatus.model_validate_json(snapshot)
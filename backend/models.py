@@ -6,6 +6,7 @@ import subprocess
 
 from database import get_db
 from schemas import SetupStatus, ModelDownloadRequest, ModelSelectRequest
+from shared import MODEL_REPOS
 from sse import format_sse_event
 
 router = APIRouter()
@@ -15,14 +16,6 @@ BASE_DIR = Path(__file__).parent.parent
 MODELS_DIR = BASE_DIR / "models"
 RUNTIME_DIR = MODELS_DIR / "runtime"
 
-# Model repository mapping
-MODEL_REPOS = {
-    "SongGeneration-base": "lglg666/SongGeneration-base",
-    "SongGeneration-base-new": "lglg666/SongGeneration-base-new",
-    "SongGeneration-base-full": "lglg666/SongGeneration-base-full",
-    "SongGeneration-large": "lglg666/SongGeneration-large",
-}
-
 RUNTIME_REPO = "lglg666/SongGeneration-Runtime"
 
 
@@ -0,0 +1,299 @@
+from pathlib import Path
+from typing import Optional
+import asyncio
+import re
+
+from models import MODEL_REPOS, get_installed_models, is_runtime_installed
+from schemas import PreflightIssue
+import workers
+
+# Section tags understood by SongGeneration
+VOCAL_SECTIONS = {"verse", "chorus", "bridge"}
+INSTRUMENTAL_SECTIONS = {
+    "intro-short", "intro-medium", "intro-long",
+    "outro-short", "outro-medium", "outro-long",
+    "inst-short", "inst-medium", "inst-long",
+    "silence",
+}
+
+# Values accepted for auto_prompt_audio_type
+AUTO_STYLES = [
+    "Pop", "R&B", "Dance", "Jazz", "Folk", "Rock", "Chinese Style",
+    "Chinese Tradition", "Metal", "Reggae", "Chinese Opera", "Auto",
+]
+
+# Description tag vocabulary
+GENDERS = {"female", "male"}
+TIMBRES = {
+    "dark", "bright", "warm", "soft", "clear", "deep", "husky", "breathy",
+    "raspy", "smooth", "powerful", "airy", "varies",
+}
+GENRES = {
+    "pop", "rock", "jazz", "blues", "folk", "country", "r&b", "soul", "funk",
+    "disco", "dance", "electronic", "edm", "house", "techno", "trance",
+    "hip-hop", "hip hop", "rap", "trap", "metal", "punk", "reggae", "latin",
+    "classical", "ambient", "indie", "lo-fi", "gospel", "k-pop", "j-pop",
+    "chinese style", "chinese tradition", "chinese opera", "folk rock",
+}
+MOODS = {
+    "happy", "sad", "energetic", "calm", "romantic", "angry", "melancholic",
+    "uplifting", "peaceful", "nostalgic", "dreamy", "emotional", "intense",
+    "relaxed", "hopeful", "inspirational", "dark", "epic", "playful",
+    "mysterious", "lonely", "joyful", "tender", "aggressive", "chill",
+}
+INSTRUMENTS = {
+    "piano", "drums", "guitar", "acoustic guitar", "electric guitar", "bass",
+    "synthesizer", "synth", "strings", "violin", "cello", "saxophone",
+    "trumpet", "flute", "organ", "harp", "ukulele", "percussion", "beats",
+    "brass", "choir", "pad", "accordion", "banjo", "erhu", "guzheng", "pipa",
+}
+DESCRIPTION_TAGS = GENDERS | TIMBRES | GENRES | MOODS | INSTRUMENTS
+
+BPM_PATTERN = re.compile(r"^the bpm is (\d+)$")
+MIN_BPM = 40
+MAX_BPM = 240
+
+SECTION_PATTERN = re.compile(r"^\[([^\[\]]+)\]\s*(.*)$", re.DOTALL)
+
+# SongGeneration only uses the first few seconds of the reference as the style prompt
+REFERENCE_PROMPT_SECONDS = 10.0
+MIN_REFERENCE_SECONDS = 1.0
+SILENCE_THRESHOLD_DB = -60.0
+PROBE_TIMEOUT_SECONDS = 15.0
+
+
+def check_lyrics(lyrics: str) -> list[PreflightIssue]:
+    """Validate the '[tag] text ; [tag] text' section structure."""
+    issues = []
+    sections = [s.strip() for s in lyrics.split(";")]
+
+    if not any(sections):
+        return [PreflightIssue(field="lyrics", code="empty", message="Lyrics are empty")]
+
+    for index, section in enumerate(sections, start=1):
+        if not section:
+            issues.append(PreflightIssue(
+                field="lyrics",
+                code="empty_section",
+                message=f"Section {index} is empty (stray ';'?)"
+            ))
+            continue
+
+        match = SECTION_PATTERN.match(section)
+        if not match:
+            issues.append(PreflightIssue(
+                field="lyrics",
+                code="malformed_section",
+                message=f"Section {index} must start with a [tag]: {section[:40]!r}"
+            ))
+            continue
+
+        tag, text = match.group(1).strip().lower(), match.group(2).strip()
+        if "[" in text or "]" in text:
+            issues.append(PreflightIssue(
+                field="lyrics",
+                code="malformed_section",
+                message=f"Section {index} ([{tag}]) contains a stray bracket; separate sections with ' ; '"
+            ))
+        elif tag in VOCAL_SECTIONS:
+            if not text:
+                issues.append(PreflightIssue(
+                    field="lyrics",
+                    code="missing_lyrics",
+                    message=f"Section {index} ([{tag}]) has no lyrics"
+                ))
+        elif tag in INSTRUMENTAL_SECTIONS:
+            if text:
+                issues.append(PreflightIssue(
+                    field="lyrics",
+                    code="unexpected_lyrics",
+                    message=f"Section {index} ([{tag}]) is instrumental and cannot have lyrics"
+                ))
+        else:
+            issues.append(PreflightIssue(
+                field="lyrics",
+                code="unknown_section",
+                message=f"Section {index} has unknown tag [{tag}]"
+            ))
+
+    return issues
+
+
+def check_description(description: str) -> list[PreflightIssue]:
+    """Validate comma-separated description tags against the known vocabulary."""
+    issues = []
+    tags = [t.strip().lower().rstrip(".") for t in description.split(",")]
+    tags = [t for t in tags if t]
+
+    if not tags:
+        return [PreflightIssue(field="description", code="empty", message="Description is empty")]
+
+    for tag in tags:
+        bpm = BPM_PATTERN.match(tag)
+        if bpm:
+            if not MIN_BPM <= int(bpm.group(1)) <= MAX_BPM:
+                issues.append(PreflightIssue(
+                    field="description",
+                    code="invalid_bpm",
+                    message=f"BPM must be between {MIN_BPM} and {MAX_BPM}"
+                ))
+            continue
+
+        # Instrument lists are joined with "and", e.g. "piano and drums"
+        parts = [tag] if tag in DESCRIPTION_TAGS else [p.strip() for p in tag.split(" and ")]
+        for part in parts:
+            if part not in DESCRIPTION_TAGS:
+                issues.append(PreflightIssue(
+                    field="description",
+                    code="unknown_tag",
+                    message=f"Unknown description tag: {part!r}"
+                ))
+
+    return issues
+
+
+def check_auto_style(auto_style: Optional[str], has_reference: bool) -> list[PreflightIssue]:
+    """Validate the auto style prompt type."""
+    if not auto_style:
+        return []
+    if has_reference:
+        return [PreflightIssue(
+            field="auto_style",
+            code="conflict",
+            message="Use either reference_audio or auto_style, not both"
+        )]
+    if auto_style not in AUTO_STYLES:
+        return [PreflightIssue(
+            field="auto_style",
+            code="unknown_style",
+            message=f"Unknown auto_style {auto_style!r}; expected one of: {', '.join(AUTO_STYLES)}"
+        )]
+    return []
+
+
+async def check_reference_audio(path: Path) -> list[PreflightIssue]:
+    """Decode the style prompt window of the reference and check it is long enough and not silent."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-nostats",
+            "-t", str(REFERENCE_PROMPT_SECONDS), "-i", str(path),
+            "-af", "volumedetect", "-f", "null", "-",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=PROBE_TIMEOUT_SECONDS)
+    except FileNotFoundError:
+        return [PreflightIssue(
+            field="reference_audio",
+            code="probe_unavailable",
+            message="ffmpeg not found; cannot inspect reference audio"
+        )]
+    except asyncio.TimeoutError:
+        process.kill()
+        return [PreflightIssue(
+            field="reference_audio",
+            code="undecodable",
+            message="Reference audio took too long to decode"
+        )]
+
+    output = stderr.decode(errors="replace")
+    max_volume = re.search(r"max_volume:\s*(-?[\d.]+|-inf) dB", output)
+    if process.returncode != 0 or not max_volume:
+        return [PreflightIssue(
+            field="reference_audio",
+            code="undecodable",
+            message="Reference audio could not be decoded"
+        )]
+
+    issues = []
+    duration = re.search(r"Duration:\s*(\d+):(\d+):([\d.]+)", output)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        total = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+        if total < MIN_REFERENCE_SECONDS:
+            issues.append(PreflightIssue(
+                field="reference_audio",
+                code="too_short",
+                message=f"Reference audio is {total:.1f}s; at least {MIN_REFERENCE_SECONDS:.0f}s is required"
+            ))
+
+    peak = max_volume.group(1)
+    if peak == "-inf" or float(peak) <= SILENCE_THRESHOLD_DB:
+        issues.append(PreflightIssue(
+            field="reference_audio",
+            code="silent",
+            message=f"The first {REFERENCE_PROMPT_SECONDS:.0f}s of the reference audio are silent"
+        ))
+
+    return issues
+
+
+def check_model(current_model: Optional[str], songgen_dir: Path, remote: bool = False) -> list[PreflightIssue]:
+    """
+    Confirm the selected model, runtime files and generation script are installed.
+
+    In remote mode the files live on the workers, so only check that the
+    model is known and that some worker is registered.
+    """
+    issues = []
+    if not current_model:
+        issues.append(PreflightIssue(
+            field="model",
+            code="not_selected",
+            message="No model selected. Please download and select a model first."
+        ))
+    elif remote:
+        if current_model not in MODEL_REPOS:
+            issues.append(PreflightIssue(
+                field="model",
+                code="unknown_model",
+                message=f"Unknown model: {current_model}"
+            ))
+        if not workers.has_workers():
+            issues.append(PreflightIssue(
+                field="model",
+                code="no_workers",
+                message="No GPU workers are registered"
+            ))
+        return issues
+    elif current_model not in get_installed_models():
+        issues.append(PreflightIssue(
+            field="model",
+            code="not_installed",
+            message=f"Model not found: {current_model}"
+        ))
+
+    if not is_runtime_installed():
+        issues.append(PreflightIssue(
+            field="model",
+            code="runtime_missing",
+            message="Runtime files are missing under models/runtime"
+        ))
+
+    if not (songgen_dir / "generate.sh").exists():
+        issues.append(PreflightIssue(
+            field="model",
+            code="songgen_missing",
+            message=f"generate.sh not found in {songgen_dir}"
+        ))
+
+    return issues
+
+
+async def run_preflight(
+    lyrics: str,
+    description: str,
+    auto_style: Optional[str],
+    reference_path: Optional[Path],
+    current_model: Optional[str],
+    songgen_dir: Path,
+    remote: bool = False
+) -> list[PreflightIssue]:
+    """Run every cheap check that would otherwise only fail after the model has loaded."""
+    issues = check_model(current_model, songgen_dir, remote)
+    issues += check_lyrics(lyrics)
+    issues += check_description(description)
+    issues += check_auto_style(auto_style, reference_path is not None)
+    if reference_path is not None:
+        issues += await check_reference_audio(reference_path)
+    return issues
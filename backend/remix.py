@@ -0,0 +1,244 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+from database import get_db
+from audio import SAMPLE_RATE, CHANNELS, db_to_gain, limit
+from storage import storage
+
+router = APIRouter()
+
+# Paths
+BASE_DIR = Path(__file__).parent.parent
+REMIX_CACHE_DIR = BASE_DIR / "data" / "remix_cache"
+
+# Cached renders are evicted, least recently served first, beyond this size
+REMIX_CACHE_MB = int(os.environ.get("SONGGEN_REMIX_CACHE_MB", "1024"))
+
+# Frames mixed and handed to the encoder at a time (0.5s)
+CHUNK_FRAMES = SAMPLE_RATE // 2
+READ_SIZE = 32 * 1024
+
+
+def pan_gains(pan: float) -> np.ndarray:
+    """Constant-power (left, right) gains for a pan position in [-1, 1], unity at center."""
+    angle = (pan + 1.0) * np.pi / 4.0
+    return np.array([np.cos(angle), np.sin(angle)], dtype=np.float32) * np.sqrt(2.0, dtype=np.float32)
+
+
+def remix_cache_path(song_id: str, stems: list[str], params: dict) -> Path:
+    """Cache file for a render; keyed on the parameters and the stem locations it was made from."""
+    key = json.dumps({"params": params, "stems": stems}, sort_keys=True)
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return REMIX_CACHE_DIR / f"{song_id}_{digest}.mp3"
+
+
+def evict_remix_cache(keep: Path, limit_bytes: int = REMIX_CACHE_MB * 1024 * 1024) -> None:
+    """Delete least recently served renders (never `keep`) until the cache fits in `limit_bytes`."""
+    entries = []
+    for path in REMIX_CACHE_DIR.glob("*.mp3"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # Deleted by a concurrent eviction
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= limit_bytes:
+            break
+        if path != keep:
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def clear_remix_cache(song_id: str) -> None:
+    """Delete every cached remix of a song."""
+    if REMIX_CACHE_DIR.exists():
+        for path in REMIX_CACHE_DIR.glob(f"{song_id}_*.mp3"):
+            path.unlink(missing_ok=True)
+
+
+async def start_decoder(path: Path) -> asyncio.subprocess.Process:
+    """ffmpeg decoding a stem to float32 samples on its stdout."""
+    return await asyncio.create_subprocess_exec(
+        "ffmpeg", "-v", "error", "-i", str(path),
+        "-f", "f32le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "pipe:1",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+
+
+async def read_frames(decoder: asyncio.subprocess.Process, frames: int) -> np.ndarray:
+    """The decoder's next `frames` frames; fewer at the end of the stem, none after it."""
+    try:
+        data = await decoder.stdout.readexactly(frames * CHANNELS * 4)
+    except asyncio.IncompleteReadError as e:
+        data = e.partial
+    usable = len(data) - len(data) % (CHANNELS * 4)
+    return np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, CHANNELS)
+
+
+def mix_chunk(
+    vocal: np.ndarray,
+    bgm: np.ndarray,
+    start: int,
+    vocal_gains: np.ndarray,
+    bgm_gains: np.ndarray,
+    fade_in_frames: int
+) -> np.ndarray:
+    """Mix the stems' frames starting at frame `start` of the song, fading in if still within the fade."""
+    mix = np.zeros((max(len(vocal), len(bgm)), CHANNELS), dtype=np.float32)
+    mix[:len(vocal)] += vocal * vocal_gains
+    mix[:len(bgm)] += bgm * bgm_gains
+
+    if fade_in_frames and start < fade_in_frames:
+        frames = np.arange(start, start + len(mix), dtype=np.float32)
+        mix *= np.clip(frames / fade_in_frames, 0.0, 1.0)[:, None]
+    return mix
+
+
+def fade_out_tail(tail: np.ndarray, total: int, fade_out_frames: int) -> np.ndarray:
+    """Apply the fade-out to the last frames of a song `total` frames long."""
+    frames = np.arange(total - len(tail), total, dtype=np.float32)
+    return tail * np.clip((total - frames) / fade_out_frames, 0.0, 1.0)[:, None]
+
+
+@router.get("/library/{song_id}/remix")
+async def remix_song(
+    song_id: str,
+    vocal_gain: float = Query(0.0, ge=-60.0, le=12.0, description="Vocal gain in dB"),
+    vocal_pan: float = Query(0.0, ge=-1.0, le=1.0),
+    bgm_gain: float = Query(0.0, ge=-60.0, le=12.0, description="Accompaniment gain in dB"),
+    bgm_pan: float = Query(0.0, ge=-1.0, le=1.0),
+    fade_in: float = Query(0.0, ge=0.0, le=30.0, description="Fade-in length in seconds"),
+    fade_out: float = Query(0.0, ge=0.0, le=30.0, description="Fade-out length in seconds")
+):
+    """Stream an MP3 remix of a song's vocal and accompaniment stems."""
+    async with get_db() as db:
+        cursor = await db.execute(
+            "SELECT * FROM songs WHERE id = ?",
+            (song_id,)
+        )
+        row = await cursor.fetchone()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Song not found")
+    if not row["output_vocal_path"] or not row["output_bgm_path"]:
+        raise HTTPException(status_code=404, detail="Song has no separate stems to remix")
+
+    if not storage.exists(row["output_vocal_path"]) or not storage.exists(row["output_bgm_path"]):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    # Round so that near-identical slider positions share a cache entry
+    params = {
+        "vocal_gain": round(vocal_gain, 1),
+        "vocal_pan": round(vocal_pan, 2),
+        "bgm_gain": round(bgm_gain, 1),
+        "bgm_pan": round(bgm_pan, 2),
+        "fade_in": round(fade_in, 2),
+        "fade_out": round(fade_out, 2),
+    }
+    cache_path = remix_cache_path(song_id, [row["output_vocal_path"], row["output_bgm_path"]], params)
+    filename = f"{row['title'] or song_id}_remix.mp3"
+
+    try:
+        # The modification time doubles as the last use, for eviction
+        os.utime(cache_path)
+        return FileResponse(cache_path, media_type="audio/mpeg", filename=filename)
+    except FileNotFoundError:
+        pass
+
+    try:
+        vocal_path, bgm_path = await asyncio.gather(
+            asyncio.to_thread(storage.fetch, row["output_vocal_path"]),
+            asyncio.to_thread(storage.fetch, row["output_bgm_path"])
+        )
+    except OSError:
+        # Gone since the existence check; still time for a 404 before the stream starts
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    vocal_gains = pan_gains(params["vocal_pan"]) * db_to_gain(params["vocal_gain"])
+    bgm_gains = pan_gains(params["bgm_pan"]) * db_to_gain(params["bgm_gain"])
+    fade_in_frames = int(params["fade_in"] * SAMPLE_RATE)
+    fade_out_frames = int(params["fade_out"] * SAMPLE_RATE)
+
+    async def stream():
+        REMIX_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        partial_path = cache_path.with_suffix(f".{uuid.uuid4().hex[:8]}.part")
+
+        decoders = [await start_decoder(vocal_path), await start_decoder(bgm_path)]
+        encoder = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-v", "error",
+            "-f", "f32le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), "-i", "pipe:0",
+            "-codec:a", "libmp3lame", "-qscale:a", "2", "-f", "mp3", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+
+        async def feed():
+            # Decode and mix chunk by chunk so the encoder can start emitting frames immediately.
+            # The song's length is only known at the end, so the last fade_out_frames are held back.
+            held = np.zeros((0, CHANNELS), dtype=np.float32)
+            position = 0
+            while True:
+                vocal, bgm = await asyncio.gather(*(read_frames(d, CHUNK_FRAMES) for d in decoders))
+                if not len(vocal) and not len(bgm):
+                    break
+                chunk = mix_chunk(vocal, bgm, position, vocal_gains, bgm_gains, fade_in_frames)
+                position += len(chunk)
+                held = np.concatenate([held, chunk])
+                ready = len(held) - fade_out_frames
+                if ready > 0:
+                    encoder.stdin.write(limit(held[:ready]).tobytes())
+                    held = held[ready:]
+                    await encoder.stdin.drain()
+            if fade_out_frames:
+                held = fade_out_tail(held, position, fade_out_frames)
+            encoder.stdin.write(limit(held).tobytes())
+            await encoder.stdin.drain()
+            encoder.stdin.close()
+            for decoder in decoders:
+                if await decoder.wait() != 0:
+                    raise RuntimeError("Could not decode a stem")
+
+        feeder = asyncio.create_task(feed())
+        completed = False
+        try:
+            with open(partial_path, "wb") as cache_file:
+                while True:
+                    data = await encoder.stdout.read(READ_SIZE)
+                    if not data:
+                        break
+                    cache_file.write(data)
+                    yield data
+
+            await feeder
+            await encoder.wait()
+            if encoder.returncode == 0:
+                partial_path.replace(cache_path)
+                completed = True
+                evict_remix_cache(cache_path)
+        finally:
+            if not completed:
+                feeder.cancel()
+                for process in (encoder, *decoders):
+                    if process.returncode is None:
+                        process.kill()
+                partial_path.unlink(missing_ok=True)
+
+    return StreamingResponse(
+        stream(),
+        media_type="audio/mpeg",
+        headers={
+            "Cache-Control": "no-cache",
+            "Content-Disposition": f'inline; filename="{filename}"',
+        }
+    )
@@ -0,0 +1,236 @@
+from typing import Callable, Optional, Protocol
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+# Number of generate.sh processes allowed to run at once. With more than one,
+# the placer (the model manager) decides whether a job's model fits in VRAM.
+GPU_SLOTS = int(os.environ.get("SONGGEN_GPU_SLOTS", "1"))
+
+# Lower rank is dispatched first
+PRIORITY_RANKS = {
+    "interactive": 0,
+    "batch": 1,
+    "background": 2,
+}
+
+# A queued job is promoted one priority class for every AGING_SECONDS it waits,
+# so batch and background work cannot be starved by a steady interactive stream
+AGING_SECONDS = 600.0
+
+DEFAULT_OWNER_WEIGHT = 1.0
+
+
+class Placer(Protocol):
+    """Reserves GPU resources for a job before it is dispatched."""
+
+    def place(self, job_id: str, model: Optional[str]) -> bool: ...
+
+    def reserve(self, job_id: str, model: Optional[str], device: Optional[int]) -> None: ...
+
+    def release(self, job_id: str) -> None: ...
+
+
+class Ticket:
+    """A job's place in the scheduler queue."""
+
+    def __init__(
+        self,
+        job_id: str,
+        owner: str,
+        priority: str,
+        seq: int,
+        model: Optional[str] = None,
+        estimated_seconds: float = 0.0
+    ):
+        self.job_id = job_id
+        self.owner = owner
+        self.priority = priority
+        self.seq = seq
+        self.model = model
+        self.estimated_seconds = estimated_seconds
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.dispatched = asyncio.Event()
+
+    def effective_rank(self, now: float) -> int:
+        """Priority rank after aging."""
+        promoted = int((now - self.enqueued_at) // AGING_SECONDS)
+        return max(0, PRIORITY_RANKS[self.priority] - promoted)
+
+
+class FairShareScheduler:
+    """
+    Dispatches queued jobs onto a fixed number of GPU slots.
+
+    Jobs are ordered by priority class (with aging), then by weighted fair
+    share: each owner accumulates GPU seconds divided by their weight, and
+    the owner with the least normalized usage goes next. Within an owner,
+    jobs run in submission order.
+    """
+
+    def __init__(self, slots: int = GPU_SLOTS):
+        self.slots = slots
+        # "fair": within a priority class, the owner with the least weighted usage goes first.
+        # "shortest_first": the job with the shortest predicted run goes first; time spent
+        # waiting counts against the prediction so long jobs still get their turn.
+        self.policy = "fair"
+        self.placer: Optional[Placer] = None
+        self.owner_weights: dict[str, float] = {}
+        self._usage: dict[str, float] = {}
+        self._queue: list[Ticket] = []
+        self._running: dict[str, Ticket] = {}
+        self._seq = itertools.count()
+
+    def set_owner_weights(self, weights: dict[str, float]) -> None:
+        """Replace the per-owner share weights."""
+        self.owner_weights = {k: v for k, v in weights.items() if v > 0}
+
+    def _weight(self, owner: str) -> float:
+        return self.owner_weights.get(owner, DEFAULT_OWNER_WEIGHT)
+
+    def submit(
+        self,
+        job_id: str,
+        owner: str,
+        priority: str,
+        model: Optional[str] = None,
+        estimated_seconds: float = 0.0
+    ) -> Ticket:
+        """Queue a job and dispatch it immediately if a slot is free."""
+        if owner not in self._usage:
+            # Newcomers start level with the least-served active owner rather
+            # than at zero, so they can't monopolize the GPU to "catch up"
+            now = time.monotonic()
+            active = {t.owner for t in self._queue} | {t.owner for t in self._running.values()}
+            self._usage[owner] = min(
+                (self._current_usage(o, now) for o in active),
+                default=0.0
+            )
+
+        ticket = Ticket(job_id, owner, priority, next(self._seq), model, estimated_seconds)
+        self._queue.append(ticket)
+        self._dispatch()
+        return ticket
+
+    def adopt(
+        self,
+        job_id: str,
+        owner: str,
+        priority: str,
+        model: Optional[str] = None,
+        device: Optional[int] = None
+    ) -> Ticket:
+        """
+        Count a job whose process is already running as dispatched, ignoring the slot limit.
+
+        Used for jobs resumed after a server restart: their generate.sh kept
+        running, so the GPU is in use whether or not a slot is free.
+        """
+        ticket = Ticket(job_id, owner, priority, next(self._seq), model)
+        if self.placer is not None:
+            self.placer.reserve(job_id, model, device)
+        ticket.started_at = time.monotonic()
+        self._running[job_id] = ticket
+        ticket.dispatched.set()
+        return ticket
+
+    def withdraw(self, ticket: Ticket) -> None:
+        """Remove a job that has not been dispatched yet."""
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the slot held by a dispatched job and charge its owner."""
+        if self._running.pop(ticket.job_id, None) is None:
+            return
+        if self.placer is not None:
+            self.placer.release(ticket.job_id)
+        elapsed = time.monotonic() - (ticket.started_at or time.monotonic())
+        self._usage[ticket.owner] = self._usage.get(ticket.owner, 0.0) + elapsed / self._weight(ticket.owner)
+        self._dispatch()
+
+    def position(self, ticket: Ticket) -> int:
+        """Number of queued jobs that would be dispatched before this one (0 if running)."""
+        if ticket.dispatched.is_set():
+            return 0
+        order = self._ordered()
+        return order.index(ticket) if ticket in order else 0
+
+    def estimated_wait(self, ticket: Ticket) -> float:
+        """Predicted seconds until a queued job is dispatched, from the run time estimates."""
+        if ticket.dispatched.is_set():
+            return 0.0
+        now = time.monotonic()
+
+        # When each slot frees up, then hand slots out in dispatch order
+        free_at = [
+            max(0.0, t.estimated_seconds - (now - (t.started_at or now)))
+            for t in self._running.values()
+        ]
+        free_at += [0.0] * max(0, max(self.slots, 1) - len(free_at))
+        heapq.heapify(free_at)
+        for queued in self._ordered():
+            start = heapq.heappop(free_at)
+            if queued is ticket:
+                return start
+            heapq.heappush(free_at, start + queued.estimated_seconds)
+        return 0.0
+
+    def snapshot(self) -> tuple[list[Ticket], list[Ticket]]:
+        """Running tickets and queued tickets in dispatch order."""
+        return list(self._running.values()), self._ordered()
+
+    def _current_usage(self, owner: str, now: float) -> float:
+        """Charged usage plus the time the owner's running jobs have held slots so far."""
+        in_flight = sum(
+            now - t.started_at
+            for t in self._running.values()
+            if t.owner == owner and t.started_at is not None
+        )
+        return self._usage.get(owner, 0.0) + in_flight / self._weight(owner)
+
+    def _ordered(self) -> list[Ticket]:
+        now = time.monotonic()
+        if self.policy == "shortest_first":
+            return sorted(
+                self._queue,
+                key=lambda t: (t.effective_rank(now), t.estimated_seconds - (now - t.enqueued_at), t.seq)
+            )
+
+        usage = {t.owner: self._current_usage(t.owner, now) for t in self._queue}
+        return sorted(
+            self._queue,
+            key=lambda t: (t.effective_rank(now), usage[t.owner], t.seq)
+        )
+
+    def take_next(self, runnable: Callable[[Ticket], bool]) -> Optional[Ticket]:
+        """
+        Dispatch the best queued ticket that satisfies `runnable`, ignoring the slot limit.
+
+        Used when remote workers pull jobs and capacity is theirs to manage.
+        """
+        for ticket in self._ordered():
+            if runnable(ticket):
+                self._queue.remove(ticket)
+                ticket.started_at = time.monotonic()
+                self._running[ticket.job_id] = ticket
+                ticket.dispatched.set()
+                return ticket
+        return None
+
+    def _dispatch(self) -> None:
+        while self._queue and len(self._running) < self.slots:
+            ticket = self._ordered()[0]
+            # The head waits for room rather than letting smaller jobs overtake it
+            if self.placer is not None and not self.placer.place(ticket.job_id, ticket.model):
+                break
+            self._queue.remove(ticket)
+            ticket.started_at = time.monotonic()
+            self._running[ticket.job_id] = ticket
+            ticket.dispatched.set()
+
+
+scheduler = FairShareScheduler()
@@ -4,17 +4,29 @@ from datetime import datetime
 
 
 # Settings schemas
+ExecutionMode = Literal["local", "remote"]  # remote: jobs run on registered GPU workers
+SchedulingPolicy = Literal["fair", "shortest_first"]
+
+
 class Settings(BaseModel):
     low_mem: bool = False
     flash_attn: bool = True
     output_dir: str = "./data/outputs"
     current_model: Optional[str] = None
+    owner_weights: dict[str, float] = {}  # Fair-share weight per job owner
+    always_separate: bool = False  # Generate stems and derive the full mix
+    execution_mode: ExecutionMode = "local"
+    scheduling_policy: SchedulingPolicy = "fair"
 
 
 class SettingsUpdate(BaseModel):
     low_mem: Optional[bool] = None
     flash_attn: Optional[bool] = None
     output_dir: Optional[str] = None
+    owner_weights: Optional[dict[str, float]] = None
+    always_separate: Optional[bool] = None
+    execution_mode: Optional[ExecutionMode] = None
+    scheduling_policy: Optional[SchedulingPolicy] = None
 
 
 class GPUInfo(BaseModel):
@@ -63,6 +75,10 @@ class Song(BaseModel):
     output_bgm_path: Optional[str] = None
     duration_seconds: Optional[float] = None
     model_version: Optional[str] = None
+    parent_id: Optional[str] = None  # First version of the song, for regenerated versions
+    version: int = 1
+    take_group: Optional[str] = None  # First take's id, for takes generated together
+    take: Optional[int] = None
 
 
 class SongCreate(BaseModel):
@@ -76,31 +92,205 @@ class SongUpdate(BaseModel):
     title: Optional[str] = None
 
 
+class SongSummary(BaseModel):
+    """A library listing entry; only the requested fields are present."""
+    id: str
+    title: Optional[str] = None
+    created_at: Optional[datetime] = None
+    lyrics: Optional[str] = None
+    description: Optional[str] = None
+    reference_audio_path: Optional[str] = None
+    stem_type: Optional[StemType] = None
+    output_path: Optional[str] = None
+    output_vocal_path: Optional[str] = None
+    output_bgm_path: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    model_version: Optional[str] = None
+    parent_id: Optional[str] = None
+    version: Optional[int] = None
+    take_group: Optional[str] = None
+    take: Optional[int] = None
+
+
 class SongList(BaseModel):
-    songs: list[Song]
+    songs: list[SongSummary]
     total: int
     page: int
     limit: int
 
 
+ChangeOp = Literal["insert", "update", "delete"]
+
+
+class SongChange(BaseModel):
+    """One entry of the library change feed; song is its current state (None once deleted)."""
+    seq: int
+    op: ChangeOp
+    song_id: str
+    changed_at: datetime
+    song: Optional[SongSummary] = None
+
+
+class ChangeList(BaseModel):
+    changes: list[SongChange]
+    last_seq: int
+    has_more: bool
+    reset: bool = False  # The client is too far behind; reload the library and continue from last_seq
+
+
+class SimilarSong(BaseModel):
+    id: str
+    title: Optional[str] = None
+    similarity: float
+
+
+class SimilarSongs(BaseModel):
+    song_id: str
+    results: list[SimilarSong]
+
+
+class DuplicatePair(BaseModel):
+    song_id: str
+    other_id: str
+    similarity: float
+
+
+class DuplicateList(BaseModel):
+    threshold: float
+    pairs: list[DuplicatePair]
+
 # Generation schemas
+PriorityClass = Literal["interactive", "batch", "background"]
+
+
 class GenerationRequest(BaseModel):
     lyrics: str = Field(..., description="Formatted lyric string with sections")
     description: str = Field(..., description="Style description string")
     stem_type: StemType = "full"
     title: Optional[str] = None
     auto_style: Optional[str] = None  # Alternative to reference_audio
+    priority: PriorityClass = "interactive"
+    owner: Optional[str] = None
+    model: Optional[str] = None  # Defaults to the selected model
+    segmented: bool = False  # Generate sections in parallel and stitch them (long songs)
+    takes: int = Field(1, ge=1)  # Variations generated in one run, each saved as a song
 
 
 class GenerationStatus(BaseModel):
     job_id: str
-    status: Literal["preparing", "generating", "converting", "done", "error"]
+    status: Literal["preparing", "queued", "generating", "converting", "done", "error", "cancelled"]
     progress: Optional[float] = None
     message: str
     song_id: Optional[str] = None
 
 
+class PreflightIssue(BaseModel):
+    field: str
+    code: str
+    message: str
+
+
+class PreflightResult(BaseModel):
+    ok: bool
+    errors: list[PreflightIssue]
+
+
+class QueueEntry(BaseModel):
+    job_id: str
+    owner: str
+    priority: PriorityClass
+    model: Optional[str] = None
+    status: Literal["queued", "generating"]
+    position: int
+    estimated_seconds: float  # Predicted run time
+    eta_seconds: float  # Predicted time until the job finishes, including any wait
+
+
+class QueueStatus(BaseModel):
+    slots: int
+    policy: SchedulingPolicy
+    running: list[QueueEntry]
+    queued: list[QueueEntry]
+
+
+class DeviceStatus(BaseModel):
+    index: Optional[int] = None
+    budget_gb: Optional[float] = None  # None when VRAM is unknown
+    used_gb: float
+    jobs: dict[str, str]  # job_id -> model
+
+
+class ResidentModel(BaseModel):
+    model: str
+    size_gb: float
+
+
+class ModelManagerStatus(BaseModel):
+    ram_budget_gb: float
+    resident: list[ResidentModel]  # Most recently used first
+    devices: list[DeviceStatus]
+
+
+class JobResources(BaseModel):
+    job_id: str
+    model: Optional[str] = None
+    stem_type: Optional[str] = None
+    flags: list[str]
+    takes: int = 1
+    remote: bool  # generate.sh ran on a worker; only the local encoding stage was sampled
+    status: str
+    wall_seconds: float
+    # None where processes can't be sampled (no /proc)
+    cpu_seconds: Optional[float] = None
+    peak_rss_mb: Optional[float] = None
+    peak_vram_mb: dict[str, float] = {}  # GPU index -> peak
+    written_mb: Optional[float] = None  # Bytes written to disk
+
+
+class ResourceProfile(BaseModel):
+    model: Optional[str] = None
+    flags: list[str]
+    takes: int = 1
+    remote: bool
+    jobs: int
+    unfinished: int  # Failed or cancelled
+    avg_wall_seconds: Optional[float] = None
+    avg_cpu_seconds: Optional[float] = None
+    max_cpu_seconds: Optional[float] = None
+    avg_peak_rss_mb: Optional[float] = None
+    max_peak_rss_mb: Optional[float] = None
+    avg_peak_vram_mb: Optional[float] = None  # Busiest GPU of each job
+    max_peak_vram_mb: Optional[float] = None
+    avg_written_mb: Optional[float] = None
+
+
+class ResourceSummary(BaseModel):
+    profiles: list[ResourceProfile]  # Most common first
+
+
 # SSE Event schemas
 class SSEEvent(BaseModel):
     event: str
     data: dict
+
+
+# Worker schemas
+class WorkerRegistration(BaseModel):
+    name: str
+    slots: int = Field(1, ge=1)
+    models: list[str] = []  # Models installed on the worker; empty means any
+
+
+class WorkerInfo(BaseModel):
+    worker_id: str
+    heartbeat_seconds: float
+    lease_ttl_seconds: float
+
+
+class WorkerEvent(BaseModel):
+    event: str
+    data: dict
+
+
+class WorkerEvents(BaseModel):
+    events: list[WorkerEvent]
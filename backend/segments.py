@@ -0,0 +1,154 @@
+from pathlib import Path
+
+import numpy as np
+
+from audio import SAMPLE_RATE, decode_audio, encode_wav, headroom_gain, limit, sum_stems
+from preflight import SECTION_PATTERN, INSTRUMENTAL_SECTIONS
+
+# Segments are generated as separate jobs, so no more than this many at once
+MAX_SEGMENTS = 4
+
+# Rough length of instrumental sections, in the same units as lyric characters
+INSTRUMENTAL_WEIGHTS = {"short": 60, "medium": 120, "long": 240}
+SILENCE_WEIGHT = 10
+
+# Overlap between consecutive segments
+CROSSFADE_SECONDS = 1.5
+
+# Loudness matching never moves a segment by more than this
+MAX_GAIN_DB = 6.0
+
+SECTION_SEPARATOR = " ; "
+
+
+def split_sections(lyrics: str) -> list[str]:
+    return [section.strip() for section in lyrics.split(";") if section.strip()]
+
+
+def section_weight(section: str) -> int:
+    """Approximate length of a section, for balancing segments."""
+    match = SECTION_PATTERN.match(section)
+    if not match:
+        return len(section)
+    tag, text = match.group(1).strip().lower(), match.group(2).strip()
+    if tag == "silence":
+        return SILENCE_WEIGHT
+    if tag in INSTRUMENTAL_SECTIONS:
+        return INSTRUMENTAL_WEIGHTS.get(tag.rsplit("-", 1)[-1], INSTRUMENTAL_WEIGHTS["medium"])
+    return max(len(text), 1)
+
+
+def plan_segments(lyrics: str, count: int) -> list[str]:
+    """Split lyrics at section boundaries into up to `count` runs of roughly equal length."""
+    sections = split_sections(lyrics)
+    count = min(count, len(sections))
+    if count < 2:
+        return [lyrics]
+
+    weights = [section_weight(section) for section in sections]
+    total = sum(weights)
+    groups: list[list[str]] = []
+    current: list[str] = []
+    accumulated = 0
+    for index, (section, weight) in enumerate(zip(sections, weights)):
+        current.append(section)
+        accumulated += weight
+        sections_left = len(sections) - index - 1
+        groups_left = count - len(groups) - 1
+        if groups_left > 0 and sections_left > 0 and (
+            accumulated >= total * (len(groups) + 1) / count or sections_left == groups_left
+        ):
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+
+    return [SECTION_SEPARATOR.join(group) for group in groups]
+
+
+def stem_kind(path: Path) -> str:
+    """Classify an output file the same way the library does: vocal, bgm or full."""
+    stem = path.stem.lower()
+    if "vocal" in stem:
+        return "vocal"
+    if "bgm" in stem or "instrumental" in stem:
+        return "bgm"
+    return "full"
+
+
+def rms(samples: np.ndarray) -> float:
+    return float(np.sqrt(np.mean(np.square(samples, dtype=np.float64)))) if len(samples) else 0.0
+
+
+def loudness_gains(references: list[np.ndarray]) -> np.ndarray:
+    """Per-segment gains that bring every segment to the median loudness."""
+    levels = np.array([rms(reference) for reference in references])
+    target = np.median(levels[levels > 0]) if np.any(levels > 0) else 0.0
+    gains = np.where(levels > 0, target / np.maximum(levels, 1e-12), 1.0)
+    limit_gain = 10.0 ** (MAX_GAIN_DB / 20.0)
+    return np.clip(gains, 1.0 / limit_gain, limit_gain).astype(np.float32)
+
+
+def crossfade_concat(segments: list[np.ndarray], crossfade_frames: int) -> np.ndarray:
+    """Join segments end to end with equal-power crossfades."""
+    overlap = min([crossfade_frames] + [len(segment) // 2 for segment in segments])
+    total = sum(len(segment) for segment in segments) - overlap * (len(segments) - 1)
+    output = np.zeros((total, segments[0].shape[1]), dtype=np.float32)
+
+    ramp = np.linspace(0.0, np.pi / 2.0, overlap, dtype=np.float32)[:, None]
+    fade_in, fade_out = np.sin(ramp), np.cos(ramp)
+
+    position = 0
+    for index, segment in enumerate(segments):
+        segment = segment.copy()
+        if overlap and index > 0:
+            segment[:overlap] *= fade_in
+        if overlap and index < len(segments) - 1:
+            segment[-overlap:] *= fade_out
+        output[position:position + len(segment)] += segment
+        position += len(segment) - overlap
+    return output
+
+
+def stitch_outputs(output_dirs: list[Path], target_dir: Path, name: str) -> bool:
+    """
+    Stitch the WAVs of consecutive segment runs into one set of outputs.
+
+    Every output kind (full, vocal, bgm) present in all segments is joined.
+    Loudness is matched on the full mix, or on the stems' sum, and headroom
+    is taken from the stitched result the same way. Every kind gets the
+    same gains so stems still sum to the mix; limit() only catches what
+    MAX_HEADROOM_DB could not.
+    """
+    decoded: list[dict[str, np.ndarray]] = []
+    for output_dir in output_dirs:
+        files = {stem_kind(path): path for path in sorted(output_dir.rglob("*.wav"))}
+        try:
+            decoded.append({kind: decode_audio(path) for kind, path in files.items()})
+        except RuntimeError:
+            return False
+
+    kinds = set.intersection(*(set(outputs) for outputs in decoded))
+    if not kinds:
+        return False
+
+    def reference(outputs: dict[str, np.ndarray]) -> np.ndarray:
+        if "full" in outputs:
+            return outputs["full"]
+        return sum_stems([outputs[kind] for kind in ("vocal", "bgm") if kind in outputs])
+
+    gains = loudness_gains([reference(outputs) for outputs in decoded])
+    crossfade_frames = int(CROSSFADE_SECONDS * SAMPLE_RATE)
+    suffixes = {"full": "", "vocal": "_vocal", "bgm": "_bgm"}
+
+    stitched = {
+        kind: crossfade_concat([outputs[kind] * gain for outputs, gain in zip(decoded, gains)], crossfade_frames)
+        for kind in kinds
+    }
+    headroom = headroom_gain(reference(stitched))
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for kind, samples in stitched.items():
+        if not encode_wav(limit(samples * headroom), target_dir / f"{name}{suffixes[kind]}.wav"):
+            return False
+    return True
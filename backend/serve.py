@@ -0,0 +1,42 @@
+from importlib.util import find_spec
+import argparse
+import os
+
+import uvicorn
+
+from executor import fcntl
+
+# Library and job event streams stay open indefinitely; stop waiting for them after this long
+GRACEFUL_SHUTDOWN_SECONDS = 10
+
+
+def main() -> None:
+    """Production entry point: several worker processes, no reload watcher."""
+    parser = argparse.ArgumentParser(description="Run the SongGeneration Studio API for production")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4), help="Server processes")
+    args = parser.parse_args()
+
+    if args.workers > 1 and fcntl is None:
+        raise SystemExit("Several workers need file locking (not available on this platform); use --workers 1")
+
+    # Inherited by every worker so each knows it shares job state with the others
+    os.environ["SONGGEN_WEB_WORKERS"] = str(args.workers)
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        # The C event loop and HTTP parser when installed (uvicorn[standard]), else the pure-Python ones
+        loop="uvloop" if find_spec("uvloop") else "asyncio",
+        http="httptools" if find_spec("httptools") else "h11",
+        reload=False,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        access_log=False
+    )
+
+
+if __name__ == "__main__":
+    main()
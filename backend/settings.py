@@ -1,12 +1,28 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+import json
 import subprocess
 
 from database import get_db
 from schemas import Settings, SettingsUpdate, GPUInfo
+from scheduler import scheduler, GPU_SLOTS
+from executor import WEB_WORKERS
 
 router = APIRouter()
 
 
+def apply_execution_mode(mode: str) -> None:
+    """Local mode dispatches onto this host's GPU slots; in remote mode workers pull jobs instead."""
+    scheduler.slots = 0 if mode == "remote" else GPU_SLOTS
+
+
+async def apply_scheduler_settings() -> None:
+    """Load scheduler settings into this process (they may have been changed by another one)."""
+    settings = await get_settings()
+    scheduler.set_owner_weights(settings.owner_weights)
+    scheduler.policy = settings.scheduling_policy
+    apply_execution_mode(settings.execution_mode)
+
+
 @router.get("/settings", response_model=Settings)
 async def get_settings():
     """Get current application settings."""
@@ -20,13 +36,24 @@ async def get_settings():
             low_mem=settings_dict.get("low_mem", "false").lower() == "true",
             flash_attn=settings_dict.get("flash_attn", "true").lower() == "true",
             output_dir=settings_dict.get("output_dir", "./data/outputs"),
-            current_model=settings_dict.get("current_model") or None
+            current_model=settings_dict.get("current_model") or None,
+            owner_weights=json.loads(settings_dict.get("owner_weights") or "{}"),
+            always_separate=settings_dict.get("always_separate", "false").lower() == "true",
+            execution_mode=settings_dict.get("execution_mode") or "local",
+            scheduling_policy=settings_dict.get("scheduling_policy") or "fair"
         )
 
 
 @router.put("/settings", response_model=Settings)
 async def update_settings(update: SettingsUpdate):
     """Update application settings."""
+    if update.execution_mode == "remote" and WEB_WORKERS > 1:
+        # Worker leases are tracked in memory by whichever process a worker happens to reach
+        raise HTTPException(
+            status_code=400,
+            detail="Remote execution needs a single server process; run main.py or serve.py --workers 1"
+        )
+
     async with get_db() as db:
         if update.low_mem is not None:
             await db.execute(
@@ -43,6 +70,29 @@ async def update_settings(update: SettingsUpdate):
                 "UPDATE settings SET value = ? WHERE key = ?",
                 (update.output_dir, "output_dir")
             )
+        if update.owner_weights is not None:
+            await db.execute(
+                "UPDATE settings SET value = ? WHERE key = ?",
+                (json.dumps(update.owner_weights), "owner_weights")
+            )
+            scheduler.set_owner_weights(update.owner_weights)
+        if update.always_separate is not None:
+            await db.execute(
+                "UPDATE settings SET value = ? WHERE key = ?",
+                (str(update.always_separate).lower(), "always_separate")
+            )
+        if update.execution_mode is not None:
+            await db.execute(
+                "UPDATE settings SET value = ? WHERE key = ?",
+                (update.execution_mode, "execution_mode")
+            )
+            apply_execution_mode(update.execution_mode)
+        if update.scheduling_policy is not None:
+            await db.execute(
+                "UPDATE settings SET value = ? WHERE key = ?",
+                (update.scheduling_policy, "scheduling_policy")
+            )
+            scheduler.policy = update.scheduling_policy
         await db.commit()
 
     return await get_settings()
@@ -0,0 +1,50 @@
+"""
+Pieces used by both the API server and the GPU worker (worker.py).
+
+The worker runs on other machines without the server's database,
+scheduler or routers, so this module depends on the standard library only.
+"""
+import asyncio
+import os
+import signal
+
+# Seconds to wait after SIGTERM before escalating to SIGKILL
+TERMINATE_GRACE_SECONDS = 10.0
+
+# Model repository mapping
+MODEL_REPOS = {
+    "SongGeneration-base": "lglg666/SongGeneration-base",
+    "SongGeneration-base-new": "lglg666/SongGeneration-base-new",
+    "SongGeneration-base-full": "lglg666/SongGeneration-base-full",
+    "SongGeneration-large": "lglg666/SongGeneration-large",
+}
+
+
+async def terminate_process_tree(process, grace: float = TERMINATE_GRACE_SECONDS) -> None:
+    """
+    Terminate a process and all of its children.
+
+    The process (an asyncio subprocess, or anything with the same pid,
+    returncode, send_signal and wait) must have been started with
+    start_new_session=True so that generate.sh and the Python interpreter
+    it spawns share a process group. SIGTERM is sent first; SIGKILL follows
+    if the group is still alive after the grace period.
+    """
+    if process.returncode is not None:
+        return
+
+    def send(sig: int) -> None:
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(process.pid, sig)
+            else:
+                process.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+    send(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), timeout=grace)
+    except asyncio.TimeoutError:
+        send(getattr(signal, "SIGKILL", signal.SIGTERM))
+        await process.wait()
@@ -0,0 +1,286 @@
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from audio import SAMPLE_RATE, db_to_gain, decode_audio, encode_wav, headroom_gain, limit, mixdown, sum_stems
+from preflight import REFERENCE_PROMPT_SECONDS, SECTION_PATTERN
+from segments import (
+    MAX_GAIN_DB, SECTION_SEPARATOR, crossfade_concat, rms, section_weight, split_sections, stem_kind
+)
+
+# Beats are tracked on a mono copy at a reduced rate, from the spectral flux of short frames
+ANALYSIS_DECIMATION = 2
+ONSET_FRAME = 1024
+ONSET_HOP = 256
+
+# Spectra are computed this many frames at a time, to bound memory on long songs
+ONSET_BLOCK = 4096
+
+# Onsets are measured against the average over this window, so loud passages don't dominate
+ONSET_BASELINE_SECONDS = 0.5
+
+# Tempo search range. The style controls set one BPM per song, so tempo is assumed constant
+MIN_BPM = 60.0
+MAX_BPM = 180.0
+PREFERRED_BPM = 120.0
+
+# A beat is placed on the grid that best fits this many beats of onsets either side of it
+BEAT_WINDOW_BEATS = 8
+
+# Each splice point crossfades over one beat, but no longer than this
+MAX_CROSSFADE_SECONDS = 0.5
+
+# Leading and trailing audio quieter than this, relative to the peak, is trimmed from a new section
+TRIM_THRESHOLD_DB = -40.0
+
+SUFFIXES = {"full": "", "vocal": "_vocal", "bgm": "_bgm"}
+
+
+def analysis_mono(samples: np.ndarray) -> np.ndarray:
+    mono = samples.mean(axis=1)
+    usable = len(mono) - len(mono) % ANALYSIS_DECIMATION
+    return mono[:usable].reshape(-1, ANALYSIS_DECIMATION).mean(axis=1)
+
+
+def frames_per_second() -> float:
+    """Rate of the onset envelope."""
+    return SAMPLE_RATE / ANALYSIS_DECIMATION / ONSET_HOP
+
+
+def to_sample(frame: float) -> int:
+    """Sample index at the centre of an onset envelope frame."""
+    return int(round((frame * ONSET_HOP + ONSET_FRAME / 2) * ANALYSIS_DECIMATION))
+
+
+def to_frame(sample: int) -> int:
+    return max(0, int(round((sample / ANALYSIS_DECIMATION - ONSET_FRAME / 2) / ONSET_HOP)))
+
+
+def onset_envelope(samples: np.ndarray) -> np.ndarray:
+    """Positive spectral flux per hop: how much new energy each frame brings in."""
+    mono = analysis_mono(samples)
+    if len(mono) < ONSET_FRAME:
+        mono = np.pad(mono, (0, ONSET_FRAME - len(mono)))
+    frames = np.lib.stride_tricks.sliding_window_view(mono, ONSET_FRAME)[::ONSET_HOP]
+    window = np.hanning(ONSET_FRAME).astype(np.float32)
+
+    flux = np.zeros(len(frames), dtype=np.float32)
+    previous = None
+    for start in range(0, len(frames), ONSET_BLOCK):
+        block = np.log1p(np.abs(np.fft.rfft(frames[start:start + ONSET_BLOCK] * window, axis=1)))
+        joined = block if previous is None else np.vstack([previous, block])
+        rises = np.maximum(np.diff(joined, axis=0), 0.0).sum(axis=1)
+        flux[start + len(block) - len(rises):start + len(block)] = rises
+        previous = block[-1:]
+
+    width = max(1, int(ONSET_BASELINE_SECONDS * frames_per_second()))
+    baseline = np.convolve(flux, np.ones(width, dtype=np.float32) / width, mode="same")
+    return np.maximum(flux - baseline, 0.0)
+
+
+def beat_period(envelope: np.ndarray) -> float:
+    """Beat length in envelope frames, from the envelope's autocorrelation."""
+    rate = frames_per_second()
+    lags = np.arange(int(rate * 60.0 / MAX_BPM), int(rate * 60.0 / MIN_BPM) + 1)
+    lags = lags[lags < len(envelope) - 1]
+    if not len(lags):
+        return rate * 60.0 / PREFERRED_BPM
+
+    centered = envelope - envelope.mean()
+    spectrum = np.fft.rfft(centered, 2 * len(centered))
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:len(centered)]
+
+    # Favour tempos near PREFERRED_BPM, so a half- or double-time reading loses to the real one
+    bpm = 60.0 * rate / lags
+    prior = np.exp(-0.5 * np.log2(bpm / PREFERRED_BPM) ** 2)
+    best = int(np.argmax(autocorr[lags] * prior))
+
+    # Parabolic interpolation for a fractional period
+    lag = float(lags[best])
+    if 0 < best < len(lags) - 1:
+        left, middle, right = autocorr[lags[best - 1]], autocorr[lags[best]], autocorr[lags[best + 1]]
+        curvature = left - 2 * middle + right
+        if curvature < 0:
+            lag += 0.5 * (left - right) / curvature
+    return lag
+
+
+def nearest_beat(envelope: np.ndarray, period: float, frame: int) -> float:
+    """The beat nearest `frame`, on the grid that best fits the onsets around it."""
+    span = int(BEAT_WINDOW_BEATS * period)
+    low, high = max(0, frame - span), min(len(envelope), frame + span + 1)
+    window = envelope[low:high]
+    if not len(window):
+        return float(frame)
+
+    # Score every phase by the onset strength under its beats, all phases at once
+    phases = np.arange(int(np.ceil(period)))
+    positions = np.rint(phases[:, None] + np.arange(0.0, len(window), period)[None, :]).astype(int)
+    scores = np.where(positions < len(window), window[np.minimum(positions, len(window) - 1)], 0.0).sum(axis=1)
+    phase = float(phases[np.argmax(scores)])
+
+    beat = np.round((frame - low - phase) / period)
+    return low + phase + beat * period
+
+
+def reference_mix(outputs: dict[str, np.ndarray]) -> np.ndarray:
+    """The full mix, or the stems' mixdown, for analysis and loudness matching."""
+    if "full" in outputs:
+        return outputs["full"]
+    return mixdown([outputs[kind] for kind in ("vocal", "bgm") if kind in outputs])
+
+
+def decode_outputs(paths: dict[str, Path]) -> dict[str, np.ndarray]:
+    return {kind: decode_audio(path) for kind, path in paths.items()}
+
+
+def section_span(lyrics: str, index: int, frames: int) -> tuple[int, int]:
+    """Estimated sample range of a lyric section, sharing the song out by section length."""
+    weights = np.array([section_weight(section) for section in split_sections(lyrics)], dtype=np.float64)
+    bounds = np.concatenate([[0.0], np.cumsum(weights)]) / weights.sum() * frames
+    return int(bounds[index]), int(bounds[index + 1])
+
+
+def plan_splice(originals: dict[str, Path], lyrics: str, index: int, reference_path: Path) -> dict:
+    """
+    Find where a section sits in a song and cut a reference clip from it.
+
+    The section's span is estimated from the lengths of the lyric sections
+    and both ends are moved to the nearest beat; the first section starts
+    at 0 and the last one runs to the end. The clip (the start of the
+    section, up to the model's prompt length) conditions the new take on
+    the song's own sound. Returns the span and beat length in samples.
+    Raises RuntimeError if the song's audio can't be decoded.
+    """
+    mix = reference_mix(decode_outputs(originals))
+    envelope = onset_envelope(mix)
+    period = beat_period(envelope)
+    section_count = len(split_sections(lyrics))
+
+    start, end = section_span(lyrics, index, len(mix))
+    if index > 0:
+        start = to_sample(nearest_beat(envelope, period, to_frame(start)))
+    if index < section_count - 1:
+        end = to_sample(nearest_beat(envelope, period, to_frame(end)))
+    beat_frames = int(round(period * ONSET_HOP * ANALYSIS_DECIMATION))
+    start = min(max(0, start), len(mix))
+    end = min(max(end, start + beat_frames), len(mix))
+
+    clip_end = min(end, start + int(REFERENCE_PROMPT_SECONDS * SAMPLE_RATE))
+    if not encode_wav(mix[start:clip_end], reference_path):
+        raise RuntimeError("Could not write the reference clip")
+    return {"start_frame": start, "end_frame": end, "beat_frames": beat_frames}
+
+
+def trim_to_beats(section: np.ndarray, keep_start: bool, keep_end: bool, overrun: int = 0) -> tuple[int, int]:
+    """
+    Sample range of a new section to splice in: from its first beat to its last.
+
+    Near-silent lead-in and tail are skipped first. An end that is also the
+    end of the song is kept as generated; any other end leaves `overrun`
+    samples of the section after it, for the crossfade.
+    """
+    if not len(section):
+        return 0, 0
+    level = np.abs(section).max(axis=1)
+    audible = np.flatnonzero(level >= level.max() * db_to_gain(TRIM_THRESHOLD_DB))
+    if not len(audible) or level.max() == 0:
+        return 0, len(section)
+    first, last = int(audible[0]), int(audible[-1]) + 1
+
+    # Beats are placed at onset frame centres, so one can land up to half a frame from its onset
+    slack = ONSET_FRAME * ANALYSIS_DECIMATION // 2
+    envelope = onset_envelope(section)
+    period = beat_period(envelope)
+    if not keep_start:
+        beat = nearest_beat(envelope, period, to_frame(first))
+        if to_sample(beat) < first - slack:
+            beat += period
+        first = min(max(to_sample(beat), 0), last)
+    if keep_end:
+        last = len(section)
+    else:
+        last = min(last, len(section) - overrun)
+        beat = nearest_beat(envelope, period, to_frame(last))
+        if to_sample(beat) > last:
+            beat -= period
+        last = max(to_sample(beat), first)
+    return first, last
+
+
+def splice_section(
+    originals: dict[str, Path],
+    generated_dir: Path,
+    target_dir: Path,
+    name: str,
+    start: int,
+    end: int,
+    beat_frames: int
+) -> bool:
+    """
+    Replace samples [start, end) of each of a song's outputs with a newly generated section.
+
+    Every output kind present in both is spliced. The new section is
+    trimmed to its own beats and matched in loudness to the part it
+    replaces (one gain for every kind, so stems still sum to the mix).
+    Each splice point is a one-beat equal-power crossfade that starts on
+    the beat on both sides.
+    """
+    try:
+        original = decode_outputs(originals)
+        section = decode_outputs({stem_kind(path): path for path in sorted(generated_dir.rglob("*.wav"))})
+    except RuntimeError:
+        return False
+
+    if "full" in original and "full" not in section and section:
+        # Generated as stems (always_separate) for a song kept only as a mix
+        section["full"] = reference_mix(section)
+    kinds = set(original) & set(section)
+    if not kinds:
+        return False
+
+    old_mix, new_mix = reference_mix(original), reference_mix(section)
+    at_start, at_end = start == 0, end >= len(old_mix)
+    crossfade_frames = min(beat_frames, int(MAX_CROSSFADE_SECONDS * SAMPLE_RATE))
+    first, last = trim_to_beats(new_mix, at_start, at_end, crossfade_frames)
+
+    level = rms(new_mix[first:last])
+    gain = rms(old_mix[start:end]) / level if level > 0 else 1.0
+    limit_gain = db_to_gain(MAX_GAIN_DB)
+    gain = float(np.clip(gain, 1.0 / limit_gain, limit_gain)) if gain > 0 else 1.0
+
+    spliced: dict[str, np.ndarray] = {}
+    for kind in kinds:
+        # Each piece overruns by one crossfade, so every fade begins on the beat
+        pieces = [section[kind][first:last + crossfade_frames] * gain]
+        if not at_start:
+            pieces.insert(0, original[kind][:start + crossfade_frames])
+        if not at_end:
+            pieces.append(original[kind][end:])
+        spliced[kind] = crossfade_concat(pieces, crossfade_frames)
+
+    # One headroom gain for every kind, so the stems still sum to the mix
+    reference = spliced["full"] if "full" in spliced else sum_stems(list(spliced.values()))
+    headroom = headroom_gain(reference)
+
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for kind, samples in spliced.items():
+        if not encode_wav(limit(samples * headroom), target_dir / f"{name}{SUFFIXES[kind]}.wav"):
+            return False
+    return True
+
+
+def song_outputs(row) -> dict[str, str]:
+    """Storage locations of a song's outputs by kind."""
+    columns = {"full": "output_path", "vocal": "output_vocal_path", "bgm": "output_bgm_path"}
+    return {kind: row[column] for kind, column in columns.items() if row[column]}
+
+
+def replace_section(lyrics: str, index: int, text: Optional[str]) -> tuple[str, str]:
+    """The section to generate and the song's full lyrics, with the section's words replaced if given."""
+    sections = split_sections(lyrics)
+    if text is not None and text.strip():
+        match = SECTION_PATTERN.match(sections[index])
+        sections[index] = f"[{match.group(1)}] {text.strip()}" if match else text.strip()
+    return sections[index], SECTION_SEPARATOR.join(sections)
@@ -1,6 +1,7 @@
 import json
 import asyncio
-from typing import AsyncGenerator
+import time
+from typing import AsyncGenerator, Callable
 
 
 async def sse_generator(
@@ -26,7 +27,7 @@ async def sse_generator(
                 yield f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
 
                 # Check for terminal events
-                if event_type in ("done", "error"):
+                if event_type in ("done", "error", "cancelled"):
                     break
 
             except asyncio.TimeoutError:
@@ -40,3 +41,29 @@ async def sse_generator(
 def format_sse_event(event_type: str, data: dict) -> str:
     """Format a single SSE event."""
     return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+async def with_ticks(
+    events: AsyncGenerator[str, None],
+    interval: float,
+    tick: Callable[[], str]
+) -> AsyncGenerator[str, None]:
+    """Relay events from a generator, adding tick() every `interval` seconds even while it is idle."""
+    next_event = asyncio.ensure_future(events.__anext__())
+    last_tick = time.monotonic()
+    try:
+        while True:
+            timeout = max(0.0, last_tick + interval - time.monotonic())
+            done, _ = await asyncio.wait({next_event}, timeout=timeout)
+            if done:
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield event
+                next_event = asyncio.ensure_future(events.__anext__())
+            if time.monotonic() - last_tick >= interval:
+                last_tick = time.monotonic()
+                yield tick()
+    finally:
+        next_event.cancel()
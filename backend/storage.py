@@ -0,0 +1,215 @@
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from pathlib import Path
+from typing import Optional
+import hashlib
+import os
+import shutil
+import time
+import uuid
+
+# Paths
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+OUTPUTS_DIR = DATA_DIR / "outputs"
+FETCH_CACHE_DIR = DATA_DIR / "storage_cache"
+
+# Backend selection: "local" (default) or "s3"
+STORAGE_BACKEND = os.environ.get("SONGGEN_STORAGE", "local")
+
+# S3-compatible settings; credentials come from the usual AWS environment/config
+S3_BUCKET = os.environ.get("SONGGEN_S3_BUCKET", "songgen")
+S3_PREFIX = os.environ.get("SONGGEN_S3_PREFIX", "outputs/")
+S3_ENDPOINT_URL = os.environ.get("SONGGEN_S3_ENDPOINT_URL")  # e.g. a local MinIO
+S3_REGION = os.environ.get("SONGGEN_S3_REGION")
+PRESIGN_SECONDS = int(os.environ.get("SONGGEN_S3_PRESIGN_SECONDS", "300"))
+
+# Local copies of fetched objects are evicted, least recently used first, beyond this size
+FETCH_CACHE_MB = int(os.environ.get("SONGGEN_FETCH_CACHE_MB", "2048"))
+
+# Copies used more recently than this are never evicted, so a caller still reading one keeps it
+FETCH_CACHE_MIN_AGE_SECONDS = 600
+
+# How long an object's existence check is reused before the bucket is asked again
+EXISTS_CACHE_SECONDS = 30.0
+
+
+class LocalStorage:
+    """Keeps outputs on the API host's disk; locations are absolute paths."""
+
+    keeps_local_files = True
+
+    def __init__(self, root: Path = OUTPUTS_DIR):
+        self.root = root
+
+    def put(self, path: Path, key: str) -> str:
+        """Store a file under a key and return its location."""
+        target = self.root / key
+        if path.resolve() != target.resolve():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(path), target)
+        return str(target)
+
+    def delete(self, location: str) -> None:
+        Path(location).unlink(missing_ok=True)
+
+    def exists(self, location: str) -> bool:
+        return Path(location).exists()
+
+    def fetch(self, location: str) -> Path:
+        """Get a local file with the contents of a location."""
+        return Path(location)
+
+    def response(self, location: str, media_type: str, filename: str, attachment: bool = False) -> Response:
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'} if attachment else None
+        return FileResponse(location, media_type=media_type, filename=filename, headers=headers)
+
+
+class S3Storage:
+    """
+    Keeps outputs in an S3-compatible bucket; locations are s3://bucket/key URLs.
+
+    Audio requests are answered with short-lived presigned redirects so the
+    bytes go straight from the bucket to the client.
+    """
+
+    keeps_local_files = False
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        prefix: str = S3_PREFIX,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION
+    ):
+        try:
+            import boto3
+            from botocore.exceptions import BotoCoreError, ClientError
+        except ImportError:
+            raise RuntimeError("SONGGEN_STORAGE=s3 requires boto3: pip install boto3")
+        self._client_errors = (BotoCoreError, ClientError)
+        self._client_error = ClientError
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._exists: dict[str, tuple[float, bool]] = {}
+
+    def _object(self, location: str) -> tuple[str, str]:
+        """Bucket and key of an s3:// location (the bucket it was stored in, not necessarily self.bucket)."""
+        bucket, _, key = location[len("s3://"):].partition("/")
+        return bucket, key
+
+    def put(self, path: Path, key: str) -> str:
+        object_key = self.prefix + key
+        self.client.upload_file(str(path), self.bucket, object_key)
+        path.unlink(missing_ok=True)
+        return f"s3://{self.bucket}/{object_key}"
+
+    def delete(self, location: str) -> None:
+        if location.startswith("s3://"):
+            bucket, key = self._object(location)
+            self.client.delete_object(Bucket=bucket, Key=key)
+            self._exists.pop(location, None)
+            self._cache_path(location).unlink(missing_ok=True)
+        else:
+            # Rows written before the switch to S3 still point at local files
+            Path(location).unlink(missing_ok=True)
+
+    def exists(self, location: str) -> bool:
+        """Whether a location holds an object; checked with HEAD and reused for EXISTS_CACHE_SECONDS."""
+        if not location.startswith("s3://"):
+            return Path(location).exists()
+        cached = self._exists.get(location)
+        if cached is not None and time.monotonic() - cached[0] < EXISTS_CACHE_SECONDS:
+            return cached[1]
+
+        bucket, key = self._object(location)
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+            found = True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                raise
+            found = False
+        now = time.monotonic()
+        if len(self._exists) > 1000:
+            self._exists = {k: v for k, v in self._exists.items() if now - v[0] < EXISTS_CACHE_SECONDS}
+        self._exists[location] = (now, found)
+        return found
+
+    def _cache_path(self, location: str) -> Path:
+        digest = hashlib.sha256(location.encode()).hexdigest()[:16]
+        return FETCH_CACHE_DIR / f"{digest}{Path(location).suffix}"
+
+    def fetch(self, location: str) -> Path:
+        """Download an object for local processing, reusing earlier downloads. Raises OSError on failure."""
+        if not location.startswith("s3://"):
+            return Path(location)
+        path = self._cache_path(location)
+        try:
+            # The modification time doubles as the last use, for eviction
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        FETCH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Unique per download, so concurrent fetches of one object don't share a temp file
+        partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+        try:
+            self.client.download_file(*self._object(location), str(partial))
+            partial.replace(path)
+        except self._client_errors as e:
+            raise OSError(f"Could not download {location}: {e}") from e
+        finally:
+            partial.unlink(missing_ok=True)
+        evict_fetch_cache()
+        return path
+
+    def response(self, location: str, media_type: str, filename: str, attachment: bool = False) -> Response:
+        if not location.startswith("s3://"):
+            return LocalStorage().response(location, media_type, filename, attachment)
+        disposition = "attachment" if attachment else "inline"
+        bucket, key = self._object(location)
+        url = self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": bucket,
+                "Key": key,
+                "ResponseContentType": media_type,
+                "ResponseContentDisposition": f'{disposition}; filename="{filename}"',
+            },
+            ExpiresIn=PRESIGN_SECONDS
+        )
+        return RedirectResponse(url, status_code=307)
+
+
+def evict_fetch_cache(limit_bytes: int = FETCH_CACHE_MB * 1024 * 1024) -> None:
+    """Delete least recently used copies until the fetch cache fits in `limit_bytes`."""
+    entries = []
+    for path in FETCH_CACHE_DIR.glob("*"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # Evicted or renamed by a concurrent fetch
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    cutoff = time.time() - FETCH_CACHE_MIN_AGE_SECONDS
+    for used, size, path in sorted(entries, key=lambda entry: entry[0]):
+        if total <= limit_bytes or used > cutoff:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def create_storage():
+    """Build the storage backend selected by SONGGEN_STORAGE."""
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    if STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown SONGGEN_STORAGE backend: {STORAGE_BACKEND}")
+    return LocalStorage()
+
+
+storage = create_storage()
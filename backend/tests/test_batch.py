@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from batch import format_duration, load_checkpoint
+
+
+def record(key: str, status: str) -> str:
+    return json.dumps({"key": key, "status": status}) + "\n"
+
+
+def test_latest_outcome_wins(tmp_path):
+    path = tmp_path / "prompts.checkpoint.jsonl"
+    path.write_text(record("1", "error") + record("2", "done") + "\n" + record("1", "done"))
+    assert {key: outcome["status"] for key, outcome in load_checkpoint(path).items()} == {"1": "done", "2": "done"}
+
+
+def test_missing_checkpoint(tmp_path):
+    assert load_checkpoint(tmp_path / "none.jsonl") == {}
+
+
+def test_cut_short_last_line_is_dropped(tmp_path):
+    path = tmp_path / "prompts.checkpoint.jsonl"
+    path.write_text(record("1", "done") + record("2", "done")[:12])
+    assert list(load_checkpoint(path)) == ["1"]
+    assert path.read_text() == record("1", "done")
+
+
+def test_last_line_without_newline_is_completed(tmp_path):
+    path = tmp_path / "prompts.checkpoint.jsonl"
+    path.write_text(record("1", "done").rstrip("\n"))
+    assert list(load_checkpoint(path)) == ["1"]
+    assert path.read_text() == record("1", "done")
+
+
+def test_corruption_before_the_end_is_an_error(tmp_path):
+    path = tmp_path / "prompts.checkpoint.jsonl"
+    path.write_text("{\"key\"\n" + record("1", "done"))
+    with pytest.raises(SystemExit):
+        load_checkpoint(path)
+
+
+def test_format_duration():
+    assert format_duration(42) == "42s"
+    assert format_duration(125) == "2m05s"
+    assert format_duration(3 * 3600 + 60) == "3h01m"
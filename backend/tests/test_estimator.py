@@ -0,0 +1,68 @@
+import itertools
+
+from estimator import DEFAULT_SECONDS, HISTORY_LIMIT, MIN_SAMPLES, MIN_SECONDS, RuntimeEstimator, job_profile
+
+
+def runtime(model: str, lyrics_length: int, has_reference: bool, takes: int) -> float:
+    """A made-up hardware: large is slower, lyrics and extra takes add time."""
+    seconds = 120.0 + 60.0 * lyrics_length / 1000.0 + 15.0 * has_reference + 90.0 * (takes - 1)
+    return seconds + (150.0 if model == "large" else 0.0)
+
+
+def trained(runs: int = 200) -> RuntimeEstimator:
+    estimator = RuntimeEstimator()
+    combos = itertools.cycle(itertools.product(["base", "large"], [200, 1200, 2500], [False, True], [1, 2, 3]))
+    for _, (model, length, reference, takes) in zip(range(runs), combos):
+        profile = job_profile(model, "full", [], "x" * length, reference, takes)
+        estimator.add(profile, runtime(model, length, reference, takes))
+    return estimator
+
+
+def test_default_without_history():
+    assert RuntimeEstimator().predict(job_profile("base", "full", [], "", False)) == DEFAULT_SECONDS
+
+
+def test_median_until_enough_samples():
+    estimator = RuntimeEstimator()
+    profile = job_profile("base", "full", [], "la", False)
+    runs = [100.0, 300.0, 200.0]
+    assert len(runs) < MIN_SAMPLES
+    for seconds in runs:
+        estimator.add(profile, seconds)
+    assert estimator.predict(profile) == 200.0
+
+
+def test_fit_recovers_the_runtime():
+    estimator = trained()
+    for model, length, reference, takes in [("base", 800, False, 1), ("large", 2000, True, 2)]:
+        expected = runtime(model, length, reference, takes)
+        predicted = estimator.predict(job_profile(model, "full", [], "x" * length, reference, takes))
+        assert abs(predicted - expected) / expected < 0.05
+
+
+def test_fit_orders_by_feature():
+    estimator = trained()
+    base = estimator.predict(job_profile("base", "full", [], "x" * 1000, False))
+    assert estimator.predict(job_profile("large", "full", [], "x" * 1000, False)) > base
+    assert estimator.predict(job_profile("base", "full", [], "x" * 3000, False)) > base
+    assert estimator.predict(job_profile("base", "full", [], "x" * 1000, False, takes=3)) > base
+
+
+def test_unseen_categories_fall_back_to_the_intercept():
+    estimator = trained()
+    seen = estimator.predict(job_profile("base", "full", [], "x" * 1000, False))
+    unseen = estimator.predict(job_profile("new-model", "separate", ["low_mem"], "x" * 1000, False))
+    assert unseen > MIN_SECONDS
+    assert abs(unseen - seen) < 200.0
+
+
+def test_prediction_floor():
+    estimator = RuntimeEstimator()
+    for _ in range(MIN_SAMPLES):
+        estimator.add(job_profile("base", "full", [], "", False), 1.0)
+    assert estimator.predict(job_profile("base", "full", [], "", False)) == MIN_SECONDS
+
+
+def test_history_is_bounded():
+    estimator = trained(HISTORY_LIMIT + 50)
+    assert len(estimator._history) == HISTORY_LIMIT
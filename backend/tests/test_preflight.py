@@ -0,0 +1,68 @@
+from preflight import check_description, check_lyrics
+
+
+def codes(issues) -> list[str]:
+    return [issue.code for issue in issues]
+
+
+def test_valid_lyrics():
+    lyrics = "[intro-short] ; [verse] walking home tonight ; [chorus] la la la ; [outro-medium]"
+    assert check_lyrics(lyrics) == []
+
+
+def test_empty_lyrics():
+    assert codes(check_lyrics("")) == ["empty"]
+    assert codes(check_lyrics(" ; ; ")) == ["empty"]
+
+
+def test_stray_separator():
+    assert codes(check_lyrics("[verse] one ; ; [chorus] two")) == ["empty_section"]
+
+
+def test_section_without_tag():
+    assert codes(check_lyrics("just some words")) == ["malformed_section"]
+
+
+def test_sections_not_separated():
+    issues = check_lyrics("[verse] one [chorus] two")
+    assert codes(issues) == ["malformed_section"]
+    assert "stray bracket" in issues[0].message
+
+
+def test_vocal_section_needs_lyrics():
+    assert codes(check_lyrics("[verse] ; [chorus] two")) == ["missing_lyrics"]
+
+
+def test_instrumental_section_has_no_lyrics():
+    assert codes(check_lyrics("[inst-short] humming ; [verse] one")) == ["unexpected_lyrics"]
+
+
+def test_unknown_tag():
+    issues = check_lyrics("[hook] one ; [VERSE] two")
+    assert codes(issues) == ["unknown_section"]
+    assert "Section 1" in issues[0].message
+
+
+def test_valid_description():
+    description = "female, warm, pop, happy, piano and drums, the bpm is 120."
+    assert check_description(description) == []
+
+
+def test_empty_description():
+    assert codes(check_description(" , ")) == ["empty"]
+
+
+def test_bpm_range():
+    assert codes(check_description("pop, the bpm is 20")) == ["invalid_bpm"]
+    assert codes(check_description("pop, the bpm is 300")) == ["invalid_bpm"]
+    assert check_description("pop, the bpm is 240") == []
+
+
+def test_unknown_tags():
+    issues = check_description("pop, kazoo, piano and theremin")
+    assert codes(issues) == ["unknown_tag", "unknown_tag"]
+    assert "'kazoo'" in issues[0].message and "'theremin'" in issues[1].message
+
+
+def test_multi_word_tags_are_not_split():
+    assert check_description("chinese style, acoustic guitar, hip hop") == []
@@ -0,0 +1,139 @@
+import time
+
+from scheduler import AGING_SECONDS, FairShareScheduler
+
+
+def queued_ids(scheduler: FairShareScheduler) -> list[str]:
+    return [ticket.job_id for ticket in scheduler.snapshot()[1]]
+
+
+def test_submit_dispatches_while_slots_are_free():
+    scheduler = FairShareScheduler(slots=2)
+    first = scheduler.submit("a", "alice", "interactive")
+    second = scheduler.submit("b", "alice", "interactive")
+    third = scheduler.submit("c", "alice", "interactive")
+
+    assert first.dispatched.is_set() and second.dispatched.is_set()
+    assert not third.dispatched.is_set()
+    assert scheduler.position(third) == 0
+
+    scheduler.release(first)
+    assert third.dispatched.is_set()
+
+
+def test_priority_class_goes_first():
+    scheduler = FairShareScheduler(slots=0)
+    scheduler.submit("background", "alice", "background")
+    scheduler.submit("batch", "alice", "batch")
+    scheduler.submit("interactive", "alice", "interactive")
+
+    assert queued_ids(scheduler) == ["interactive", "batch", "background"]
+
+
+def test_aging_promotes_waiting_jobs():
+    scheduler = FairShareScheduler(slots=0)
+    background = scheduler.submit("background", "alice", "background")
+    scheduler.submit("interactive", "bob", "interactive")
+
+    # Two aging periods lift background to interactive; submission order then decides
+    background.enqueued_at = time.monotonic() - 2 * AGING_SECONDS
+    assert background.effective_rank(time.monotonic()) == 0
+    assert queued_ids(scheduler) == ["background", "interactive"]
+
+
+def test_aging_stops_at_the_top_class():
+    scheduler = FairShareScheduler(slots=0)
+    ticket = scheduler.submit("a", "alice", "batch")
+    ticket.enqueued_at = time.monotonic() - 10 * AGING_SECONDS
+    assert ticket.effective_rank(time.monotonic()) == 0
+
+
+def test_least_used_owner_goes_first():
+    scheduler = FairShareScheduler(slots=0)
+    scheduler.submit("alice-1", "alice", "interactive")
+    scheduler.submit("alice-2", "alice", "interactive")
+    scheduler.submit("bob-1", "bob", "interactive")
+    scheduler._usage.update({"alice": 100.0, "bob": 10.0})
+
+    assert queued_ids(scheduler) == ["bob-1", "alice-1", "alice-2"]
+
+
+def test_weights_scale_charged_usage():
+    scheduler = FairShareScheduler(slots=1)
+    scheduler.set_owner_weights({"alice": 4.0, "bob": 1.0, "ignored": 0.0})
+    assert "ignored" not in scheduler.owner_weights
+
+    for owner in ("alice", "bob"):
+        ticket = scheduler.submit(owner, owner, "interactive")
+        ticket.started_at = time.monotonic() - 40.0
+        scheduler.release(ticket)
+
+    # Same GPU time, but alice's share is four times bob's
+    assert scheduler._usage["alice"] < scheduler._usage["bob"]
+    assert abs(scheduler._usage["alice"] * 4 - scheduler._usage["bob"]) < 1.0
+
+    scheduler.slots = 0
+    scheduler.submit("bob-2", "bob", "interactive")
+    scheduler.submit("alice-2", "alice", "interactive")
+    assert queued_ids(scheduler) == ["alice-2", "bob-2"]
+
+
+def test_newcomer_starts_level_with_active_owners():
+    scheduler = FairShareScheduler(slots=0)
+    scheduler.submit("alice-1", "alice", "interactive")
+    scheduler._usage["alice"] = 500.0
+    scheduler.submit("bob-1", "bob", "interactive")
+
+    assert scheduler._usage["bob"] == 500.0
+    assert queued_ids(scheduler) == ["alice-1", "bob-1"]
+
+
+def test_take_next_skips_jobs_that_cannot_run():
+    scheduler = FairShareScheduler(slots=0)
+    scheduler.submit("first", "alice", "interactive")
+    scheduler.submit("second", "alice", "interactive")
+
+    # e.g. a worker that only has the second job's model installed
+    ticket = scheduler.take_next(lambda t: t.job_id == "second")
+    assert ticket.job_id == "second"
+    assert ticket.dispatched.is_set()
+    assert queued_ids(scheduler) == ["first"]
+    assert [t.job_id for t in scheduler.snapshot()[0]] == ["second"]
+
+    assert scheduler.take_next(lambda t: False) is None
+    assert queued_ids(scheduler) == ["first"]
+
+
+def test_take_next_follows_dispatch_order():
+    scheduler = FairShareScheduler(slots=0)
+    scheduler.submit("batch", "alice", "batch")
+    scheduler.submit("interactive", "bob", "interactive")
+
+    assert scheduler.take_next(lambda t: True).job_id == "interactive"
+    assert scheduler.take_next(lambda t: True).job_id == "batch"
+    assert scheduler.take_next(lambda t: True) is None
+
+
+def test_shortest_first_policy():
+    scheduler = FairShareScheduler(slots=0)
+    scheduler.policy = "shortest_first"
+    scheduler.submit("long", "alice", "interactive", estimated_seconds=600.0)
+    scheduler.submit("short", "alice", "interactive", estimated_seconds=60.0)
+    scheduler.submit("later-batch", "alice", "batch", estimated_seconds=1.0)
+
+    assert queued_ids(scheduler) == ["short", "long", "later-batch"]
+
+
+def test_withdraw_and_estimated_wait():
+    scheduler = FairShareScheduler(slots=1)
+    running = scheduler.submit("running", "alice", "interactive", estimated_seconds=100.0)
+    first = scheduler.submit("first", "alice", "interactive", estimated_seconds=50.0)
+    second = scheduler.submit("second", "alice", "interactive", estimated_seconds=50.0)
+
+    assert scheduler.estimated_wait(running) == 0.0
+    assert 99.0 < scheduler.estimated_wait(first) <= 100.0
+    assert 149.0 < scheduler.estimated_wait(second) <= 150.0
+
+    scheduler.withdraw(first)
+    assert queued_ids(scheduler) == ["second"]
+    assert 99.0 < scheduler.estimated_wait(second) <= 100.0
@@ -0,0 +1,83 @@
+import numpy as np
+
+from segments import (
+    MAX_GAIN_DB, SECTION_SEPARATOR, crossfade_concat, loudness_gains, plan_segments, split_sections
+)
+
+LYRICS = SECTION_SEPARATOR.join([
+    "[intro-short]",
+    "[verse] " + "a" * 120,
+    "[chorus] " + "b" * 60,
+    "[verse] " + "c" * 120,
+    "[chorus] " + "d" * 60,
+    "[outro-short]",
+])
+
+
+def test_single_section_is_one_segment():
+    assert plan_segments("[verse] only one", 4) == ["[verse] only one"]
+
+
+def test_one_segment_keeps_the_lyrics_as_given():
+    assert plan_segments(LYRICS, 1) == [LYRICS]
+
+
+def test_more_groups_than_sections():
+    lyrics = "[verse] one ; [chorus] two"
+    assert plan_segments(lyrics, 4) == ["[verse] one", "[chorus] two"]
+
+
+def test_segments_keep_every_section_in_order():
+    for count in range(2, 7):
+        segments = plan_segments(LYRICS, count)
+        assert len(segments) == count
+        rejoined = [section for segment in segments for section in split_sections(segment)]
+        assert rejoined == split_sections(LYRICS)
+
+
+def test_segments_are_balanced():
+    segments = plan_segments(LYRICS, 2)
+    assert split_sections(segments[0])[-1].startswith("[chorus] b")
+
+
+def test_crossfade_length():
+    segments = [np.ones((n, 2), dtype=np.float32) for n in (1000, 800, 1200)]
+    output = crossfade_concat(segments, 100)
+    assert output.shape == (1000 + 800 + 1200 - 2 * 100, 2)
+
+
+def test_crossfade_shrinks_for_short_segments():
+    segments = [np.ones((n, 2), dtype=np.float32) for n in (1000, 60)]
+    assert len(crossfade_concat(segments, 100)) == 1000 + 60 - 30
+
+
+def test_crossfade_is_equal_power():
+    segments = [np.ones((1000, 2), dtype=np.float32), np.ones((1000, 2), dtype=np.float32)]
+    output = crossfade_concat(segments, 200)
+    assert np.allclose(output[:800], 1.0)
+    assert np.allclose(output[1000:], 1.0)
+    # sin + cos peaks at sqrt(2) halfway through the fade
+    assert np.isclose(output[800:1000].max(), np.sqrt(2.0), atol=1e-2)
+
+
+def test_single_segment_is_unchanged():
+    segment = np.random.default_rng(0).standard_normal((500, 2)).astype(np.float32)
+    assert np.array_equal(crossfade_concat([segment], 100), segment)
+
+
+def test_loudness_gains_match_the_median():
+    references = [np.full((100, 2), level, dtype=np.float32) for level in (0.15, 0.2, 0.3)]
+    gains = loudness_gains(references)
+    assert np.allclose([0.15 * gains[0], 0.2 * gains[1], 0.3 * gains[2]], 0.2)
+
+
+def test_loudness_gains_are_bounded():
+    limit = 10.0 ** (MAX_GAIN_DB / 20.0)
+    references = [np.full((100, 2), level, dtype=np.float32) for level in (0.001, 0.2, 0.2, 10.0)]
+    gains = loudness_gains(references)
+    assert np.isclose(gains[0], limit) and np.isclose(gains[3], 1.0 / limit)
+
+
+def test_silent_segments_are_left_alone():
+    references = [np.zeros((100, 2), dtype=np.float32), np.full((100, 2), 0.3, dtype=np.float32)]
+    assert np.allclose(loudness_gains(references), [1.0, 1.0])
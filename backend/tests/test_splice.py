@@ -0,0 +1,114 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import splice
+from audio import SAMPLE_RATE
+from splice import (
+    MAX_CROSSFADE_SECONDS, beat_period, frames_per_second, onset_envelope, section_span, splice_section, trim_to_beats
+)
+
+
+def click_track(seconds: float, bpm: float, offset: float = 0.0, seed: int = 0) -> np.ndarray:
+    """Short decaying noise bursts on every beat, from `offset` seconds in."""
+    rng = np.random.default_rng(seed)
+    samples = np.zeros((int(seconds * SAMPLE_RATE), 2), dtype=np.float32)
+    burst = rng.standard_normal((480, 2)).astype(np.float32) * np.exp(-np.arange(480) / 80.0)[:, None]
+    beat = 60.0 / bpm
+    for time in np.arange(offset, seconds, beat):
+        start = int(time * SAMPLE_RATE)
+        part = samples[start:start + len(burst)]
+        part += 0.3 * burst[:len(part)]
+    return samples
+
+
+def test_section_span_shares_out_the_song():
+    lyrics = "[verse] " + "a" * 100 + " ; [chorus] " + "b" * 50 + " ; [verse] " + "c" * 50
+    spans = [section_span(lyrics, index, 2000) for index in range(3)]
+    assert spans == [(0, 1000), (1000, 1500), (1500, 2000)]
+
+
+def test_section_span_weighs_instrumentals():
+    lyrics = "[intro-medium] ; [verse] " + "a" * 120
+    assert section_span(lyrics, 0, 1000) == (0, 500)
+
+
+@pytest.mark.parametrize("bpm", [90.0, 120.0, 140.0])
+def test_beat_period_of_a_click_track(bpm):
+    expected = frames_per_second() * 60.0 / bpm
+    assert abs(beat_period(onset_envelope(click_track(12.0, bpm))) - expected) / expected < 0.02
+
+
+def test_beat_period_of_silence_is_finite():
+    assert np.isfinite(beat_period(onset_envelope(np.zeros((SAMPLE_RATE, 2), dtype=np.float32))))
+
+
+def test_trim_to_beats_skips_the_lead_in():
+    section = click_track(8.0, 120.0, offset=0.8)
+    first, last = trim_to_beats(section, keep_start=False, keep_end=True)
+    assert abs(first - 0.8 * SAMPLE_RATE) < 0.02 * SAMPLE_RATE
+    assert last == len(section)
+
+
+def test_trim_to_beats_ends_on_a_beat():
+    section = click_track(8.0, 120.0, offset=0.25)
+    first, last = trim_to_beats(section, keep_start=True, keep_end=False)
+    assert first == int(0.25 * SAMPLE_RATE)
+    beat = SAMPLE_RATE * 0.5
+    assert min((last - first) % beat, beat - (last - first) % beat) < 0.02 * SAMPLE_RATE
+
+
+def test_trim_to_beats_leaves_room_for_the_crossfade():
+    section = click_track(6.0, 120.0, offset=0.5)
+    overrun = SAMPLE_RATE // 2
+    _, last = trim_to_beats(section, keep_start=True, keep_end=False, overrun=overrun)
+    assert last + overrun <= len(section)
+    assert last > len(section) - 2 * overrun - 0.02 * SAMPLE_RATE
+
+
+def test_trim_to_beats_of_silence_keeps_everything():
+    silence = np.zeros((SAMPLE_RATE, 2), dtype=np.float32)
+    assert trim_to_beats(silence, keep_start=False, keep_end=False) == (0, SAMPLE_RATE)
+    assert trim_to_beats(silence[:0], keep_start=False, keep_end=False) == (0, 0)
+
+
+def outputs(seconds: float, offset: float = 0.0) -> dict[str, np.ndarray]:
+    vocal = 0.5 * click_track(seconds, 120.0, offset, seed=1)
+    bgm = 0.5 * click_track(seconds, 120.0, offset + 0.25, seed=2)
+    return {"full": vocal + bgm, "vocal": vocal, "bgm": bgm}
+
+
+@pytest.mark.parametrize("start_seconds,end_seconds", [(0.0, 4.0), (6.0, 10.0), (16.0, 20.0)])
+def test_splice_section_piece_lengths(monkeypatch, tmp_path, start_seconds, end_seconds):
+    original, section = outputs(20.0), outputs(6.0, offset=0.5)
+    generated_dir = tmp_path / "generated"
+    generated_dir.mkdir()
+    for suffix in ("", "_vocal", "_bgm"):
+        (generated_dir / f"take{suffix}.wav").touch()
+
+    monkeypatch.setattr(splice, "decode_outputs", lambda paths: original if "original" in paths else section)
+    written: dict[str, np.ndarray] = {}
+
+    def encode_wav(samples: np.ndarray, path: Path) -> bool:
+        written[path.name] = samples
+        return True
+    monkeypatch.setattr(splice, "encode_wav", encode_wav)
+
+    start, end = int(start_seconds * SAMPLE_RATE), int(end_seconds * SAMPLE_RATE)
+    beat_frames = SAMPLE_RATE // 2
+    assert splice_section({"original": Path("o.wav")}, generated_dir, tmp_path / "out", "song",
+                          start, end, beat_frames)
+
+    at_start, at_end = start == 0, end >= len(original["full"])
+    crossfade = min(beat_frames, int(MAX_CROSSFADE_SECONDS * SAMPLE_RATE))
+    first, last = trim_to_beats(section["full"], at_start, at_end, crossfade)
+    # Every piece overruns by one crossfade, and every join takes one back
+    expected = start + (last - first) + (len(original["full"]) - end)
+    assert last - first > crossfade
+    assert set(written) == {"song.wav", "song_vocal.wav", "song_bgm.wav"}
+    for samples in written.values():
+        assert len(samples) == expected
+
+    # One gain for every kind, so the stems still sum to the mix
+    assert np.allclose(written["song_vocal.wav"] + written["song_bgm.wav"], written["song.wav"], atol=1e-5)
@@ -0,0 +1,267 @@
+from pathlib import Path
+from typing import Optional
+import argparse
+import asyncio
+import json
+import shutil
+import socket
+import time
+
+import httpx
+
+from shared import MODEL_REPOS, terminate_process_tree
+
+# Paths (same layout as the API node by default)
+BASE_DIR = Path(__file__).parent.parent
+SONGGEN_DIR = BASE_DIR / "SongGeneration"
+MODELS_DIR = BASE_DIR / "models"
+WORK_DIR = BASE_DIR / "data" / "worker"
+
+# Progress lines are batched and posted at most this often
+EVENT_FLUSH_SECONDS = 1.0
+RETRY_SECONDS = 5.0
+
+
+class LeaseLost(Exception):
+    """The API node no longer considers this worker the owner of a job."""
+
+
+class GPUWorker:
+    """Leases generation jobs from an API node and runs them on the local GPU."""
+
+    def __init__(
+        self,
+        server: str,
+        name: str,
+        slots: int,
+        token: Optional[str],
+        songgen_dir: Path,
+        models_dir: Path,
+        work_dir: Path
+    ):
+        self.name = name
+        self.slots = slots
+        self.songgen_dir = songgen_dir
+        self.models_dir = models_dir
+        self.work_dir = work_dir
+        self.client = httpx.AsyncClient(
+            base_url=server.rstrip("/") + "/api",
+            headers={"X-Worker-Token": token} if token else {},
+            timeout=httpx.Timeout(60.0)
+        )
+        self.worker_id: Optional[str] = None
+        self.heartbeat_seconds = 10.0
+        self.running: dict[str, asyncio.subprocess.Process] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+
+    def installed_models(self) -> list[str]:
+        if not self.models_dir.exists():
+            return []
+        return [d.name for d in self.models_dir.iterdir() if d.is_dir() and d.name in MODEL_REPOS]
+
+    async def register(self) -> None:
+        response = await self.client.post("/workers/register", json={
+            "name": self.name,
+            "slots": self.slots,
+            "models": self.installed_models()
+        })
+        response.raise_for_status()
+        info = response.json()
+        self.worker_id = info["worker_id"]
+        self.heartbeat_seconds = info["heartbeat_seconds"]
+        print(f"[{self.name}] registered as {self.worker_id}")
+
+    async def abort(self, job_id: str) -> None:
+        """Kill a job the API node has taken back."""
+        process = self.running.get(job_id)
+        if process is not None:
+            print(f"[{self.name}] aborting {job_id}")
+            await terminate_process_tree(process)
+        task = self.tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                response = await self.client.post(f"/workers/{self.worker_id}/heartbeat")
+                if response.status_code == 404:
+                    # The API node forgot us (restart or missed heartbeats); our leases are gone
+                    for job_id in list(self.tasks):
+                        await self.abort(job_id)
+                    await self.register()
+                    continue
+                response.raise_for_status()
+                for job_id in response.json().get("abort", []):
+                    await self.abort(job_id)
+            except httpx.HTTPError as e:
+                print(f"[{self.name}] heartbeat failed: {e}")
+
+    async def lease_loop(self) -> None:
+        free_slots = asyncio.Semaphore(self.slots)
+        while True:
+            await free_slots.acquire()
+            try:
+                response = await self.client.post(
+                    f"/workers/{self.worker_id}/lease",
+                    timeout=httpx.Timeout(60.0)
+                )
+                if response.status_code == 404:
+                    await self.register()
+                    free_slots.release()
+                    continue
+                if response.status_code == 204:
+                    free_slots.release()
+                    continue
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                print(f"[{self.name}] lease failed: {e}")
+                free_slots.release()
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+
+            spec = response.json()
+            task = asyncio.create_task(self.run_job(spec))
+            self.tasks[spec["job_id"]] = task
+            task.add_done_callback(lambda _, job_id=spec["job_id"]: (
+                self.tasks.pop(job_id, None), free_slots.release()
+            ))
+
+    async def post_events(self, job_id: str, events: list[dict]) -> None:
+        if not events:
+            return
+        response = await self.client.post(
+            f"/workers/{self.worker_id}/jobs/{job_id}/events",
+            json={"events": events}
+        )
+        if response.status_code in (404, 409):
+            raise LeaseLost(job_id)
+        response.raise_for_status()
+
+    async def run_job(self, spec: dict) -> None:
+        job_id = spec["job_id"]
+        job_dir = self.work_dir / job_id
+        job_dir.mkdir(parents=True, exist_ok=True)
+        print(f"[{self.name}] running {job_id} ({spec['model']})")
+
+        try:
+            # Several records (takes) share one generate.sh run; older API nodes send just "input"
+            inputs = [dict(input_data) for input_data in spec.get("inputs") or [spec["input"]]]
+            if spec.get("has_reference"):
+                response = await self.client.get(f"/workers/{self.worker_id}/jobs/{job_id}/reference")
+                response.raise_for_status()
+                reference_path = job_dir / (spec.get("reference_name") or "reference.wav")
+                reference_path.write_bytes(response.content)
+                for input_data in inputs:
+                    input_data["prompt_audio_path"] = str(reference_path)
+
+            jsonl_path = job_dir / "input.jsonl"
+            jsonl_path.write_text("".join(json.dumps(input_data) + "\n" for input_data in inputs))
+
+            output_dir = job_dir / "output"
+            cmd = [
+                "bash", str(self.songgen_dir / "generate.sh"),
+                str(self.models_dir / spec["model"]),
+                str(jsonl_path),
+                str(output_dir),
+                *spec["flags"]
+            ]
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=str(self.songgen_dir),
+                start_new_session=True
+            )
+            self.running[job_id] = process
+
+            pending = []
+            last_flush = time.monotonic()
+            try:
+                while True:
+                    line = await process.stdout.readline()
+                    if not line:
+                        break
+                    line_text = line.decode().strip()
+                    if line_text:
+                        pending.append({"event": "progress", "data": {"message": line_text}})
+                    if time.monotonic() - last_flush >= EVENT_FLUSH_SECONDS:
+                        await self.post_events(job_id, pending)
+                        pending, last_flush = [], time.monotonic()
+
+                await process.wait()
+                await self.post_events(job_id, pending)
+            except LeaseLost:
+                await terminate_process_tree(process)
+                print(f"[{self.name}] lost lease on {job_id}")
+                return
+
+            # Upload the stems; the API node converts and files them in the library
+            wav_files = list(output_dir.rglob("*.wav")) if output_dir.exists() else []
+            handles = [open(wav, "rb") for wav in wav_files]
+            try:
+                response = await self.client.post(
+                    f"/workers/{self.worker_id}/jobs/{job_id}/result",
+                    data={"returncode": str(process.returncode)},
+                    files=[("files", (wav.name, handle, "audio/wav")) for wav, handle in zip(wav_files, handles)],
+                    timeout=httpx.Timeout(None)
+                )
+            finally:
+                for handle in handles:
+                    handle.close()
+            if response.status_code == 409:
+                print(f"[{self.name}] lost lease on {job_id} before upload")
+            else:
+                response.raise_for_status()
+                print(f"[{self.name}] finished {job_id} (exit {process.returncode})")
+
+        except httpx.HTTPError as e:
+            # Leave the lease to expire; the API node will re-queue the job
+            print(f"[{self.name}] {job_id} failed to report: {e}")
+        finally:
+            process = self.running.pop(job_id, None)
+            if process is not None and process.returncode is None:
+                await terminate_process_tree(process)
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.register()
+                break
+            except httpx.HTTPError as e:
+                print(f"[{self.name}] cannot reach API node: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+
+        try:
+            await asyncio.gather(self.heartbeat_loop(), self.lease_loop())
+        finally:
+            for process in list(self.running.values()):
+                await terminate_process_tree(process)
+            await self.client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SongGeneration GPU worker")
+    parser.add_argument("--server", default="http://localhost:8000", help="API node base URL")
+    parser.add_argument("--name", default=socket.gethostname(), help="Name shown in job progress")
+    parser.add_argument("--slots", type=int, default=1, help="Jobs to run concurrently")
+    parser.add_argument("--token", default=None, help="Shared worker token (SONGGEN_WORKER_TOKEN)")
+    parser.add_argument("--songgen-dir", type=Path, default=SONGGEN_DIR)
+    parser.add_argument("--models-dir", type=Path, default=MODELS_DIR)
+    parser.add_argument("--work-dir", type=Path, default=WORK_DIR)
+    args = parser.parse_args()
+
+    worker = GPUWorker(
+        args.server, args.name, args.slots, args.token,
+        args.songgen_dir, args.models_dir, args.work_dir / args.name
+    )
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
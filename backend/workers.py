@@ -0,0 +1,293 @@
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Response
+from fastapi.responses import FileResponse
+from pathlib import Path
+from typing import AsyncGenerator, Optional
+import asyncio
+import os
+import time
+import uuid
+
+from schemas import WorkerRegistration, WorkerInfo, WorkerEvents
+from scheduler import scheduler
+from sse import format_sse_event
+import jobs
+
+router = APIRouter()
+
+# Workers heartbeat this often; a worker or lease silent for LEASE_TTL_SECONDS is presumed dead
+HEARTBEAT_SECONDS = 10.0
+LEASE_TTL_SECONDS = 60.0
+REAP_INTERVAL_SECONDS = 5.0
+
+# How long a lease request waits for work before returning 204
+LEASE_WAIT_SECONDS = 20.0
+
+# Optional shared secret workers must present in X-Worker-Token
+WORKER_TOKEN = os.environ.get("SONGGEN_WORKER_TOKEN")
+
+
+class Worker:
+    """A registered remote GPU worker."""
+
+    def __init__(self, worker_id: str, name: str, slots: int, models: list[str]):
+        self.worker_id = worker_id
+        self.name = name
+        self.slots = slots
+        self.models = models
+        self.last_seen = time.monotonic()
+        self.leases: set[str] = set()
+
+
+class RemoteJob:
+    """A job executed by a worker, as seen from the API node."""
+
+    def __init__(self, job: jobs.Job, spec: dict, reference_path: Optional[Path]):
+        self.job = job
+        self.spec = spec
+        self.reference_path = reference_path
+        self.worker_id: Optional[str] = None
+        self.lease_expires = 0.0
+        self.attempts = 0
+        self.events: asyncio.Queue = asyncio.Queue()
+
+
+_workers: dict[str, Worker] = {}
+_remote_jobs: dict[str, RemoteJob] = {}
+_work_available = asyncio.Event()
+
+
+def check_token(token: Optional[str]) -> None:
+    """Reject worker calls without the shared token, when one is configured."""
+    if WORKER_TOKEN and token != WORKER_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid worker token")
+
+
+def get_worker(worker_id: str) -> Worker:
+    worker = _workers.get(worker_id)
+    if worker is None:
+        # Unknown after a server restart or reaping; the worker re-registers on 404
+        raise HTTPException(status_code=404, detail="Unknown worker")
+    worker.last_seen = time.monotonic()
+    return worker
+
+
+def get_lease(worker: Worker, job_id: str) -> RemoteJob:
+    remote = _remote_jobs.get(job_id)
+    if remote is None or remote.worker_id != worker.worker_id:
+        raise HTTPException(status_code=409, detail="Lease lost")
+    remote.lease_expires = time.monotonic() + LEASE_TTL_SECONDS
+    return remote
+
+
+def has_workers() -> bool:
+    """Whether any worker is currently registered."""
+    return bool(_workers)
+
+
+def total_slots() -> int:
+    """Jobs the registered workers can run at once."""
+    return sum(worker.slots for worker in _workers.values())
+
+
+def submit(job: jobs.Job, spec: dict, reference_path: Optional[Path]) -> None:
+    """Queue a job for remote execution."""
+    remote = RemoteJob(job, spec, reference_path)
+    _remote_jobs[job.job_id] = remote
+    job.cancel_hooks.append(lambda: revoke(job.job_id))
+    jobs.enqueue(job)
+    _work_available.set()
+
+
+def revoke(job_id: str) -> None:
+    """Drop a job; its worker is told to kill it on the next heartbeat or event post."""
+    _remote_jobs.pop(job_id, None)
+
+
+def requeue(remote: RemoteJob, reason: str) -> None:
+    """Put a job whose lease expired back in the queue."""
+    # If the old worker is still alive, its next heartbeat tells it to abort
+    remote.worker_id = None
+
+    # Charge the lost attempt and queue again at the same priority
+    jobs.release_gpu_slot(remote.job)
+    jobs.enqueue(remote.job)
+    remote.events.put_nowait(("status", {
+        "job_id": remote.job.job_id,
+        "status": "queued",
+        "message": f"{reason}; re-queued"
+    }))
+    _work_available.set()
+
+
+async def relay(job: jobs.Job, extra: Optional[dict] = None) -> AsyncGenerator[str, None]:
+    """
+    Relay a remote job's progress as SSE events until its outputs arrive.
+
+    Sets job.returncode from the worker's result. Returns early, leaving
+    returncode unset, if the job is cancelled. `extra` is merged into
+    every event.
+    """
+    remote = _remote_jobs[job.job_id]
+    cancelled = asyncio.ensure_future(job.cancelled.wait())
+    try:
+        while True:
+            next_event = asyncio.ensure_future(remote.events.get())
+            await asyncio.wait({next_event, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                return
+
+            event_type, data = next_event.result()
+            if event_type == "result":
+                job.returncode = data["returncode"]
+                return
+            yield format_sse_event(event_type, {**data, **(extra or {})})
+    finally:
+        cancelled.cancel()
+        _remote_jobs.pop(job.job_id, None)
+
+
+async def reap_expired_leases() -> None:
+    """Background task: forget silent workers and re-queue jobs whose lease ran out."""
+    while True:
+        await asyncio.sleep(REAP_INTERVAL_SECONDS)
+        now = time.monotonic()
+
+        for worker_id, worker in list(_workers.items()):
+            if now - worker.last_seen > LEASE_TTL_SECONDS:
+                del _workers[worker_id]
+
+        for remote in list(_remote_jobs.values()):
+            if remote.worker_id and remote.lease_expires < now:
+                requeue(remote, "Worker stopped responding")
+
+
+@router.post("/workers/register", response_model=WorkerInfo)
+async def register_worker(
+    registration: WorkerRegistration,
+    x_worker_token: Optional[str] = Header(None)
+):
+    """Register a GPU worker."""
+    check_token(x_worker_token)
+    worker_id = uuid.uuid4().hex[:12]
+    _workers[worker_id] = Worker(worker_id, registration.name, registration.slots, registration.models)
+    return WorkerInfo(
+        worker_id=worker_id,
+        heartbeat_seconds=HEARTBEAT_SECONDS,
+        lease_ttl_seconds=LEASE_TTL_SECONDS
+    )
+
+
+@router.post("/workers/{worker_id}/heartbeat")
+async def worker_heartbeat(worker_id: str, x_worker_token: Optional[str] = Header(None)):
+    """Keep a worker and all of its leases alive. Returns jobs the worker must abort."""
+    check_token(x_worker_token)
+    worker = get_worker(worker_id)
+
+    abort = []
+    for job_id in list(worker.leases):
+        remote = _remote_jobs.get(job_id)
+        if remote is None or remote.worker_id != worker_id:
+            worker.leases.discard(job_id)
+            abort.append(job_id)
+        else:
+            remote.lease_expires = time.monotonic() + LEASE_TTL_SECONDS
+
+    return {"status": "ok", "abort": abort}
+
+
+@router.post("/workers/{worker_id}/lease")
+async def lease_job(worker_id: str, x_worker_token: Optional[str] = Header(None)):
+    """Long-poll for the next job this worker can run."""
+    check_token(x_worker_token)
+    worker = get_worker(worker_id)
+    deadline = time.monotonic() + LEASE_WAIT_SECONDS
+
+    def runnable(ticket) -> bool:
+        remote = _remote_jobs.get(ticket.job_id)
+        return remote is not None and (not worker.models or remote.spec["model"] in worker.models)
+
+    while True:
+        ticket = scheduler.take_next(runnable)
+        if ticket is not None:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return Response(status_code=204)
+        _work_available.clear()
+        try:
+            await asyncio.wait_for(_work_available.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            return Response(status_code=204)
+
+    remote = _remote_jobs[ticket.job_id]
+    remote.worker_id = worker_id
+    remote.attempts += 1
+    remote.lease_expires = time.monotonic() + LEASE_TTL_SECONDS
+    worker.leases.add(ticket.job_id)
+
+    remote.events.put_nowait(("status", {
+        "job_id": ticket.job_id,
+        "status": "generating",
+        "message": f"Running on worker {worker.name}"
+    }))
+
+    return {
+        **remote.spec,
+        "job_id": ticket.job_id,
+        "has_reference": remote.reference_path is not None,
+        "reference_name": remote.reference_path.name if remote.reference_path else None,
+        "lease_ttl_seconds": LEASE_TTL_SECONDS,
+    }
+
+
+@router.get("/workers/{worker_id}/jobs/{job_id}/reference")
+async def get_job_reference(worker_id: str, job_id: str, x_worker_token: Optional[str] = Header(None)):
+    """Download the reference audio of a leased job."""
+    check_token(x_worker_token)
+    remote = get_lease(get_worker(worker_id), job_id)
+    if remote.reference_path is None or not remote.reference_path.exists():
+        raise HTTPException(status_code=404, detail="Job has no reference audio")
+    return FileResponse(remote.reference_path)
+
+
+@router.post("/workers/{worker_id}/jobs/{job_id}/events")
+async def post_job_events(
+    worker_id: str,
+    job_id: str,
+    batch: WorkerEvents,
+    x_worker_token: Optional[str] = Header(None)
+):
+    """Relay progress from a worker to the job's SSE stream."""
+    check_token(x_worker_token)
+    remote = get_lease(get_worker(worker_id), job_id)
+    for event in batch.events:
+        remote.events.put_nowait((event.event, {**event.data, "job_id": job_id}))
+    return {"status": "ok"}
+
+
+@router.post("/workers/{worker_id}/jobs/{job_id}/result")
+async def post_job_result(
+    worker_id: str,
+    job_id: str,
+    returncode: int = Form(...),
+    files: list[UploadFile] = File([]),
+    x_worker_token: Optional[str] = Header(None)
+):
+    """Receive the generated stems of a leased job."""
+    check_token(x_worker_token)
+    worker = get_worker(worker_id)
+    remote = get_lease(worker, job_id)
+
+    output_dir = remote.job.temp_dir / "output"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for upload in files:
+        # Never trust a client-supplied path
+        with open(output_dir / Path(upload.filename or "output.wav").name, "wb") as f:
+            while chunk := await upload.read(1024 * 1024):
+                f.write(chunk)
+
+    worker.leases.discard(job_id)
+    remote.worker_id = None
+    remote.events.put_nowait(("result", {"returncode": returncode}))
+    return {"status": "ok"}
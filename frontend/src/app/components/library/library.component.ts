@@ -1,4 +1,4 @@
-import { Component, OnInit, inject } from '@angular/core';
+import { Component, OnDestroy, OnInit, inject } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { FormsModule } from '@angular/forms';
 import { MatTableModule } from '@angular/material/table';
@@ -16,8 +16,24 @@ import { MatDividerModule } from '@angular/material/divider';
 
 import { ApiService } from '../../services/api.service';
 import { AudioService } from '../../services/audio.service';
+import { LibraryChange, SseService } from '../../services/sse.service';
+import { Subscription } from 'rxjs';
 import { Song } from '../../models/song.models';
 
+// Everything the table and row actions read; lyrics stay on the server
+const LIBRARY_FIELDS = [
+  'id',
+  'title',
+  'created_at',
+  'duration_seconds',
+  'stem_type',
+  'model_version',
+  'description',
+  'output_path',
+  'output_vocal_path',
+  'output_bgm_path',
+];
+
 @Component({
   selector: 'app-library',
   standalone: true,
@@ -298,9 +314,10 @@ import { Song } from '../../models/song.models';
     }
   `],
 })
-export class LibraryComponent implements OnInit {
+export class LibraryComponent implements OnInit, OnDestroy {
   api = inject(ApiService);
   audio = inject(AudioService);
+  private sse = inject(SseService);
   private snackBar = inject(MatSnackBar);
 
   songs: Song[] = [];
@@ -311,13 +328,44 @@ export class LibraryComponent implements OnInit {
 
   editingId: string | null = null;
 
+  private changes?: Subscription;
+
   ngOnInit(): void {
-    this.loadSongs();
+    // The feed announces where it starts; loading after that means no change is missed
+    this.changes = this.sse.libraryChanges(LIBRARY_FIELDS).subscribe((event) => {
+      if (event.event === 'change') {
+        this.applyChange(event.change);
+      } else {
+        this.loadSongs();
+      }
+    });
+  }
+
+  ngOnDestroy(): void {
+    this.changes?.unsubscribe();
+  }
+
+  applyChange(change: LibraryChange): void {
+    const index = this.songs.findIndex((s) => s.id === change.song_id);
+    if (change.op === 'delete') {
+      if (index >= 0) {
+        this.songs = this.songs.filter((s) => s.id !== change.song_id);
+        this.total--;
+      }
+    } else if (change.song && index >= 0) {
+      this.songs[index] = change.song;
+    } else if (change.song && change.op === 'insert') {
+      // Newest first, so new songs belong at the top of the first page
+      this.total++;
+      if (this.page === 1) {
+        this.songs = [change.song, ...this.songs].slice(0, this.pageSize);
+      }
+    }
   }
 
   loadSongs(): void {
     this.loading = true;
-    this.api.getSongs(this.page, this.pageSize).subscribe({
+    this.api.getSongs(this.page, this.pageSize, 'created_at', 'desc', LIBRARY_FIELDS).subscribe({
       next: (result) => {
         this.songs = result.songs;
         this.total = result.total;
@@ -373,8 +421,11 @@ export class LibraryComponent implements OnInit {
 
       this.api.deleteSong(song.id).subscribe({
         next: () => {
-          this.songs = this.songs.filter((s) => s.id !== song.id);
-          this.total--;
+          // The change feed may already have removed it
+          if (this.songs.some((s) => s.id === song.id)) {
+            this.songs = this.songs.filter((s) => s.id !== song.id);
+            this.total--;
+          }
           this.snackBar.open('Song deleted', 'OK', { duration: 3000 });
         },
         error: () => {
@@ -281,6 +281,9 @@ import {
             <mat-card-content>
               <mat-progress-bar mode="indeterminate" />
               <p class="status">{{ generationStatus }}</p>
+              @if (etaSeconds !== null) {
+                <p class="status">{{ formatEta(etaSeconds) }}</p>
+              }
             </mat-card-content>
           </mat-card>
         }
@@ -517,6 +520,7 @@ export class SongBuilderComponent {
 
   generating = false;
   generationStatus = '';
+  etaSeconds: number | null = null;
 
   private idCounter = 5;
 
@@ -604,6 +608,17 @@ export class SongBuilderComponent {
     this.referenceFile = null;
   }
 
+  formatEta(seconds: number): string {
+    if (seconds <= 0) {
+      return 'Finishing up...';
+    }
+    const minutes = Math.floor(seconds / 60);
+    const rest = seconds % 60;
+    return minutes
+      ? `About ${minutes}m ${rest.toString().padStart(2, '0')}s remaining`
+      : `About ${rest}s remaining`;
+  }
+
   generate(): void {
     if (this.sections.length === 0) {
       this.snackBar.open('Add at least one section', 'OK', { duration: 3000 });
@@ -612,6 +627,7 @@ export class SongBuilderComponent {
 
     this.generating = true;
     this.generationStatus = 'Starting generation...';
+    this.etaSeconds = null;
 
     this.sse
       .generateSong(
@@ -627,6 +643,9 @@ export class SongBuilderComponent {
           if (event.data.message) {
             this.generationStatus = event.data.message;
           }
+          if (event.data.eta_seconds !== undefined) {
+            this.etaSeconds = event.data.eta_seconds;
+          }
           if (event.event === 'done' && event.data.song_id) {
             this.generating = false;
             this.snackBar.open('Song generated successfully!', 'View', {
@@ -52,13 +52,17 @@ export class ApiService {
     page = 1,
     limit = 20,
     sort = 'created_at',
-    order = 'desc'
+    order = 'desc',
+    fields?: string[]
   ): Observable<SongList> {
-    const params = new HttpParams()
+    let params = new HttpParams()
       .set('page', page.toString())
       .set('limit', limit.toString())
       .set('sort', sort)
       .set('order', order);
+    if (fields) {
+      params = params.set('fields', fields.join(','));
+    }
 
     return this.http.get<SongList>(`${this.baseUrl}/library`, { params });
   }
@@ -84,4 +88,11 @@ export class ApiService {
   getDownloadUrl(id: string, type: 'full' | 'vocal' | 'bgm' = 'full'): string {
     return `${this.baseUrl}/library/${id}/download?type=${type}`;
   }
+
+  // Generation
+  cancelGeneration(jobId: string): Observable<{ status: string; job_id: string }> {
+    return this.http.delete<{ status: string; job_id: string }>(
+      `${this.baseUrl}/generate/${jobId}`
+    );
+  }
 }
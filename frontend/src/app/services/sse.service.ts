@@ -1,6 +1,18 @@
 import { Injectable, NgZone } from '@angular/core';
 import { Observable } from 'rxjs';
-import { SSEEvent } from '../models/song.models';
+import { Song, SSEEvent } from '../models/song.models';
+
+export interface LibraryChange {
+  seq: number;
+  op: 'insert' | 'update' | 'delete';
+  song_id: string;
+  changed_at: string;
+  song: Song | null;
+}
+
+export type LibraryFeedEvent =
+  | { event: 'ready' | 'reset'; lastSeq: number }
+  | { event: 'change'; change: LibraryChange };
 
 @Injectable({
   providedIn: 'root',
@@ -122,7 +134,15 @@ export class SseService {
         method: 'POST',
         body: formData,
       })
-        .then((response) => {
+        .then(async (response) => {
+          if (response.status === 422) {
+            // Preflight rejected the request; surface the validation errors
+            const body = await response.json().catch(() => null);
+            const errors: { message: string }[] = body?.detail?.errors ?? [];
+            throw new Error(
+              errors.map((e) => e.message).join('; ') || 'Invalid generation request'
+            );
+          }
           if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
           }
@@ -161,7 +181,7 @@ export class SseService {
                       observer.next({ event: eventType, data });
                     });
 
-                    if (eventType === 'done' || eventType === 'error') {
+                    if (eventType === 'done' || eventType === 'error' || eventType === 'cancelled') {
                       observer.complete();
                       return;
                     }
@@ -186,4 +206,28 @@ export class SseService {
         });
     });
   }
+
+  /**
+   * Follow library inserts, updates and deletes. The browser reconnects on
+   * its own and resumes after the last change it saw.
+   */
+  libraryChanges(fields?: string[]): Observable<LibraryFeedEvent> {
+    return new Observable((observer) => {
+      const params = fields ? `?fields=${encodeURIComponent(fields.join(','))}` : '';
+      const source = new EventSource(`${this.baseUrl}/library/changes/stream${params}`);
+
+      const onStart = (event: 'ready' | 'reset') => (message: MessageEvent) => {
+        const data = JSON.parse(message.data);
+        this.zone.run(() => observer.next({ event, lastSeq: data.last_seq }));
+      };
+      source.addEventListener('ready', onStart('ready'));
+      source.addEventListener('reset', onStart('reset'));
+      source.addEventListener('change', (message: MessageEvent) => {
+        const change: LibraryChange = JSON.parse(message.data);
+        this.zone.run(() => observer.next({ event: 'change', change }));
+      });
+
+      return () => source.close();
+    });
+  }
 }